@@ -1,106 +1,146 @@
 import os
+import copy
 import json
+import math
+import uuid
+import random
+import asyncio
 from dotenv import load_dotenv
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
-from langchain_chroma import Chroma
-from langchain_google_genai import GoogleGenerativeAIEmbeddings,ChatGoogleGenerativeAI
-from fpdf import FPDF
-from fastapi.responses import FileResponse
+from typing import List, Optional
+from fastapi.responses import FileResponse, StreamingResponse
+from app.embeddings import get_embedding_function
+from app.exam_sessions import get_session_store, grade_answers, question_state
+from app.exam_repository import get_exam_repository
+from app.llm_client import (
+    CircuitOpenError,
+    backoff_delay,
+    bank_client,
+    chat_client,
+    embedding_client,
+    is_retryable
+)
+from app.mcq_parser import QuestionStreamParser, parse_mcq, validate_question
+from app.pdf_render import render_pdf, exam_hash
+from app.question_bank import (
+    BANK_ENABLED,
+    BANK_QUESTIONS_PER_CHUNK,
+    assemble_from_bank,
+    balance_answer_positions,
+    get_question_bank,
+    register_chunk_generator
+)
+from app.similarity import (
+    DEDUP_RETRIES,
+    QuestionSimilarityIndex,
+    find_duplicates
+)
+from app.retrieval import (
+    aretrieve_context,
+    normalize_topic,
+    retrieval_cache,
+    assemble_context,
+    context_stats,
+    search_stats
+)
+from app.courses import CourseScope
+from app.resources import (
+    CHAT_MODEL,
+    CourseNotFound,
+    get_bm25,
+    get_chat_model,
+    get_vector_store
+)
+from app.single_flight import SingleFlight
+from app.metrics import record_llm_usage, span
 
 load_dotenv()
 
 router = APIRouter(prefix="/rag", tags=["RAG Gemini MCQ"])
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-CHROMA_PATH = "./chroma"
-COLLECTION_NAME = "exame_docs"
-
-GEMINI_KEY = os.getenv("GOOGLE_GEMINI_KEY")
-if not GEMINI_KEY:
-    raise ValueError("GOOGLE_GEMINI_KEY não encontrada no arquivo .env")
-
-os.environ["GOOGLE_API_KEY"] = GEMINI_KEY
-
-chat_model = ChatGoogleGenerativeAI(
-    model = "gemini-2.5-flash",
-    temperature = 0.5,
-    api_key=GEMINI_KEY
-)
-
-# Configuração de embeddings e banco vetorial
-embedding_function = GoogleGenerativeAIEmbeddings(
-    model="gemini-embedding-001",
-    api_key=GEMINI_KEY
-)
-
-try:
-    db = Chroma(
-        persist_directory=CHROMA_PATH,
-        embedding_function=embedding_function,
-        collection_name=COLLECTION_NAME
-    )
-except Exception as e:
-    print(f"⚠️ Erro ao carregar banco vetorial: {e}")
-    db = None
-
-dict_questions={}
+# Limite de chamadas simultâneas ao modelo (por processo)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+# Exames grandes são divididos em lotes gerados em paralelo
+MCQ_BATCH_SIZE = int(os.getenv("MCQ_BATCH_SIZE", "10"))
+# Rodadas extras do fan-out, pedindo só as questões dos lotes que falharam/vieram incompletos
+MCQ_BATCH_RETRIES = int(os.getenv("MCQ_BATCH_RETRIES", "2"))
+MCQ_DOCS_PER_BATCH = 4
+# Embaralha questões/alternativas de cada aluno quando a geração é compartilhada
+MCQ_COALESCE_SHUFFLE = os.getenv("MCQ_COALESCE_SHUFFLE", "true").lower() == "true"
+# Novos pedidos só para as questões inválidas/faltantes de uma resposta (ou após erro transitório)
+MCQ_REPAIR_RETRIES = int(os.getenv("MCQ_REPAIR_RETRIES", "2"))
+
+# Gerações de exame em andamento, compartilhadas entre pedidos idênticos
+mcq_flight = SingleFlight()
 
 # Funções auxiliares
-def format_docs(docs):
-    """Formata documentos recuperados do banco vetorial."""
-    return "\n\n".join([
-        f"Fonte: {doc.metadata.get('source', 'Desconhecida')}\nConteúdo: {doc.page_content}"
-        for doc in docs
-    ])
+def build_messages(prompt: str):
+    if not isinstance(prompt, str):
+        prompt = str(prompt)
+
+    return [
+        ("system", "Você é um assistente técnico especializado em gerar questões de múltipla escolha."),
+        ("user", prompt)
+    ]
 
 def get_gemini_response(prompt: str, temperature: float = 0.5):
     """Gera resposta textual com o modelo Gemini via LangChain ChatGoogleGenerativeAI."""
     try:
-        if not isinstance(prompt, str):
-            prompt = str(prompt)
-
-        messages = [
-            ("system", "Você é um assistente técnico especializado em gerar questões de múltipla escolha."),
-            ("user", prompt)
-        ]
-
-        
-        ai_msg = chat_model.invoke(messages, temperature=temperature)
+        with span("llm_generate"):
+            ai_msg = chat_client.call(get_chat_model().invoke, build_messages(prompt), temperature=temperature)
+        record_llm_usage(ai_msg)
 
         # Retorna apenas o conteúdo da resposta
         return ai_msg.content.strip()
 
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao gerar resposta: {str(e)}")
 
-def substituir_caracteres_unicode(texto):
-    """Substitui caracteres Unicode por equivalentes ASCII"""
-    substituicoes = {
-        '≤': '<=', '≥': '>=', '≠': '!=', '≈': '≈',
-        'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u',
-        'à': 'a', 'è': 'e', 'ì': 'i', 'ò': 'o', 'ù': 'u',
-        'â': 'a', 'ê': 'e', 'î': 'i', 'ô': 'o', 'û': 'u',
-        'ã': 'a', 'õ': 'o', 'ç': 'c', 'ü': 'u',
-        'Á': 'A', 'É': 'E', 'Í': 'I', 'Ó': 'O', 'Ú': 'U',
-        'À': 'A', 'È': 'E', 'Ì': 'I', 'Ò': 'O', 'Ù': 'U',
-        'Â': 'A', 'Ê': 'E', 'Î': 'I', 'Ô': 'O', 'Û': 'U',
-        'Ã': 'A', 'Õ': 'O', 'Ç': 'C', 'Ü': 'U'
-    }
-    
-    for char, replacement in substituicoes.items():
-        texto = texto.replace(char, replacement)
-    
-    return texto
+async def aget_gemini_response(prompt: str, temperature: float = 0.5, retries: int = None):
+    """
+    Versão assíncrona de get_gemini_response, limitada por LLM_MAX_CONCURRENCY.
+    `retries=0` desliga as novas tentativas do cliente (quem chama já repete).
+    """
+    messages = build_messages(prompt)
+    try:
+        async with llm_semaphore:
+            with span("llm_generate"):
+                ai_msg = await chat_client.acall(
+                    lambda: get_chat_model().ainvoke(messages, temperature=temperature),
+                    max_retries=retries
+                )
+        record_llm_usage(ai_msg)
+
+        return ai_msg.content.strip()
 
-def obter_letra_enumeração(indice):
-    vogais = ['a', 'b', 'c', 'd']
-    return vogais[indice % len(vogais)]
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e)) from e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao gerar resposta: {str(e)}") from e
 
 # Geração de questões de múltipla escolha (RAG)
-def generate_mcq_from_context(context: str, topic: str, qnt_questoes: int = 2, temperature: float = 0.5):
-    prompt = f"""
+def compact_statements(questions, max_chars: int = 150):
+    """Lista curta dos enunciados, usada no prompt no lugar do JSON completo das questões."""
+    lines = []
+    for question in questions:
+        text = " ".join(question.get("text", "").split())
+        lines.append(f"- {text[:max_chars]}{'…' if len(text) > max_chars else ''}")
+    return "\n".join(lines)
+
+def build_mcq_prompt(context: str, topic: str, qnt_questoes: int, avoid=None):
+    avoid_section = f"""
+🚫 **Enunciados já usados no exame (NÃO repita estes temas/abordagens):**
+{compact_statements(avoid)}
+""" if avoid else ""
+
+    return f"""
 Você é um especialista altamente competente no(s) tema(s): {topic}.
 Sua tarefa é gerar {qnt_questoes} questões de múltipla escolha de alta qualidade.
 
@@ -134,64 +174,262 @@ Responda APENAS com um JSON válido, sem qualquer texto fora do JSON, seguindo e
         "resolution": "Resumo da resolução e raciocínio da questão"
     }}
 }}
-
+{avoid_section}
 📚 **Documentos de apoio:**
 {context}
 """
-    response_text = get_gemini_response(prompt, temperature)
-
-    try:
-        start = response_text.find("{")
-        end = response_text.rfind("}") + 1
-        json_text = response_text[start:end]
-        mcq = json.loads(json_text)
-
-        CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
-        QUESTIONS_PATH = os.path.join(CURRENT_DIR, "questions.json")
-
-        with open(QUESTIONS_PATH, "w", encoding="utf-8") as arquivo:
-            json.dump(mcq, arquivo, ensure_ascii=False, indent=4)
-
-        # Atualiza dict_questions global
-        global dict_questions
-        dict_questions = {}
-        for i, question_key in enumerate(mcq.keys(), 1):
-            if question_key == "sources":
-                continue
 
-            question = mcq[question_key]
-            correct_opt = None
-            for opt in question.get("options", []):
-                if opt.get("is_correct", False):
-                    correct_opt = opt["option"]
+def number_questions(questions):
+    return {f"question {i + 1}": q for i, q in enumerate(questions)}
+
+async def request_mcq(context: str, topic: str, qnt_questoes: int, temperature: float = 0.5, avoid=None,
+                      attempts: int = MCQ_REPAIR_RETRIES + 1):
+    """
+    Pede as questões ao Gemini. É a única camada de novas tentativas da
+    geração: cada tentativa é um único pedido (sem novas tentativas no
+    cliente) e pede de novo só as questões inválidas ou faltantes, mantendo
+    as válidas. Erros transitórios aguardam o backoff antes da próxima.
+    """
+    questions, response_text = [], ""
+    for attempt in range(attempts):
+        missing = qnt_questoes - len(questions)
+        prompt = build_mcq_prompt(context, topic, missing, (avoid or []) + questions)
+        try:
+            response_text = await aget_gemini_response(prompt, temperature, retries=0)
+        except HTTPException as e:
+            # Circuito aberto ou erro permanente (ex.: 400): repetir não adianta
+            if attempt + 1 == attempts or e.__cause__ is None or not is_retryable(e.__cause__):
+                if questions:
                     break
+                raise
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+        valid, rejected = parse_mcq(response_text)
+        if rejected:
+            print(f"⚠️ {len(rejected)} questão(ões) inválida(s): {'; '.join(rejected)}")
+        questions.extend(valid[:missing])
+        if len(questions) >= qnt_questoes:
+            break
 
-            dict_questions[question_key] = {
-                "text": question["text"],
-                "correct_option": correct_opt,
-                "chosen_option": "",
-                "is_correct": False
-            }
-
-        return mcq
-
-    except Exception as e:
+    if not questions:
         raise HTTPException(
             status_code=500,
-            detail=f"Erro ao decodificar JSON do Gemini: {str(e)}\nResposta bruta:\n{response_text}"
+            detail=f"Nenhuma questão válida na resposta do Gemini.\nResposta bruta:\n{response_text}"
+        )
+    return number_questions(questions)
+
+def save_exam(mcq: dict, topic: str = "", sources=None):
+    """Persiste o exame no repositório, abre a sessão de respostas e devolve o exam_id."""
+    questions = {k: v for k, v in mcq.items() if k not in ("sources", "exam_id")}
+    exam_id = uuid.uuid4().hex
+
+    get_exam_repository().create_exam(exam_id, questions, topic=topic, sources=sources)
+    get_session_store().create(questions, exam_id=exam_id)
+    return exam_id
+
+def split_batches(qnt_questoes: int, batch_size: int = MCQ_BATCH_SIZE):
+    """Divide o total de questões em lotes de até `batch_size` (ex.: 23 -> [8, 8, 7])."""
+    n_batches = max(1, math.ceil(qnt_questoes / batch_size))
+    base, extra = divmod(qnt_questoes, n_batches)
+    return [base + (1 if i < extra else 0) for i in range(n_batches)]
+
+async def generate_mcq_fanout(docs, topic: str, qnt_questoes: int, temperature: float = 0.5):
+    """
+    Gera exames grandes em lotes paralelos; cada lote recebe um subconjunto
+    distinto dos chunks recuperados e faz um único pedido ao modelo. As
+    novas tentativas ficam só aqui: a cada rodada (até MCQ_BATCH_RETRIES
+    extras) são pedidas de novo apenas as questões que faltaram nos lotes
+    que falharam ou vieram incompletos, sem descartar os demais.
+    """
+    sizes = split_batches(qnt_questoes)
+    pending = [(size, docs[i::len(sizes)] or docs) for i, size in enumerate(sizes)]
+    questions, errors = [], []
+
+    for round_ in range(MCQ_BATCH_RETRIES + 1):
+        if round_ and errors:
+            await asyncio.sleep(backoff_delay(round_ - 1))
+        results = await asyncio.gather(
+            *(
+                request_mcq(assemble_context(group)[0], topic, size, temperature, attempts=1)
+                for size, group in pending
+            ),
+            return_exceptions=True
         )
 
-def substitute_question(original_mcq: dict, question_number: str, topic: str, temperature: float = 0.5):
+        retry, errors = [], []
+        for (size, group), result in zip(pending, results):
+            if isinstance(result, Exception):
+                errors.append(result)
+                retry.append((size, group))
+                continue
+            batch = [q for q in result.values() if isinstance(q, dict)]
+            questions.extend(batch)
+            if len(batch) < size:
+                retry.append((size - len(batch), group))
+        pending = retry
+        # Circuito aberto: as próximas rodadas também seriam recusadas
+        if not pending or any(getattr(e, "status_code", None) == 503 for e in errors):
+            break
+
+    if not questions:
+        if errors:
+            raise errors[0]
+        raise HTTPException(status_code=500, detail="Nenhuma questão válida foi gerada.")
+    if pending:
+        print(f"⚠️ Exame gerado com {len(questions)} de {qnt_questoes} questões")
+
+    return number_questions(questions)
+
+async def generate_mcq_from_context(docs, context: str, topic: str, qnt_questoes: int = 2, temperature: float = 0.5):
+    """Geração ao vivo: um único pedido ou, para exames grandes, lotes em paralelo."""
+    if len(split_batches(qnt_questoes)) > 1:
+        return await generate_mcq_fanout(docs, topic, qnt_questoes, temperature)
+    return await request_mcq(context, topic, qnt_questoes, temperature)
+
+async def replace_near_duplicates(questions, context: str, topic: str, temperature: float = 0.5):
+    """
+    Detecta questões semanticamente repetidas (embeddings dos enunciados) e
+    gera de novo apenas essas, informando ao modelo os enunciados a evitar.
+    """
+    for attempt in range(DEDUP_RETRIES + 1):
+        try:
+            vectors = await get_embedding_function().aembed_documents([q["text"] for q in questions])
+        except Exception as e:
+            # Deduplicação é opcional: sem embeddings o exame já gerado segue como está
+            print(f"⚠️ Deduplicação ignorada (erro nos embeddings): {e}")
+            break
+        duplicates = find_duplicates(vectors)
+        if not duplicates or attempt == DEDUP_RETRIES:
+            break
+
+        keep = [q for i, q in enumerate(questions) if i not in duplicates]
+        try:
+            regenerated = await request_mcq(context, topic, len(duplicates), temperature, avoid=keep)
+        except HTTPException:
+            break
+        new_questions = [q for q in regenerated.values() if isinstance(q, dict) and "text" in q]
+        for index, question in zip(duplicates, new_questions):
+            questions[index] = question
+
+    return questions
+
+def questions_from_bank(docs, qnt_questoes: int):
+    """Questões pré-geradas para os chunks recuperados (vazio se o banco estiver desativado)."""
+    if not BANK_ENABLED:
+        return []
+    chunk_ids = [doc.id for doc in docs if getattr(doc, "id", None)]
+    if not chunk_ids:
+        return []
+    # Os chunks já vêm ordenados pela busca (relevância + MMR): sem novo embedding do tópico
+    return assemble_from_bank(get_question_bank(), chunk_ids, qnt_questoes)
+
+def generate_bank_questions(text: str, meta: dict):
+    """
+    Questões de um chunk para o banco (preenchido em segundo plano após o
+    /base/create/). Usa o bank_client, com taxa e breaker próprios.
+    """
+    source = meta.get("source", "Desconhecida")
+    context = f"Fonte: {source}\nConteúdo: {text}"
+    topic = f"os conceitos abordados em {os.path.basename(source)}"
+    messages = build_messages(build_mcq_prompt(context, topic, BANK_QUESTIONS_PER_CHUNK))
+    with span("llm_generate"):
+        ai_msg = bank_client.call(get_chat_model().invoke, messages, temperature=0.7)
+    record_llm_usage(ai_msg)
+
+    questions, rejected = parse_mcq(ai_msg.content.strip())
+    if not questions:
+        raise ValueError(f"Nenhuma questão válida na resposta: {'; '.join(rejected) or 'JSON não reconhecido'}")
+    return questions
+
+register_chunk_generator(generate_bank_questions)
+
+async def astream_gemini_response(prompt: str, temperature: float = 0.5):
+    """Stream de tokens do Gemini (chat_model.astream), limitado por LLM_MAX_CONCURRENCY."""
+    messages = build_messages(prompt)
+    async with llm_semaphore:
+        stream = chat_client.astream(lambda: get_chat_model().astream(messages, temperature=temperature))
+        async for chunk in stream:
+            # Os tokens chegam em usage_metadata de cada pedaço do stream
+            record_llm_usage(chunk)
+            if chunk.content:
+                yield chunk.content
+
+def sse_event(event: str, data):
+    """Formata um evento server-sent events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_mcq_events(relevant_docs, context: str, topic: str, qnt_questoes: int, temperature: float = 0.5):
+    """
+    Gera as questões em stream: cada "question N" é enviada como evento
+    assim que o objeto JSON correspondente termina de chegar.
+    """
+    parser = QuestionStreamParser()
+    mcq = {}
+    prompt = build_mcq_prompt(context, topic, qnt_questoes)
+
+    try:
+        async for text in astream_gemini_response(prompt, temperature):
+            for _, question in parser.feed(text):
+                question, error = validate_question(question)
+                if error:
+                    print(f"⚠️ Questão inválida descartada no stream: {error}")
+                    continue
+                question_key = f"question {len(mcq) + 1}"
+                mcq[question_key] = question
+                yield sse_event("question", {"key": question_key, "question": question})
+
+        # Completa só as questões descartadas ou que não chegaram (todas, se nenhuma foi aproveitada)
+        if len(mcq) < qnt_questoes:
+            extra = await request_mcq(
+                context, topic, qnt_questoes - len(mcq), temperature, avoid=list(mcq.values())
+            )
+            for question in extra.values():
+                question_key = f"question {len(mcq) + 1}"
+                mcq[question_key] = question
+                yield sse_event("question", {"key": question_key, "question": question})
+    except HTTPException as e:
+        # Circuito aberto, limite de taxa etc.: o cliente recebe o erro real
+        yield sse_event("error", {"error": e.detail, "status": e.status_code})
+        return
+    except Exception as e:
+        yield sse_event("error", {"error": f"Erro ao gerar resposta: {str(e)}"})
+        return
+
+    if not mcq:
+        yield sse_event("error", {"error": "Nenhuma questão válida foi gerada."})
+        return
+
+    sources = [doc.metadata.get("source", "Desconhecida") for doc in relevant_docs]
+    exam_id = await asyncio.to_thread(save_exam, mcq, topic, sources)
+
+    yield sse_event("done", {
+        "exam_id": exam_id,
+        "total": len(mcq),
+        "sources": sources
+    })
+
+async def substitute_question(original_mcq: dict, question_number: str, topic: str, temperature: float = 0.5,
+                              course: str = None):
     """Substitui a questão escolhida por uma nova questão gerada."""
     
+    try:
+        db = await asyncio.to_thread(get_vector_store, course)
+    except CourseNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
     if not db:
         raise HTTPException(status_code=500, detail="Banco vetorial não inicializado.")
     
-    relevant_docs = db.similarity_search(topic, k=8)
+    # O primeiro get_bm25 de um curso lê o índice do disco
+    bm25_index = await asyncio.to_thread(get_bm25, course)
+    relevant_docs, context = await aretrieve_context(db, topic, k=8, bm25_index=bm25_index)
     if not relevant_docs:
         raise HTTPException(status_code=404, detail="Nenhum documento relevante encontrado.")
-    
-    context = format_docs(relevant_docs)
+
+    original_question = original_mcq.get(question_number, {})
+    other_questions = {
+        k: v for k, v in original_mcq.items()
+        if k != question_number and isinstance(v, dict) and "text" in v
+    }
 
     prompt = f"""
 Você é um especialista altamente competente no tema: {topic}.
@@ -239,76 +477,63 @@ Responda APENAS com um JSON válido, sem qualquer texto fora do JSON, seguindo e
 }}
 
 📋 **QUESTÃO ORIGINAL (que será substituída):**
-{json.dumps(original_mcq.get(question_number, {}), ensure_ascii=False, indent=2)}
+{compact_statements([original_question], max_chars=400)}
 
 📚 **OUTRAS QUESTÕES EXISTENTES (evite repetir temas/abordagens):**
-{json.dumps({k: v for k, v in original_mcq.items() if k != question_number}, ensure_ascii=False, indent=2)}
+{compact_statements(other_questions.values())}
 
 📖 **Documentos de apoio para criar a NOVA questão:**
 {context}
 
 IMPORTANTE: A nova questão deve ser tão rica, complexa e bem fundamentada quanto as questões existentes, mas abordando um aspecto diferente do tópico ou utilizando um ângulo de análise distinto.
 """
-    response_text = get_gemini_response(prompt, temperature)
+    # Índice semântico das demais questões (e da original) para rejeitar repetições
+    index = QuestionSimilarityIndex()
+    compared = list(other_questions.values()) + ([original_question] if "text" in original_question else [])
+    if compared:
+        try:
+            vectors = await get_embedding_function().aembed_documents([q["text"] for q in compared])
+        except Exception as e:
+            # Sem embeddings a substituição segue sem checar repetições
+            print(f"⚠️ Verificação de similaridade ignorada (erro nos embeddings): {e}")
+            index = None
+        else:
+            for question, vector in zip(compared, vectors):
+                index.add(question["text"], vector)
+
+    # Resposta inválida também conta como tentativa, sem derrubar a requisição
+    new_question = None
+    for attempt in range(max(DEDUP_RETRIES, MCQ_REPAIR_RETRIES) + 1):
+        response_text = await aget_gemini_response(prompt, temperature)
+        questions, rejected = parse_mcq(response_text)
+        if not questions:
+            print(f"⚠️ Nova questão inválida: {'; '.join(rejected) or 'JSON não reconhecido'}")
+            continue
 
-    try:
-        start = response_text.find("{")
-        end = response_text.rfind("}") + 1
-        json_text = response_text[start:end]
-        new_question = json.loads(json_text)
-    except:
+        new_question = questions[0]
+        if index is None:
+            break
+        try:
+            vector = await get_embedding_function().aembed_query(new_question["text"])
+        except Exception as e:
+            print(f"⚠️ Verificação de similaridade ignorada (erro nos embeddings): {e}")
+            break
+        if not index.is_duplicate(vector):
+            break
+
+    if new_question is None:
         raise HTTPException(
             status_code=500,
             detail=f"Erro ao decodificar JSON da nova questão.\nResposta bruta:\n{response_text}"
         )
     
     # substitui somente a questão escolhida
-    original_mcq[question_number] = new_question[question_number]
+    original_mcq[question_number] = new_question
 
     return original_mcq
 
-# Criação do pdf
-def create_PDF(exame):
-    pdf = FPDF()
-    pdf.add_page()
-
-    pdf.set_auto_page_break(auto=True, margin=15)
-
-    CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
-    pdf_path = os.path.join(CURRENT_DIR, "prova_ExamForge.pdf")
-
-    for i, question_key in enumerate(exame.keys(), 1):
-        question = exame[question_key]
-        
-        pdf.set_font("Arial", 'B', 14)
-        pdf.set_text_color(0, 0, 128)
-        pdf.cell(0, 15, f"Questão {i}:", 0, 1)
-
-        pdf.set_font("Arial", size=12)
-        pdf.set_text_color(0, 0, 0)
-        text = substituir_caracteres_unicode(question['text'])
-        pdf.multi_cell(0, 8, text, 0, 1)
-        pdf.ln(5)
-
-        pdf.set_font("Arial", size=11)
-        options = question['options']
-        
-        for j, option in enumerate(options):
-            letra = obter_letra_enumeração(j)
-            text = substituir_caracteres_unicode(option['option'])
-            pdf.cell(10, 10, f"({letra})", 0, 0)
-            pdf.multi_cell(0, 10, f" {text}", 0, 1)
-
-        pdf.ln(10)
-        pdf.set_draw_color(200, 200, 200)
-        pdf.line(10, pdf.get_y(), 200, pdf.get_y())
-        pdf.ln(10)
-
-    pdf.output(pdf_path)
-    return pdf_path
-
 # Feedback final do simulado
-def generate_feedback(dict_responses: dict, temperature: float = 0.5):
+async def generate_feedback(dict_responses: dict, temperature: float = 0.5):
 
     prompt = f"""
 Você é um avaliador educacional IA. Analise o desempenho do aluno no exame e gere um feedback claro, direto e bem formatado, seguindo exatamente o formato abaixo.
@@ -359,77 +584,149 @@ Caso o aluno tenha acertado a maioria das questões e NÃO haja áreas reais de
 Agora gere o feedback formatado exatamente conforme instruído.
 """
 
-    response_text = get_gemini_response(prompt, temperature)
+    response_text = await aget_gemini_response(prompt, temperature)
     return response_text
 
 # Modelos de requisição
 class MCQRequest(BaseModel):
     topic: str
     qnt_questoes: int
+    course: Optional[str] = None  # curso da base (vazio: coleção padrão)
 
 class CheckAnswerRequest(BaseModel):
     question_data: dict  # JSON da questão gerada pelo /generate_mcq/
     chosen_option: str
+    exam_id: str  # exam_id devolvido pelo /generate_mcq/
+    question_id: Optional[str] = None  # ex.: "question 1"
+
+class AnswerItem(BaseModel):
+    question_id: str  # ex.: "question 1"
+    option_index: int  # posição da alternativa escolhida (a partir de 0)
+
+class SubmitAnswersRequest(BaseModel):
+    exam_id: str
+    answers: List[AnswerItem]
 
 class SubstituteQuestionRequest(BaseModel):
     original_mcq: dict
     question_number: str
     topic: str
+    exam_id: str
+    course: Optional[str] = None
+
+class FinalEvaluationRequest(BaseModel):
+    exam_id: str
+
+class ExamRequest(BaseModel):
+    exam_id: str
 
 
 # Endpoints
+async def build_exam_questions(topic: str, qnt_questoes: int, course: str = None):
+    """
+    Recuperação + banco de questões + geração ao vivo + deduplicação.
+    Retorna (questões, fontes), ou None se não houver documentos relevantes.
+    Pode vir com menos questões que o pedido: quem chama confere a contagem.
+    """
+    n_batches = len(split_batches(qnt_questoes))
+    k = max(8, n_batches * MCQ_DOCS_PER_BATCH) if n_batches > 1 else 8
+
+    db = await asyncio.to_thread(get_vector_store, course)
+    bm25_index = await asyncio.to_thread(get_bm25, course)
+    relevant_docs, context = await aretrieve_context(db, topic, k=k, bm25_index=bm25_index)
+    if not relevant_docs:
+        return None
+
+    # Primeiro o banco de questões; geração ao vivo só para o que faltar
+    questions = await asyncio.to_thread(questions_from_bank, relevant_docs, qnt_questoes)
+
+    missing = qnt_questoes - len(questions)
+    if missing > 0:
+        live = await generate_mcq_from_context(
+            docs=relevant_docs,
+            context=context,
+            topic=topic,
+            qnt_questoes=missing,
+            temperature=0.5
+        )
+        questions += [q for q in live.values() if isinstance(q, dict)]
+
+    questions = await replace_near_duplicates(questions, context, topic)
+    sources = [doc.metadata.get("source", "Desconhecida") for doc in relevant_docs]
+    return questions, sources
+
 @router.post("/generate_mcq/")
-def generate_mcq(data: MCQRequest):
+async def generate_mcq(data: MCQRequest):
     """Gera questões de múltipla escolha baseadas no tema informado."""    
     
+    try:
+        course = CourseScope(data.course).course
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    try:
+        db = await asyncio.to_thread(get_vector_store, course)
+    except CourseNotFound as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
     if not db:
         return JSONResponse(status_code=500, content={"error": "Banco vetorial não inicializado."})
 
-    relevant_docs = db.similarity_search(data.topic, k=8)
-    if not relevant_docs:
+    # Pedidos idênticos simultâneos (mesmo curso, tópico e quantidade) compartilham uma única geração
+    key = (course, normalize_topic(data.topic), data.qnt_questoes)
+    built, shared = await mcq_flight.do_shared(
+        key, lambda: build_exam_questions(data.topic, data.qnt_questoes, course)
+    )
+    if built is None:
         return JSONResponse(status_code=404, content={"error": "Nenhum documento relevante encontrado."})
 
-    context = format_docs(relevant_docs)
-    
-    # Reseta dict_questions para novo exame
-    dict_questions = {}
-    
-    mcq = generate_mcq_from_context(
-        context=context,
-        topic=data.topic,
-        qnt_questoes=data.qnt_questoes, 
-        temperature=0.5
-    )
+    questions, sources = copy.deepcopy(built)
+    # Quem pegou carona numa geração em andamento recebe sua própria ordem
+    # de questões e alternativas (o primeiro pedido mantém a ordem gerada)
+    if shared and MCQ_COALESCE_SHUFFLE:
+        random.shuffle(questions)
+        questions = balance_answer_positions(questions)
+
+    questions = questions[:data.qnt_questoes]
+    mcq = {f"question {i}": question for i, question in enumerate(questions, 1)}
+    mcq["exam_id"] = await asyncio.to_thread(save_exam, mcq, data.topic, sources)
 
-    # Inicializa dict_questions com a estrutura correta
-    for i, question_key in enumerate(mcq.keys(), 1):
-        if question_key == "sources":
-            continue
-            
-        question = mcq[question_key]
-        correct_opt = None
-        
-        for opt in question.get("options", []):
-            if opt.get("is_correct", False):
-                correct_opt = opt["option"]
-                break
-        
-        dict_questions[question_key] = {
-            "text": question["text"],
-            "correct_option": correct_opt,
-            "chosen_option": "",
-            "is_correct": False
-        }
-    
     # Adiciona fontes ao JSON retornado
-    mcq["sources"] = [doc.metadata.get("source", "Desconhecida") for doc in relevant_docs]
+    mcq["sources"] = sources
+    # Exame parcial (lotes que falharam mesmo após as novas tentativas): o cliente é avisado
+    mcq["missing"] = data.qnt_questoes - len(questions)
 
     return mcq
 
+@router.post("/generate_mcq/stream/")
+async def generate_mcq_stream(data: MCQRequest):
+    """Gera as questões em stream (SSE), enviando cada uma assim que fica pronta."""
+
+    try:
+        course = CourseScope(data.course).course
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    try:
+        db = await asyncio.to_thread(get_vector_store, course)
+    except CourseNotFound as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
+    if not db:
+        return JSONResponse(status_code=500, content={"error": "Banco vetorial não inicializado."})
+
+    bm25_index = await asyncio.to_thread(get_bm25, course)
+    relevant_docs, context = await aretrieve_context(db, data.topic, k=8, bm25_index=bm25_index)
+    if not relevant_docs:
+        return JSONResponse(status_code=404, content={"error": "Nenhum documento relevante encontrado."})
+
+    return StreamingResponse(
+        stream_mcq_events(relevant_docs, context, data.topic, data.qnt_questoes),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/check_answer/")
 def check_answer(data: CheckAnswerRequest):
     """Verifica se a resposta do aluno está correta."""
-    global dict_questions
     
     question_data = data.question_data
     chosen = data.chosen_option.strip()
@@ -449,12 +746,23 @@ def check_answer(data: CheckAnswerRequest):
     
     is_correct = chosen.lower() == (correct_option or "").lower() if correct_option else False
 
-    # Atualiza dict_questions com a resposta do aluno
-    for key in dict_questions:
-        if dict_questions[key]["text"] == question_data.get("text"):
-            dict_questions[key]["chosen_option"] = chosen
-            dict_questions[key]["is_correct"] = is_correct
-            break
+    # Atualiza a sessão do exame com a resposta do aluno
+    exam_sessions = get_session_store()
+    exam_id = data.exam_id
+    question_id = data.question_id
+    if not question_id:
+        # Clientes antigos não enviam question_id: localiza pelo enunciado
+        for key, state in (exam_sessions.get(exam_id) or {}).items():
+            if state["text"] == question_data.get("text"):
+                question_id = key
+                break
+
+    state = exam_sessions.get_question(exam_id, question_id) if question_id else None
+    if state is None:
+        return JSONResponse(status_code=404, content={"error": "Exame ou questão não encontrado (ou expirado)."})
+    state["chosen_option"] = chosen
+    state["is_correct"] = is_correct
+    exam_sessions.set_question(exam_id, question_id, state)
 
     if is_correct:
         return {
@@ -473,63 +781,86 @@ def check_answer(data: CheckAnswerRequest):
             "explanation_correct": explanation_correct
         }
 
+@router.post("/submit_answers/")
+def submit_answers(data: SubmitAnswersRequest):
+    """
+    Corrige várias respostas de uma vez pelo gabarito salvo do exame: o
+    cliente envia só (question_id, índice da alternativa), sem a questão.
+    """
+    exam_sessions = get_session_store()
+    exam = get_exam_repository().get_exam(data.exam_id)
+    if not exam:
+        return JSONResponse(status_code=404, content={"error": "Exame não encontrado."})
+
+    states = exam_sessions.get(data.exam_id)
+    expired = states is None
+    if expired:
+        # Sessão expirada: recomeça a partir do gabarito (respostas anteriores se perdem)
+        states = {key: question_state(q) for key, q in exam.items()}
+    results, summary = grade_answers(
+        exam, [(answer.question_id, answer.option_index) for answer in data.answers], states
+    )
+
+    # Uma única escrita, só das questões corrigidas: não sobrescreve respostas
+    # gravadas ao mesmo tempo pelo /check_answer em outras questões
+    graded = {r["question_id"]: states[r["question_id"]] for r in results if "error" not in r}
+    if expired or not exam_sessions.update_questions(data.exam_id, graded):
+        exam_sessions.save(data.exam_id, states)
+    return {"exam_id": data.exam_id, "results": results, **summary}
+
 @router.post("/substitute_question/")
-def substitute_question_endpoint(data: SubstituteQuestionRequest):
-    """Substitui uma questão específica por uma nova e salva no questions.json."""
-    global dict_questions
+async def substitute_question_endpoint(data: SubstituteQuestionRequest):
+    """Substitui uma questão específica por uma nova e atualiza o exame salvo."""
+    try:
+        course = CourseScope(data.course).course
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    exam_repository = get_exam_repository()
+    if await asyncio.to_thread(exam_repository.get_question, data.exam_id, data.question_number) is None:
+        return JSONResponse(status_code=404, content={"error": "Exame ou questão não encontrado."})
     
-    updated = substitute_question(
+    updated = await substitute_question(
         original_mcq=data.original_mcq,
         question_number=data.question_number,
         topic=data.topic,
+        course=course
     )
     
-    # Salva no arquivo JSON
-    CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
-    QUESTIONS_PATH = os.path.join(CURRENT_DIR, "questions.json")
-    
-    with open(QUESTIONS_PATH, "w", encoding="utf-8") as arquivo:
-        json.dump(updated, arquivo, ensure_ascii=False, indent=4)
-    
-    # Atualiza o dict_questions com a nova questão
-    new_question_data = updated[data.question_number]
-    
-    # Encontra a alternativa correta
-    correct_opt = None
-    for opt in new_question_data.get("options", []):
-        if opt.get("is_correct", False):
-            correct_opt = opt["option"]
-            break
-    
-    # Atualiza o dicionário global
-    dict_questions[data.question_number] = {
-        "text": new_question_data["text"],
-        "correct_option": correct_opt,
-        "chosen_option": "",
-        "is_correct": False
-    }
+    # Atualiza somente a linha da questão substituída e a sessão do exame
+    new_question = updated[data.question_number]
+    await asyncio.to_thread(exam_repository.replace_question, data.exam_id, data.question_number, new_question)
+    await asyncio.to_thread(
+        get_session_store().set_question, data.exam_id, data.question_number, question_state(new_question)
+    )
     
     return updated
 
 @router.post("/generate_PDF/")
-async def generate_PDF():
+async def generate_PDF(request: Request, data: ExamRequest):
     """Gera PDF com as questões do exame."""
     try:
-        CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
-        QUESTIONS_PATH = os.path.join(CURRENT_DIR, "questions.json")
+        exame = await asyncio.to_thread(get_exam_repository().get_exam, data.exam_id)
 
-        if not os.path.exists(QUESTIONS_PATH):
+        if not exame:
             return JSONResponse(
                 status_code=404, 
-                content={"status": "error", "message": "Arquivo questions.json não encontrado"}
+                content={"status": "error", "message": "Exame não encontrado"}
             )
 
-        with open(QUESTIONS_PATH, "r", encoding="utf-8") as arquivo:
-            exame = json.load(arquivo)
+        # O cliente já tem esta versão do exame: nem precisa renderizar
+        etag = exam_hash(exame)
+        if request.headers.get("if-none-match", "").strip('"') == etag:
+            return Response(status_code=304, headers={"ETag": f'"{etag}"'})
 
-        result = create_PDF(exame)
+        result, etag = await render_pdf(exame)
 
-        return FileResponse(result, media_type='application/pdf', filename="ExamForge.pdf")
+        return FileResponse(
+            result,
+            media_type='application/pdf',
+            filename="ExamForge.pdf",
+            headers={"ETag": f'"{etag}"', "Cache-Control": "private, max-age=0"}
+        )
 
     except Exception as e:
         return JSONResponse(
@@ -538,23 +869,35 @@ async def generate_PDF():
         )
 
 @router.post("/final_evaluation")
-def final_evaluation():
+async def final_evaluation(data: FinalEvaluationRequest):
     """Gera feedback final baseado nas respostas do aluno."""
-    if not dict_questions:
+    exam_id = data.exam_id
+    respostas = await asyncio.to_thread(get_session_store().get, exam_id)
+    if respostas is None:
         return JSONResponse(
-            status_code=400,
-            content={"error": "Nenhum exame foi respondido ainda"}
+            status_code=404,
+            content={"error": "Exame não encontrado (ou expirado)."}
         )
     
-    feedback = generate_feedback(dict_questions)
+    feedback = await generate_feedback(respostas)
     return {
+        "exam_id": exam_id,
         "feedback": feedback,
-        "respostas": dict_questions
+        "respostas": respostas
     }
 
 @router.get("/status/")
-def status():
-    """Verifica status da coleção vetorial."""
+def status(course: Optional[str] = None):
+    """Verifica status da coleção vetorial do curso."""
+    try:
+        scope = CourseScope(course)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    try:
+        db = get_vector_store(scope.course)
+    except CourseNotFound as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
     try:
         num_docs = len(db.get()['ids']) if db else 0
     except Exception:
@@ -563,6 +906,15 @@ def status():
     return {
         "status": "ok",
         "docs": num_docs,
-        "collection": COLLECTION_NAME,
-        "model": "gemini-2.5-flash"
+        "course": scope.course,
+        "collection": scope.collection_name,
+        "model": CHAT_MODEL,
+        "embedding_cache": get_embedding_function().stats(),
+        "retrieval_cache": retrieval_cache.stats(),
+        "context_budget": context_stats,
+        "search": {**search_stats, "bm25_chunks": get_bm25(scope.course).count()},
+        "llm_client": chat_client.stats(),
+        "coalescing": mcq_flight.stats(),
+        "embedding_client": embedding_client.stats(),
+        "question_bank": get_question_bank().count() if BANK_ENABLED else 0
     }
\ No newline at end of file
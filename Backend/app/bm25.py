@@ -0,0 +1,138 @@
+import os
+import re
+import json
+import math
+import threading
+import unicodedata
+from collections import Counter
+
+
+STOPWORDS = {
+    "a", "o", "as", "os", "um", "uma", "uns", "umas", "de", "do", "da", "dos", "das",
+    "em", "no", "na", "nos", "nas", "por", "pelo", "pela", "para", "com", "sem", "e",
+    "ou", "que", "se", "ao", "aos", "mais", "menos", "como", "mas", "sobre", "entre",
+    "sua", "seu", "suas", "seus", "ser", "sao", "foi", "esta", "este", "isso", "the",
+    "of", "and", "to", "in", "is", "for", "on", "with"
+}
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str):
+    """Minúsculas, sem acentos e sem stopwords."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [t for t in TOKEN_RE.findall(text) if len(t) > 1 and t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Índice léxico BM25 (Okapi) dos chunks, persistido em JSON ao lado do
+    Chroma. Os documentos são identificados pelos mesmos IDs da coleção.
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.Lock()
+        self.docs = {}       # id -> {termo: frequência}
+        self.doc_len = {}    # id -> número de tokens
+        self.postings = {}   # termo -> {id: frequência}
+        self.total_len = 0
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for doc_id, terms in json.load(f).items():
+                    self._add(doc_id, terms)
+
+    def _add(self, doc_id, terms):
+        self.docs[doc_id] = terms
+        length = sum(terms.values())
+        self.doc_len[doc_id] = length
+        self.total_len += length
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+
+    def _remove(self, doc_id):
+        terms = self.docs.pop(doc_id, None)
+        if terms is None:
+            return
+        self.total_len -= self.doc_len.pop(doc_id)
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self.postings[term]
+
+    def add(self, ids, texts):
+        with self.lock:
+            for doc_id, text in zip(ids, texts):
+                self._remove(doc_id)
+                self._add(doc_id, dict(Counter(tokenize(text))))
+
+    def remove(self, ids):
+        with self.lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+
+    def clear(self):
+        with self.lock:
+            self.docs, self.doc_len, self.postings, self.total_len = {}, {}, {}, 0
+
+    def count(self):
+        return len(self.docs)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with self.lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.docs, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def search(self, query: str, top_n: int = 20):
+        """[(id, score)] ordenado por relevância BM25."""
+        terms = tokenize(query)
+        with self.lock:
+            n_docs = len(self.docs)
+            if not n_docs or not terms:
+                return []
+            avgdl = self.total_len / n_docs
+            scores = {}
+            for term in set(terms):
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id, tf in posting.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self.doc_len[doc_id] / avgdl)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_n]
+
+    def covers(self, query: str):
+        """True se todos os termos da consulta aparecem em algum chunk."""
+        terms = tokenize(query)
+        with self.lock:
+            return bool(terms) and all(term in self.postings for term in terms)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_bm25_index(path: str):
+    """Uma instância por arquivo, compartilhada entre ingestão e consultas."""
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = BM25Index(path)
+        return _indexes[path]
+
+
+def drop_bm25_index(path: str):
+    """Descarta o índice (memória e arquivo), ex.: ao apagar um curso."""
+    with _indexes_lock:
+        _indexes.pop(path, None)
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,74 @@
+import os
+import re
+import unicodedata
+
+
+CHROMA_PATH = "./chroma"
+COLLECTION_NAME = "exame_docs"
+DOCUMENTS_PATH = "./Documentos"
+# Pastas de documentos dos cursos (um subdiretório por curso)
+COURSES_PATH = os.getenv("COURSES_PATH", "./Cursos")
+DEFAULT_COURSE = "default"
+
+COURSE_RE = re.compile(r"^[a-z0-9](?:[a-z0-9_-]{0,38}[a-z0-9])?$")
+
+
+def normalize_course(course: str = None):
+    """Nome do curso em minúsculas e sem acentos; vazio é o escopo padrão."""
+    if not course or not course.strip():
+        return DEFAULT_COURSE
+    course = unicodedata.normalize("NFKD", course.strip().lower())
+    course = "".join(c for c in course if not unicodedata.combining(c))
+    course = re.sub(r"\s+", "-", course)
+    if not COURSE_RE.match(course):
+        raise ValueError(
+            "Curso inválido: use até 40 letras, números, '-' ou '_', começando e terminando com letra ou número."
+        )
+    return course
+
+
+class CourseScope:
+    """
+    Tudo que é próprio de um curso: coleção do Chroma, pasta de documentos,
+    manifesto e índice BM25. O curso padrão mantém os caminhos originais
+    (exame_docs e ./Documentos).
+    """
+
+    def __init__(self, course: str = None):
+        self.course = normalize_course(course)
+        if self.course == DEFAULT_COURSE:
+            self.collection_name = COLLECTION_NAME
+            self.documents_path = DOCUMENTS_PATH
+        else:
+            self.collection_name = f"{COLLECTION_NAME}__{self.course}"
+            self.documents_path = os.path.join(COURSES_PATH, self.course)
+        self.manifest_path = os.path.join(CHROMA_PATH, f"{self.collection_name}_manifest.json")
+        self.bm25_path = os.path.join(CHROMA_PATH, f"{self.collection_name}_bm25.json")
+
+    @property
+    def is_default(self):
+        return self.course == DEFAULT_COURSE
+
+
+def course_from_collection(collection_name: str):
+    """Inverso de CourseScope.collection_name (None se não for uma coleção do ExamForge)."""
+    if collection_name == COLLECTION_NAME:
+        return DEFAULT_COURSE
+    prefix = f"{COLLECTION_NAME}__"
+    if collection_name.startswith(prefix):
+        return collection_name[len(prefix):]
+    return None
+
+
+def list_courses(collection_names=()):
+    """Cursos com pasta de documentos ou coleção já criada."""
+    courses = {DEFAULT_COURSE}
+    if os.path.isdir(COURSES_PATH):
+        for name in os.listdir(COURSES_PATH):
+            if os.path.isdir(os.path.join(COURSES_PATH, name)) and COURSE_RE.match(name):
+                courses.add(name)
+    for name in collection_names:
+        course = course_from_collection(name)
+        if course:
+            courses.add(course)
+    return sorted(courses)
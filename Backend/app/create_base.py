@@ -1,176 +1,468 @@
 import os
+import time
 import shutil
-from fastapi import APIRouter, UploadFile, File
+import asyncio
+import hashlib
+from typing import List, Optional
+from fastapi import APIRouter, UploadFile, File, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
-from langchain_community.document_loaders import (
-    UnstructuredFileLoader,
-    UnstructuredWordDocumentLoader,
-    UnstructuredPDFLoader,
-    TextLoader,
-    UnstructuredMarkdownLoader
-)
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from pydantic import BaseModel
 from dotenv import load_dotenv
+from app.ingestion import update_index
+from app.ingest_jobs import IngestJobQueue
+from app.manifest import IndexManifest
+from app.courses import CourseScope, list_courses
+from app.resources import collection_names, drop_course_index, get_bm25, get_vector_store
+from app.retrieval import invalidate_retrieval_cache
+from app.question_bank import BANK_ENABLED, get_question_bank, start_bank_fill
+from app.uploads import (
+    UploadTooLarge,
+    UPLOAD_MAX_BYTES,
+    get_upload_store,
+    hash_file,
+    purge_stale_uploads,
+    read_upload,
+    safe_filename,
+    store_upload,
+    temp_path,
+    write_stream
+)
 
 
 load_dotenv()
 
 router = APIRouter(prefix="/base", tags=["Criação de Base Vetorial"])
 
-DOCUMENTS_PATH = "./Documentos"
-CHROMA_PATH = "./chroma"
-COLLECTION_NAME = "exame_docs"
 
-GEMINI_KEY = os.getenv("GOOGLE_GEMINI_KEY")
+# Hash incremental das sessões de upload em partes: upload_id -> (hasher, bytes recebidos)
+upload_hashers = {}
+last_upload_purge = 0.0
+
+
+class UploadSessionRequest(BaseModel):
+    filename: str
+    size: int
+    course: Optional[str] = None
+
+
+def course_error(e: ValueError):
+    return JSONResponse(status_code=400, content={"error": str(e)})
+
+
+def job_params(scope: CourseScope, **params):
+    """Parâmetros do job; o curso padrão fica implícito (como nos jobs antigos)."""
+    if not scope.is_default:
+        params["course"] = scope.course
+    return params
 
-if not GEMINI_KEY:
-    raise ValueError("GOOGLE_GEMINI_KEY não encontrada no arquivo .env")
 
+def known_hashes(scope: CourseScope):
+    """sha256 -> caminho dos arquivos já vetorizados do curso (anteriores ao índice de uploads)."""
+    manifest = IndexManifest(scope.manifest_path)
+    return {entry["sha256"]: path for path, entry in manifest.entries.items()}
 
-os.environ["GOOGLE_API_KEY"] = GEMINI_KEY
 
+def vectorize_uploaded(scope: CourseScope, results):
+    """Vetorização incremental só dos arquivos recém-guardados."""
+    paths = [r["path"] for r in results if not r["duplicate"]]
+    if not paths:
+        return None
+    return ingest_jobs.submit(job_params(scope, file_paths=paths))
 
 
 @router.post("/upload/")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(
+    file: Optional[UploadFile] = File(None),
+    files: Optional[List[UploadFile]] = File(None),
+    vectorize: bool = False,
+    course: Optional[str] = None
+):
+
+    """
+    Recebe um ou mais arquivos (campos `file` e/ou `files`) e salva na pasta
+    do curso (padrão: ./Documentos). Conteúdo repetido é guardado uma única
+    vez; com `vectorize=true` enfileira a vetorização só desses arquivos.
+    """
 
-    """Recebe um arquivo e salva localmente em ./Documentos"""
+    try:
+        scope = CourseScope(course)
+    except ValueError as e:
+        return course_error(e)
+
+    uploads = ([file] if file else []) + (files or [])
+    if not uploads:
+        return JSONResponse(status_code=400, content={"error": "Nenhum arquivo enviado."})
 
+    try:
+        filenames = [safe_filename(upload.filename) for upload in uploads]
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    # Tudo vai primeiro para temporários: se um arquivo falhar, nenhum é guardado
+    received = []
+    for upload, filename in zip(uploads, filenames):
+        tmp = temp_path(os.urandom(8).hex())
+        hasher = hashlib.sha256()
+        try:
+            size = await write_stream(read_upload(upload), tmp, hasher)
+        except UploadTooLarge as e:
+            for path in [tmp] + [item[0] for item in received]:
+                await asyncio.to_thread(os.remove, path)
+            return JSONResponse(status_code=413, content={"error": str(e), "file": filename})
+        received.append((tmp, filename, hasher.hexdigest(), size))
+
+    hashes = await run_in_threadpool(known_hashes, scope)
+    results = []
+    for tmp, filename, sha256, size in received:
+        results.append(await run_in_threadpool(
+            store_upload, get_upload_store(), tmp, filename, sha256, size, scope.documents_path, hashes
+        ))
+
+    names = ", ".join(upload.filename for upload in uploads)
+    response = {"message": f"Arquivo {names} enviado com sucesso!", "files": results}
+    if vectorize:
+        response["job_id"] = vectorize_uploaded(scope, results)
+    return response
+
+
+@router.post("/uploads/")
+def create_upload_session(data: UploadSessionRequest):
+    """Abre um upload em partes (retomável); as partes vão em PUT /base/uploads/{upload_id}"""
+    try:
+        filename = safe_filename(data.filename)
+        scope = CourseScope(data.course)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    if data.size > UPLOAD_MAX_BYTES:
+        return JSONResponse(status_code=413, content={"error": f"Limite de {UPLOAD_MAX_BYTES} bytes."})
+
+    store = get_upload_store()
+    purge_abandoned_uploads(store)
+    upload_id = store.create_session(filename, data.size, scope.course)
+    # Arquivo vazio desde já: um upload de 0 bytes pode ser finalizado sem nenhum PUT
+    open(temp_path(upload_id), "wb").close()
+    return store.get_session(upload_id)
+
+
+def purge_abandoned_uploads(store):
+    """Limpeza periódica (no máximo a cada minuto) das sessões de upload abandonadas."""
+    global last_upload_purge
+    if time.monotonic() - last_upload_purge < 60:
+        return
+    last_upload_purge = time.monotonic()
+    for upload_id in purge_stale_uploads(store):
+        upload_hashers.pop(upload_id, None)
+
+
+@router.get("/uploads/{upload_id}")
+def upload_session_status(upload_id: str):
+    """Quantos bytes já chegaram: o cliente retoma a partir de `received`"""
+    session = get_upload_store().get_session(upload_id)
+    if session is None:
+        return JSONResponse(status_code=404, content={"error": "Upload não encontrado."})
+    return session
+
+
+@router.put("/uploads/{upload_id}")
+async def upload_part(upload_id: str, request: Request, offset: int = 0):
+    """Recebe a próxima parte (corpo bruto) a partir de `offset`"""
+    store = get_upload_store()
+    # SQLite com timeout de lock: nunca direto no event loop
+    session = await asyncio.to_thread(store.get_session, upload_id)
+    if session is None:
+        return JSONResponse(status_code=404, content={"error": "Upload não encontrado."})
+    if offset > session["received"]:
+        # Parte fora de ordem: o cliente deve retomar de `received`
+        return JSONResponse(status_code=409, content=session)
+
+    tmp = temp_path(upload_id)
+    hasher, hashed = upload_hashers.get(upload_id, (None, -1))
+    if hashed != offset:
+        # Reinício do servidor ou parte reenviada: refaz o hash do que já está no disco
+        hasher = await asyncio.to_thread(hash_file, tmp, offset) if offset else hashlib.sha256()
+
+    try:
+        received = await write_stream(
+            request.stream(), tmp, hasher, offset=offset, max_bytes=session["size"]
+        )
+    except UploadTooLarge as e:
+        return JSONResponse(status_code=413, content={"error": str(e)})
+
+    upload_hashers[upload_id] = (hasher, received)
+    await asyncio.to_thread(store.set_received, upload_id, received)
+    return await asyncio.to_thread(store.get_session, upload_id)
+
+
+@router.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str, vectorize: bool = False):
+    """Finaliza o upload: move para a pasta do curso (sem duplicar conteúdo) e opcionalmente vetoriza"""
+    store = get_upload_store()
+    session = await asyncio.to_thread(store.get_session, upload_id)
+    if session is None:
+        return JSONResponse(status_code=404, content={"error": "Upload não encontrado."})
+    if session["received"] != session["size"]:
+        return JSONResponse(status_code=409, content={"error": "Upload incompleto.", **session})
+
+    tmp = temp_path(upload_id)
+    hasher, hashed = upload_hashers.pop(upload_id, (None, -1))
+    if hashed != session["received"]:
+        hasher = await asyncio.to_thread(hash_file, tmp)
+
+    scope = CourseScope(session["course"])
+    hashes = await run_in_threadpool(known_hashes, scope)
+    result = await run_in_threadpool(
+        store_upload, store, tmp, session["filename"], hasher.hexdigest(),
+        session["size"], scope.documents_path, hashes
+    )
+    await asyncio.to_thread(store.delete_session, upload_id)
 
-    os.makedirs(DOCUMENTS_PATH, exist_ok=True)
-    file_path = os.path.join(DOCUMENTS_PATH, file.filename)
-    with open(file_path, "wb") as f:
-        shutil.copyfileobj(file.file, f)
-    return {"message": f"Arquivo {file.filename} enviado com sucesso!"}
+    if vectorize:
+        result["job_id"] = vectorize_uploaded(scope, [result])
+    return result
 
 @router.get("/list/")
-def list_upload_files():
-    """Lista todos os arquivos enviados para a pasta Documentos"""
+def list_upload_files(course: Optional[str] = None):
+    """Lista todos os arquivos enviados para a pasta de documentos do curso"""
+
+    try:
+        scope = CourseScope(course)
+    except ValueError as e:
+        return course_error(e)
 
-    if not os.path.exists(DOCUMENTS_PATH):
+    if not os.path.exists(scope.documents_path):
         return{"files": []}
-    files = os.listdir(DOCUMENTS_PATH)
+    files = os.listdir(scope.documents_path)
     return {"files": files}
 
-@router.post("/create/")
-def create_vector_database():
+def run_vectorization(progress=None, course=None, file_paths=None):
+    """
+    Cria/atualiza a base vetorial do curso com os arquivos da sua pasta (ou
+    só `file_paths`). Executado pelo worker da fila de jobs; devolve o
+    resumo gravado no job.
+    """
+    scope = CourseScope(course)
+    # Banco Chroma compartilhado com o /rag (embeddings com cache em disco)
+    db = get_vector_store(scope.course, create=True)
+    if db is None:
+        raise RuntimeError("Banco vetorial não inicializado.")
+
+    # Sincroniza com o manifesto (novos, alterados e removidos) e o índice BM25 do curso
+    manifest = IndexManifest(scope.manifest_path)
+    try:
+        result = update_index(
+            db, scope.documents_path, manifest,
+            bm25_index=get_bm25(scope.course), progress=progress, file_paths=file_paths
+        )
+    finally:
+        # Mesmo cancelada, a parte concluída já mudou a coleção
+        invalidate_retrieval_cache(scope.collection_name)
 
-    """Cria/atualiza a base vetorial com novos arquivos em ./Documentos"""
+    total_chunks = db._collection.count()
 
-    if not os.path.exists(DOCUMENTS_PATH):
-        return JSONResponse(
-            status_code=400,
-            content={"error": "Nenhum diretório 'Documentos' encontrado."}
-        )
+    # Banco de questões: descarta chunks removidos e completa os pendentes em segundo plano
+    if BANK_ENABLED:
+        if result["chunk_ids_removed"]:
+            get_question_bank().delete_chunks(result["chunk_ids_removed"])
+        all_ids = [chunk_id for entry in manifest.entries.values() for chunk_id in entry["ids"]]
+        start_bank_fill(all_ids, scope.course)
 
-    # Embeddings
-    embedding = GoogleGenerativeAIEmbeddings(
-        model="gemini-embedding-001",
-        api_key=GEMINI_KEY
-    )
+    # Se tudo já foi vetorizado
+    if not (result["chunks_added"] or result["chunks_removed"]):
+        return {
+            "message": "Nenhum novo documento para vetorizar.",
+            "course": scope.course,
+            "documents_existing": result["documents_unchanged"],
+            "documents_failed": result["documents_failed"],
+            "chunks_added": 0,
+            "chunks_total": total_chunks
+        }
 
-    # Carregar OU criar banco Chroma
-    db = Chroma(
-        persist_directory=CHROMA_PATH,
-        embedding_function=embedding,
-        collection_name=COLLECTION_NAME
-    )
+    print(f"NOVOS CHUNKS GERADOS: {result['chunks_added']}")
 
-    # Buscar documentos já vetorizados
-    existing_docs = set()
-    try:
-        stored = db.get(include=["metadatas"])
-        for meta in stored["metadatas"]:
-            if meta and "source" in meta:
-                existing_docs.add(meta["source"])
-    except:
-        pass
+    return {
+        "message": "Vetorização concluída!",
+        "course": scope.course,
+        "documents_new": result["documents_new"],
+        "documents_changed": result["documents_changed"],
+        "documents_removed": result["documents_removed"],
+        "documents_existing": result["documents_unchanged"],
+        "documents_failed": result["documents_failed"],
+        "chunks_added": result["chunks_added"],
+        "chunks_removed": result["chunks_removed"],
+        "chunks_total": total_chunks
+    }
 
-    print("Documentos já vetorizados:", existing_docs)
 
+# Vetorização em segundo plano, persistida em SQLite e retomada após reinícios
+ingest_jobs = IngestJobQueue(run_vectorization)
 
-    new_files = []
-    docs = []
 
-    for root, _, files in os.walk(DOCUMENTS_PATH):
-        for filename in files:
-            file_path = os.path.join(root, filename)
+def submit_build(scope: CourseScope):
+    """Enfileira a vetorização completa do curso (ou devolve o erro)."""
+    if not os.path.exists(scope.documents_path):
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Nenhum diretório '{scope.documents_path}' encontrado."}
+        )
 
-            # Ignorar arquivos já vetorizados
-            if file_path in existing_docs:
-                continue
+    # Modelo de embeddings divergente é recusado já aqui, não dentro do job
+    try:
+        get_vector_store(scope.course, create=True)
+    except ValueError as e:
+        return JSONResponse(status_code=409, content={"error": str(e)})
 
-            new_files.append(filename)
+    job_id = ingest_jobs.submit(job_params(scope))
+    return {
+        "message": "Vetorização enfileirada.",
+        "course": scope.course,
+        "job_id": job_id,
+        "status_url": f"/base/jobs/{job_id}"
+    }
 
-            ext = filename.lower().split(".")[-1]
-            try:
-                if ext in ["md", "markdown"]:
-                    loader = UnstructuredMarkdownLoader(file_path, languages=["por"])
-                elif ext in ["txt", "csv", "json"]:
-                    loader = TextLoader(file_path)
-                elif ext in ["docx", "doc"]:
-                    loader = UnstructuredWordDocumentLoader(file_path, languages=["por"])
-                elif ext in ["pdf"]:
-                    loader = UnstructuredPDFLoader(file_path, languages=["por"])
-                else:
-                    loader = UnstructuredFileLoader(file_path, languages=["por"])
 
-                loaded_docs = loader.load()
+@router.post("/create/", status_code=202)
+def create_vector_database(course: Optional[str] = None):
 
-                
-                for d in loaded_docs:
-                    d.metadata["source"] = file_path
+    """Enfileira a vetorização da pasta do curso (padrão: ./Documentos) e devolve o job_id"""
 
-                docs.extend(loaded_docs)
+    try:
+        scope = CourseScope(course)
+    except ValueError as e:
+        return course_error(e)
+    return submit_build(scope)
+
+
+@router.get("/jobs/")
+def list_jobs(limit: int = 20):
+    """Jobs de vetorização mais recentes"""
+    return {"jobs": ingest_jobs.store.list(limit)}
+
+
+@router.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    """Andamento do job: status, progresso por arquivo, chunks, vazão e erros"""
+    job = ingest_jobs.store.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job não encontrado."})
+    return job
+
+
+@router.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    """Cancela o job; os arquivos já concluídos permanecem na base"""
+    job = ingest_jobs.cancel(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job não encontrado."})
+    return job
+
+
+def course_stats(scope: CourseScope, existing_collections=None):
+    """
+    Documentos, chunks e jobs de um curso. Com `existing_collections`, a
+    coleção só é aberta se já existir (listar cursos não cria coleções).
+    """
+    docs = os.listdir(scope.documents_path) if os.path.exists(scope.documents_path) else []
+    chunks, error = 0, None
+    if existing_collections is None or scope.collection_name in existing_collections:
+        try:
+            db = get_vector_store(scope.course)
+            chunks = db._collection.count() if db else 0
+        except ValueError as e:
+            # Coleção de outro modelo de embeddings: listada, mas sem uso
+            error = str(e)
+    manifest = IndexManifest(scope.manifest_path)
+    stats = {
+        "course": scope.course,
+        "collection": scope.collection_name,
+        "documents_path": scope.documents_path,
+        "docs": len(docs),
+        "documents_indexed": len(manifest.entries),
+        "chunks": chunks,
+        "bm25_chunks": get_bm25(scope.course).count(),
+        "active_jobs": ingest_jobs.active_for(job_params(scope).get("course"))
+    }
+    if error:
+        stats["error"] = error
+    return stats
 
-            except Exception as e:
-                print(f"⚠️ Erro ao carregar {filename}: {e}")
 
-    # Se tudo já foi vetorizado
-    if not docs:
-        return {
-            "message": "Nenhum novo documento para vetorizar.",
-            "documents_existing": list(existing_docs),
-            "chunks_added": 0,
-            "chunks_total": len(db.get()["ids"])
-        }
+@router.get("/courses/")
+def list_course_scopes():
+    """Cursos (pastas e coleções existentes) com seus números"""
+    existing = set(collection_names())
+    return {"courses": [course_stats(CourseScope(course), existing) for course in list_courses(existing)]}
 
 
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=100,
-        length_function=len,
-        add_start_index=True
-    )
+@router.post("/courses/{course}/build", status_code=202)
+def build_course(course: str):
+    """Enfileira a vetorização do curso; o mesmo que /base/create/?course="""
+    try:
+        scope = CourseScope(course)
+    except ValueError as e:
+        return course_error(e)
+    return submit_build(scope)
+
 
-    documents = text_splitter.split_documents(docs)
+@router.get("/courses/{course}/stats")
+def course_status(course: str):
+    """Documentos, chunks indexados e jobs ativos do curso"""
+    try:
+        scope = CourseScope(course)
+    except ValueError as e:
+        return course_error(e)
+    return course_stats(scope, set(collection_names()))
+
+
+@router.delete("/courses/{course}")
+def drop_course(course: str, delete_documents: bool = False):
+    """
+    Apaga a coleção, o manifesto e o índice BM25 do curso. Os documentos só
+    são apagados com `delete_documents=true`; sem isso um novo build recria tudo.
+    """
+    try:
+        scope = CourseScope(course)
+    except ValueError as e:
+        return course_error(e)
 
-    print(f"NOVOS CHUNKS GERADOS: {len(documents)}")
+    if ingest_jobs.active_for(job_params(scope).get("course")):
+        return JSONResponse(
+            status_code=409,
+            content={"error": "Há uma vetorização em andamento para este curso; cancele-a antes."}
+        )
 
-    db.add_documents(documents)
+    manifest = IndexManifest(scope.manifest_path)
+    chunk_ids = [chunk_id for entry in manifest.entries.values() for chunk_id in entry["ids"]]
+    drop_course_index(scope.course)
+    invalidate_retrieval_cache(scope.collection_name)
+    if BANK_ENABLED and chunk_ids:
+        get_question_bank().delete_chunks(chunk_ids)
 
-    # Contar total final
-    total_chunks = len(db.get()["ids"])
+    if delete_documents and os.path.exists(scope.documents_path):
+        shutil.rmtree(scope.documents_path)
 
     return {
-        "message": "Vetorização concluída!",
-        "documents_new": new_files,
-        "documents_existing": list(existing_docs),
-        "chunks_added": len(documents),
-        "chunks_total": total_chunks
+        "message": f"Curso '{scope.course}' removido.",
+        "course": scope.course,
+        "chunks_removed": len(chunk_ids),
+        "documents_deleted": delete_documents
     }
 
 
 @router.get("/status/")
-def status():
+def status(course: Optional[str] = None):
     
-    """Status do ./Documentos"""
+    """Status da pasta de documentos do curso"""
+
+    try:
+        scope = CourseScope(course)
+    except ValueError as e:
+        return course_error(e)
 
-    total_docs = len(os.listdir(DOCUMENTS_PATH)) if os.path.exists(DOCUMENTS_PATH) else 0
+    total_docs = len(os.listdir(scope.documents_path)) if os.path.exists(scope.documents_path) else 0
     return {
         "status": "ok",
+        "course": scope.course,
         "docs": total_docs,
-        "collection": COLLECTION_NAME
+        "collection": scope.collection_name
     }
@@ -0,0 +1,288 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+from app.llm_client import embedding_client
+from app.metrics import GaugeFunction, span
+
+load_dotenv()
+
+# "google" (API do Gemini) ou "local" (sentence-transformers na CPU)
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "google")
+GOOGLE_EMBEDDING_MODEL = "gemini-embedding-001"
+LOCAL_EMBEDDING_MODEL = os.getenv(
+    "LOCAL_EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+)
+LOCAL_EMBED_BATCH_SIZE = int(os.getenv("LOCAL_EMBED_BATCH_SIZE", "64"))
+LOCAL_EMBED_THREADS = int(os.getenv("LOCAL_EMBED_THREADS", str(min(4, os.cpu_count() or 1))))
+
+EMBEDDING_MODEL = GOOGLE_EMBEDDING_MODEL if EMBEDDING_PROVIDER == "google" else LOCAL_EMBEDDING_MODEL
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./cache/embeddings.sqlite")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+# Ao passar do limite, remove de uma vez esta fração a mais (evita um DELETE por inserção)
+EMBEDDING_CACHE_EVICT_FRACTION = float(os.getenv("EMBEDDING_CACHE_EVICT_FRACTION", "0.05"))
+# O último uso de uma entrada só é regravado se for mais antigo que isto (segundos)
+EMBEDDING_CACHE_TOUCH_INTERVAL = float(os.getenv("EMBEDDING_CACHE_TOUCH_INTERVAL", "600"))
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Cache em disco (SQLite) na frente de um modelo de embeddings.
+
+    A chave é (modelo, tipo, sha256 do texto): documentos e consultas usam
+    task types diferentes no Gemini e por isso não compartilham vetores.
+    Quando passa de `max_entries`, remove em lote as entradas usadas há
+    mais tempo; o último uso é aproximado (regravado no máximo a cada
+    EMBEDDING_CACHE_TOUCH_INTERVAL segundos por entrada).
+    """
+
+    def __init__(self, base: Embeddings, model_name: str, path: str, max_entries: int, client=None):
+        self.base = base
+        # Chamadas remotas passam pelo cliente com limite de taxa e novas tentativas
+        self.client = client
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self.conn.commit()
+        self.size = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _key(self, kind: str, text: str):
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{self.model_name}:{kind}:{digest}"
+
+    def _lookup(self, keys):
+        found = {}
+        stale = []
+        unique = list(dict.fromkeys(keys))
+        now = time.time()
+        with self.lock:
+            # Consulta em blocos para não estourar o limite de parâmetros do SQLite
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                rows = self.conn.execute(
+                    "SELECT key, vector, last_used FROM embeddings "
+                    f"WHERE key IN ({','.join('?' * len(part))})",
+                    part
+                ).fetchall()
+                for key, blob, last_used in rows:
+                    found[key] = array("f", blob).tolist()
+                    if now - last_used > EMBEDDING_CACHE_TOUCH_INTERVAL:
+                        stale.append(key)
+            if stale:
+                self.conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in stale]
+                )
+                self.conn.commit()
+        return found
+
+    def _store(self, items):
+        now = time.time()
+        with self.lock:
+            cursor = self.conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items]
+            )
+            self.size += max(cursor.rowcount, 0)
+            if self.size > self.max_entries:
+                excess = self.size - self.max_entries
+                excess += int(self.max_entries * EMBEDDING_CACHE_EVICT_FRACTION)
+                cursor = self.conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (excess,)
+                )
+                self.size -= cursor.rowcount
+            self.conn.commit()
+
+    def _record(self, hits: int, misses: int):
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+
+    def _call(self, fn, arg):
+        return self.client.call(fn, arg) if self.client else fn(arg)
+
+    def embed_documents(self, texts):
+        keys = [self._key("doc", t) for t in texts]
+        found = self._lookup(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        n_missing = sum(1 for key in keys if key in missing)
+        self._record(len(texts) - n_missing, n_missing)
+
+        if missing:
+            with span("embed_batch"):
+                vectors = self._call(self.base.embed_documents, list(missing.values()))
+            new_items = list(zip(missing.keys(), vectors))
+            self._store(new_items)
+            found.update(new_items)
+
+        return [found[key] for key in keys]
+
+    def embed_query(self, text):
+        key = self._key("query", text)
+        found = self._lookup([key])
+        if key in found:
+            self._record(1, 0)
+            return found[key]
+
+        self._record(0, 1)
+        with span("embed_query"):
+            vector = self._call(self.base.embed_query, text)
+        self._store([(key, vector)])
+        return vector
+
+    def stats(self):
+        with self.lock:
+            hits, misses, size = self.hits, self.misses, self.size
+        total = hits + misses
+        return {
+            "model": self.model_name,
+            "entries": size,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0
+        }
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    Embeddings locais com sentence-transformers, sem rede. Os textos são
+    divididos em lotes codificados em paralelo por várias threads (o
+    PyTorch libera o GIL durante a inferência).
+    """
+
+    def __init__(self, model_name: str, batch_size: int = LOCAL_EMBED_BATCH_SIZE,
+                 threads: int = LOCAL_EMBED_THREADS):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ValueError(
+                "EMBEDDING_PROVIDER=local requer o pacote sentence-transformers "
+                "(pip install sentence-transformers)"
+            )
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.batch_size = batch_size
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+
+    def _encode(self, texts):
+        return self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        ).tolist()
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        # Uma fatia por thread, mas sem fatias pequenas demais para valer a pena
+        size = max(16, -(-len(texts) // self.threads))
+        parts = [texts[i:i + size] for i in range(0, len(texts), size)]
+        if len(parts) == 1:
+            return self._encode(texts)
+        return [vector for part in self.executor.map(self._encode, parts) for vector in part]
+
+    def embed_query(self, text):
+        return self._encode([text])[0]
+
+
+def embedding_model_id(provider: str = EMBEDDING_PROVIDER):
+    """Identificação do modelo gravada nos metadados da coleção."""
+    model = GOOGLE_EMBEDDING_MODEL if provider == "google" else LOCAL_EMBEDDING_MODEL
+    return f"{provider}:{model}"
+
+
+def create_base_embeddings(provider: str = EMBEDDING_PROVIDER):
+    """Modelo de embeddings conforme EMBEDDING_PROVIDER."""
+    if provider == "google":
+        gemini_key = os.getenv("GOOGLE_GEMINI_KEY")
+        if not gemini_key:
+            raise ValueError("GOOGLE_GEMINI_KEY não encontrada no arquivo .env")
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        return GoogleGenerativeAIEmbeddings(model=GOOGLE_EMBEDDING_MODEL, api_key=gemini_key)
+    if provider == "local":
+        return LocalEmbeddings(LOCAL_EMBEDDING_MODEL)
+    raise ValueError(f"EMBEDDING_PROVIDER inválido: {provider}")
+
+
+def check_collection_model(collection):
+    """
+    Confere se a coleção foi construída com o modelo de embeddings atual.
+    Coleções sem registro recebem o modelo atual (se vazias) ou o Gemini,
+    único provedor existente antes desta configuração. Levanta ValueError
+    em caso de divergência, pois vetores de modelos diferentes não se comparam.
+    """
+    metadata = collection.metadata or {}
+    current = embedding_model_id()
+    recorded = metadata.get("embedding_model")
+
+    if recorded is None:
+        recorded = current if collection.count() == 0 else embedding_model_id("google")
+        # O espaço de distância (hnsw:*) não pode ser alterado depois de criado
+        kept = {k: v for k, v in metadata.items() if not k.startswith("hnsw:")}
+        collection.modify(metadata={**kept, "embedding_model": recorded})
+
+    if recorded != current:
+        raise ValueError(
+            f"A coleção '{collection.name}' foi criada com '{recorded}', mas o modelo "
+            f"configurado é '{current}'. Apague a pasta do Chroma e recrie a base."
+        )
+    return recorded
+
+
+_embedding_function = None
+_embedding_lock = threading.Lock()
+
+
+def get_embedding_function():
+    """Instância única (com cache) usada pela ingestão e pelas consultas."""
+    global _embedding_function
+    with _embedding_lock:
+        if _embedding_function is None:
+            base = create_base_embeddings()
+            _embedding_function = CachedEmbeddings(
+                base,
+                model_name=EMBEDDING_MODEL,
+                path=EMBEDDING_CACHE_PATH,
+                max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+                client=embedding_client if EMBEDDING_PROVIDER == "google" else None
+            )
+    return _embedding_function
+
+
+def _embedding_cache_stats():
+    if _embedding_function is None:
+        return {}
+    stats = _embedding_function.stats()
+    return {("hits",): stats["hits"], ("misses",): stats["misses"], ("hit_rate",): stats["hit_rate"]}
+
+
+GaugeFunction(
+    "examforge_embedding_cache", "Cache de embeddings: acertos, faltas e taxa de acerto.",
+    _embedding_cache_stats, ("stat",)
+)
@@ -0,0 +1,97 @@
+import os
+import time
+import json
+import sqlite3
+import threading
+
+
+EXAM_DB_PATH = os.getenv("EXAM_DB_PATH", "./data/exams.sqlite")
+
+
+class ExamRepository:
+    """
+    Persistência dos exames em SQLite (modo WAL): uma linha por exame e
+    uma por questão, endereçadas por exam_id. Substitui o questions.json.
+    """
+
+    def __init__(self, path: str = EXAM_DB_PATH):
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        conn = self._conn()
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS exams ("
+            "exam_id TEXT PRIMARY KEY, topic TEXT, sources TEXT, created_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_exams_created ON exams(created_at);"
+            "CREATE TABLE IF NOT EXISTS questions ("
+            "exam_id TEXT NOT NULL, question_id TEXT NOT NULL, position INTEGER NOT NULL, "
+            "data TEXT NOT NULL, PRIMARY KEY (exam_id, question_id));"
+            "CREATE INDEX IF NOT EXISTS idx_questions_position ON questions(exam_id, position);"
+        )
+        conn.commit()
+
+    def _conn(self):
+        """Uma conexão por thread; o WAL permite leituras concorrentes com a escrita."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def create_exam(self, exam_id: str, questions: dict, topic: str = "", sources=None):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO exams (exam_id, topic, sources, created_at) VALUES (?, ?, ?, ?)",
+                (exam_id, topic, json.dumps(sources or [], ensure_ascii=False), time.time())
+            )
+            conn.executemany(
+                "INSERT INTO questions (exam_id, question_id, position, data) VALUES (?, ?, ?, ?)",
+                [
+                    (exam_id, question_id, position, json.dumps(question, ensure_ascii=False))
+                    for position, (question_id, question) in enumerate(questions.items())
+                ]
+            )
+
+    def get_exam(self, exam_id: str):
+        """Questões do exame em ordem {question_id: questão}, ou None."""
+        rows = self._conn().execute(
+            "SELECT question_id, data FROM questions WHERE exam_id = ? ORDER BY position",
+            (exam_id,)
+        ).fetchall()
+        if not rows:
+            return None
+        return {question_id: json.loads(data) for question_id, data in rows}
+
+    def get_question(self, exam_id: str, question_id: str):
+        row = self._conn().execute(
+            "SELECT data FROM questions WHERE exam_id = ? AND question_id = ?",
+            (exam_id, question_id)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def replace_question(self, exam_id: str, question_id: str, question: dict):
+        """Atualiza uma única questão no lugar; retorna False se ela não existir."""
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                "UPDATE questions SET data = ? WHERE exam_id = ? AND question_id = ?",
+                (json.dumps(question, ensure_ascii=False), exam_id, question_id)
+            )
+        return cursor.rowcount > 0
+
+
+_exam_repository = None
+_repository_lock = threading.Lock()
+
+
+def get_exam_repository():
+    """Instância única do repositório, criada no primeiro uso (não na importação)."""
+    global _exam_repository
+    with _repository_lock:
+        if _exam_repository is None:
+            _exam_repository = ExamRepository()
+    return _exam_repository
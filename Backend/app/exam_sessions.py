@@ -0,0 +1,312 @@
+import os
+import time
+import json
+import uuid
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+
+EXAM_SESSION_BACKEND = os.getenv("EXAM_SESSION_BACKEND", "memory")
+EXAM_SESSION_TTL = float(os.getenv("EXAM_SESSION_TTL", str(6 * 60 * 60)))
+EXAM_SESSION_DB_PATH = os.getenv("EXAM_SESSION_DB_PATH", "./data/exam_sessions.sqlite")
+
+
+def question_state(question: dict):
+    """Estado de correção de uma questão (o antigo item de dict_questions)."""
+    correct_opt = None
+    for opt in question.get("options", []):
+        if opt.get("is_correct", False):
+            correct_opt = opt["option"]
+            break
+
+    return {
+        "text": question["text"],
+        "correct_option": correct_opt,
+        "chosen_option": "",
+        "is_correct": False
+    }
+
+
+def grade_answers(questions: dict, answers, states: dict = None):
+    """
+    Corrige um lote de respostas (question_id, índice da alternativa) pelo
+    gabarito do exame. Atualiza `states` (estado de correção das questões) e
+    devolve (resultados por questão, resumo com a nota).
+    """
+    states = states if states is not None else {key: question_state(q) for key, q in questions.items()}
+    results, seen = [], set()
+
+    for question_id, option_index in answers:
+        question = questions.get(question_id)
+        if question is None:
+            results.append({"question_id": question_id, "error": "Questão não encontrada no exame."})
+            continue
+        if question_id in seen:
+            results.append({"question_id": question_id, "error": "Questão respondida mais de uma vez."})
+            continue
+        options = question.get("options", [])
+        if not 0 <= option_index < len(options):
+            results.append({"question_id": question_id, "error": f"Alternativa {option_index} inexistente."})
+            continue
+        seen.add(question_id)
+
+        correct_index = next((i for i, opt in enumerate(options) if opt.get("is_correct", False)), None)
+        chosen = options[option_index]
+        is_correct = option_index == correct_index
+        result = {
+            "question_id": question_id,
+            "option_index": option_index,
+            "is_correct": is_correct,
+            "correct_index": correct_index,
+            "explanation": chosen.get("explanation", "Explicação não disponível.")
+        }
+        if not is_correct and correct_index is not None:
+            result["explanation_correct"] = options[correct_index].get("explanation", "Explicação não disponível.")
+        results.append(result)
+
+        state = states.get(question_id) or question_state(question)
+        state["chosen_option"] = chosen["option"].strip()
+        state["is_correct"] = is_correct
+        states[question_id] = state
+
+    # A nota considera o exame inteiro, inclusive respostas de envios anteriores
+    total = len(questions)
+    correct = sum(1 for key in questions if states.get(key, {}).get("is_correct"))
+    answered = sum(1 for key in questions if states.get(key, {}).get("chosen_option"))
+    summary = {
+        "total_questions": total,
+        "answered": answered,
+        "correct": correct,
+        "score": round(correct / total, 4) if total else 0.0,
+        "percentage": round(100 * correct / total, 1) if total else 0.0
+    }
+    return results, summary
+
+
+class ExamSessionStore(ABC):
+    """
+    Estado das respostas por exame: {exam_id: {question_id: estado}}.
+    Sessões expiram `ttl` segundos após a última escrita.
+    """
+
+    def __init__(self, ttl: float = EXAM_SESSION_TTL):
+        self.ttl = ttl
+        self.last_purge = time.monotonic()
+
+    def create(self, questions: dict, exam_id: str = None):
+        """Registra um novo exame e devolve o exam_id."""
+        exam_id = exam_id or uuid.uuid4().hex
+        self.save(exam_id, {key: question_state(q) for key, q in questions.items()})
+        # Limpeza periódica das sessões expiradas
+        if time.monotonic() - self.last_purge > 60:
+            self.last_purge = time.monotonic()
+            self.purge_expired()
+        return exam_id
+
+    @abstractmethod
+    def save(self, exam_id: str, states: dict):
+        """Grava (ou substitui) a sessão inteira do exame e renova o prazo."""
+
+    @abstractmethod
+    def get(self, exam_id: str):
+        """Todas as questões do exame, ou None se não existir/expirou."""
+
+    @abstractmethod
+    def get_question(self, exam_id: str, question_id: str):
+        """Estado de uma questão, ou None se a sessão ou a questão não existir."""
+
+    @abstractmethod
+    def set_question(self, exam_id: str, question_id: str, state: dict):
+        """Grava o estado de uma questão; False se a sessão não existir."""
+
+    @abstractmethod
+    def update_questions(self, exam_id: str, states: dict):
+        """Grava só as questões informadas, numa única operação; False se a sessão não existir."""
+
+    @abstractmethod
+    def purge_expired(self):
+        """Remove as sessões vencidas."""
+
+
+class MemorySessionStore(ExamSessionStore):
+    """Backend padrão: dicionário em memória do processo."""
+
+    def __init__(self, ttl: float = EXAM_SESSION_TTL):
+        super().__init__(ttl)
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def _alive(self, exam_id):
+        session = self.sessions.get(exam_id)
+        if session is None:
+            return None
+        if session["expires_at"] < time.monotonic():
+            del self.sessions[exam_id]
+            return None
+        return session
+
+    def save(self, exam_id, states):
+        with self.lock:
+            self.sessions[exam_id] = {
+                "expires_at": time.monotonic() + self.ttl,
+                "questions": {key: dict(state) for key, state in states.items()}
+            }
+
+    def get(self, exam_id):
+        with self.lock:
+            session = self._alive(exam_id)
+            if session is None:
+                return None
+            return {key: dict(state) for key, state in session["questions"].items()}
+
+    def get_question(self, exam_id, question_id):
+        with self.lock:
+            session = self._alive(exam_id)
+            state = session["questions"].get(question_id) if session else None
+            return dict(state) if state else None
+
+    def set_question(self, exam_id, question_id, state):
+        with self.lock:
+            session = self._alive(exam_id)
+            if session is None:
+                return False
+            session["questions"][question_id] = dict(state)
+            session["expires_at"] = time.monotonic() + self.ttl
+            return True
+
+    def update_questions(self, exam_id, states):
+        with self.lock:
+            session = self._alive(exam_id)
+            if session is None:
+                return False
+            session["questions"].update({key: dict(state) for key, state in states.items()})
+            session["expires_at"] = time.monotonic() + self.ttl
+            return True
+
+    def purge_expired(self):
+        now = time.monotonic()
+        with self.lock:
+            for exam_id in [k for k, v in self.sessions.items() if v["expires_at"] < now]:
+                del self.sessions[exam_id]
+
+
+class SQLiteSessionStore(ExamSessionStore):
+    """Backend persistente: sobrevive a reinícios e é compartilhado entre workers."""
+
+    def __init__(self, path: str = EXAM_SESSION_DB_PATH, ttl: float = EXAM_SESSION_TTL):
+        super().__init__(ttl)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "exam_id TEXT PRIMARY KEY, expires_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at);"
+            "CREATE TABLE IF NOT EXISTS session_questions ("
+            "exam_id TEXT NOT NULL, question_id TEXT NOT NULL, state TEXT NOT NULL, "
+            "PRIMARY KEY (exam_id, question_id));"
+        )
+        self.conn.commit()
+
+    def save(self, exam_id, states):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sessions (exam_id, expires_at) VALUES (?, ?)",
+                (exam_id, time.time() + self.ttl)
+            )
+            self.conn.execute("DELETE FROM session_questions WHERE exam_id = ?", (exam_id,))
+            self.conn.executemany(
+                "INSERT INTO session_questions (exam_id, question_id, state) VALUES (?, ?, ?)",
+                [(exam_id, key, json.dumps(state, ensure_ascii=False)) for key, state in states.items()]
+            )
+            self.conn.commit()
+
+    def _alive(self, exam_id):
+        row = self.conn.execute(
+            "SELECT expires_at FROM sessions WHERE exam_id = ?", (exam_id,)
+        ).fetchone()
+        return row is not None and row[0] >= time.time()
+
+    def get(self, exam_id):
+        with self.lock:
+            if not self._alive(exam_id):
+                return None
+            rows = self.conn.execute(
+                "SELECT question_id, state FROM session_questions WHERE exam_id = ? ORDER BY rowid",
+                (exam_id,)
+            ).fetchall()
+        return {key: json.loads(state) for key, state in rows}
+
+    def get_question(self, exam_id, question_id):
+        with self.lock:
+            if not self._alive(exam_id):
+                return None
+            row = self.conn.execute(
+                "SELECT state FROM session_questions WHERE exam_id = ? AND question_id = ?",
+                (exam_id, question_id)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_question(self, exam_id, question_id, state):
+        with self.lock:
+            if not self._alive(exam_id):
+                return False
+            self.conn.execute(
+                "INSERT OR REPLACE INTO session_questions (exam_id, question_id, state) VALUES (?, ?, ?)",
+                (exam_id, question_id, json.dumps(state, ensure_ascii=False))
+            )
+            self.conn.execute(
+                "UPDATE sessions SET expires_at = ? WHERE exam_id = ?",
+                (time.time() + self.ttl, exam_id)
+            )
+            self.conn.commit()
+        return True
+
+    def update_questions(self, exam_id, states):
+        with self.lock:
+            if not self._alive(exam_id):
+                return False
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO session_questions (exam_id, question_id, state) VALUES (?, ?, ?)",
+                    [(exam_id, key, json.dumps(state, ensure_ascii=False)) for key, state in states.items()]
+                )
+                self.conn.execute(
+                    "UPDATE sessions SET expires_at = ? WHERE exam_id = ?",
+                    (time.time() + self.ttl, exam_id)
+                )
+        return True
+
+    def purge_expired(self):
+        with self.lock:
+            now = time.time()
+            self.conn.execute(
+                "DELETE FROM session_questions WHERE exam_id IN "
+                "(SELECT exam_id FROM sessions WHERE expires_at < ?)", (now,)
+            )
+            self.conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,))
+            self.conn.commit()
+
+
+def create_session_store(backend: str = EXAM_SESSION_BACKEND):
+    """Escolhe o backend pela variável EXAM_SESSION_BACKEND ("memory" ou "sqlite")."""
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    if backend == "memory":
+        return MemorySessionStore()
+    raise ValueError(f"EXAM_SESSION_BACKEND inválido: {backend}")
+
+
+_session_store = None
+_session_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """Instância única do backend de sessões, criada no primeiro uso."""
+    global _session_store
+    with _session_store_lock:
+        if _session_store is None:
+            _session_store = create_session_store()
+    return _session_store
@@ -0,0 +1,248 @@
+import os
+import time
+import json
+import uuid
+import queue
+import sqlite3
+import threading
+from app.ingestion import IngestCancelled, IngestProgress
+
+
+INGEST_JOBS_DB_PATH = os.getenv("INGEST_JOBS_DB_PATH", "./data/ingest_jobs.sqlite")
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class IngestJobStore:
+    """Jobs de vetorização persistidos em SQLite: sobrevivem a reinícios do servidor."""
+
+    def __init__(self, path: str = INGEST_JOBS_DB_PATH):
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        conn = self._conn()
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS ingest_jobs ("
+            "job_id TEXT PRIMARY KEY, status TEXT NOT NULL, created_at REAL NOT NULL, "
+            "started_at REAL, finished_at REAL, cancel_requested INTEGER NOT NULL DEFAULT 0, "
+            "progress TEXT, result TEXT, error TEXT, params TEXT);"
+            "CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs(status);"
+        )
+        # Bases criadas antes dos parâmetros por job
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(ingest_jobs)")]
+        if "params" not in columns:
+            conn.execute("ALTER TABLE ingest_jobs ADD COLUMN params TEXT")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+    def create(self, params: dict = None):
+        job_id = uuid.uuid4().hex
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO ingest_jobs (job_id, status, created_at, params) VALUES (?, 'queued', ?, ?)",
+                (job_id, time.time(), json.dumps(params or {}, ensure_ascii=False))
+            )
+        return job_id
+
+    def update(self, job_id: str, **fields):
+        for key in ("progress", "result", "params"):
+            if key in fields:
+                fields[key] = json.dumps(fields[key], ensure_ascii=False)
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                f"UPDATE ingest_jobs SET {', '.join(f'{key} = ?' for key in fields)} WHERE job_id = ?",
+                (*fields.values(), job_id)
+            )
+
+    def get(self, job_id: str):
+        conn = self._conn()
+        conn.row_factory = sqlite3.Row
+        row = conn.execute("SELECT * FROM ingest_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        conn.row_factory = None
+        if row is None:
+            return None
+        job = dict(row)
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        for key in ("progress", "result", "params"):
+            job[key] = json.loads(job[key]) if job[key] else None
+        return job
+
+    def list(self, limit: int = 20):
+        rows = self._conn().execute(
+            "SELECT job_id FROM ingest_jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [self.get(row[0]) for row in rows]
+
+    def active(self, status: str = None):
+        """IDs dos jobs na fila/em execução, do mais antigo para o mais novo."""
+        statuses = (status,) if status else ACTIVE_STATUSES
+        rows = self._conn().execute(
+            f"SELECT job_id FROM ingest_jobs WHERE status IN ({','.join('?' * len(statuses))}) "
+            "ORDER BY created_at",
+            statuses
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def cancel_requested(self, job_id: str):
+        row = self._conn().execute(
+            "SELECT cancel_requested FROM ingest_jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return bool(row and row[0])
+
+
+class JobProgress(IngestProgress):
+    """Andamento de um job: por arquivo, chunks, vazão e erros; gravado no SQLite."""
+
+    def __init__(self, store: IngestJobStore, job_id: str):
+        self.store = store
+        self.job_id = job_id
+        self.started = time.monotonic()
+        self.last_saved = 0.0
+        self.data = {
+            "files_total": 0,
+            "files_done": 0,
+            "files_failed": 0,
+            "files_removed": 0,
+            "chunks_added": 0,
+            "chunks_per_sec": 0.0,
+            "elapsed_seconds": 0.0,
+            "files": {},
+            "errors": {}
+        }
+
+    def save(self, force: bool = False):
+        # Lotes frequentes: grava no máximo uma vez por segundo
+        now = time.monotonic()
+        if not force and now - self.last_saved < 1.0:
+            return
+        self.last_saved = now
+        elapsed = now - self.started
+        self.data["elapsed_seconds"] = round(elapsed, 2)
+        self.data["chunks_per_sec"] = round(self.data["chunks_added"] / elapsed, 2) if elapsed else 0.0
+        self.store.update(self.job_id, progress=self.data)
+
+    def start(self, files_to_index, files_removed):
+        self.data["files_total"] = len(files_to_index)
+        self.data["files_removed"] = len(files_removed)
+        self.data["files"] = {path: {"status": "pending", "chunks": 0} for path in files_to_index}
+        self.save(force=True)
+
+    def file_done(self, file_path, n_chunks):
+        self.data["files_done"] += 1
+        self.data["files"][file_path] = {"status": "done", "chunks": n_chunks}
+        self.save(force=True)
+
+    def file_failed(self, file_path, error):
+        self.data["files_failed"] += 1
+        self.data["files"][file_path] = {"status": "failed", "chunks": 0}
+        self.data["errors"][file_path] = error
+        self.save(force=True)
+
+    def chunks_written(self, n_chunks):
+        self.data["chunks_added"] += n_chunks
+        self.save()
+
+    def check_cancelled(self):
+        if self.store.cancel_requested(self.job_id):
+            raise IngestCancelled()
+
+
+class IngestJobQueue:
+    """
+    Fila de vetorização com um único worker (a coleção e o manifesto não
+    aceitam duas sincronizações ao mesmo tempo). `runner(progress, **params)`
+    faz o trabalho e devolve o resultado gravado no job.
+    """
+
+    def __init__(self, runner, store: IngestJobStore = None):
+        self.runner = runner
+        self._store = store
+        self._store_lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def store(self):
+        """O SQLite dos jobs só é aberto no primeiro uso (não na importação)."""
+        if self._store is None:
+            with self._store_lock:
+                if self._store is None:
+                    self._store = IngestJobStore()
+        return self._store
+
+    def start(self):
+        """Inicia o worker e retoma os jobs interrompidos por um reinício."""
+        with self.lock:
+            if self.thread is not None:
+                return
+            # O manifesto torna a retomada barata: só o que faltou é refeito
+            for job_id in self.store.active():
+                self.store.update(job_id, status="queued")
+                self.queue.put(job_id)
+            self.thread = threading.Thread(target=self._work, name="ingest-jobs", daemon=True)
+            self.thread.start()
+
+    def submit(self, params: dict = None):
+        """
+        Enfileira uma vetorização. Um job completo do mesmo curso que ainda
+        nem começou já cobre qualquer pedido novo e é reaproveitado.
+        """
+        self.start()
+        course = (params or {}).get("course")
+        with self.lock:
+            for job_id in self.store.active("queued"):
+                queued = self.store.get(job_id)["params"] or {}
+                if "file_paths" not in queued and queued.get("course") == course:
+                    return job_id
+            job_id = self.store.create(params)
+            self.queue.put(job_id)
+            return job_id
+
+    def active_for(self, course: str = None):
+        """Jobs na fila/em execução do curso."""
+        return [
+            job_id for job_id in self.store.active()
+            if (self.store.get(job_id)["params"] or {}).get("course") == course
+        ]
+
+    def cancel(self, job_id: str):
+        job = self.store.get(job_id)
+        if job is None or job["status"] not in ACTIVE_STATUSES:
+            return job
+        self.store.update(job_id, cancel_requested=1)
+        if job["status"] == "queued":
+            self.store.update(job_id, status="cancelled", finished_at=time.time())
+        return self.store.get(job_id)
+
+    def _work(self):
+        while True:
+            job_id = self.queue.get()
+            job = self.store.get(job_id)
+            if job is None or job["status"] != "queued":
+                continue
+
+            self.store.update(job_id, status="running", started_at=time.time())
+            progress = JobProgress(self.store, job_id)
+            try:
+                result = self.runner(progress, **(job["params"] or {}))
+            except IngestCancelled:
+                progress.save(force=True)
+                self.store.update(job_id, status="cancelled", finished_at=time.time())
+            except Exception as e:
+                print(f"⚠️ Erro no job de vetorização {job_id}: {e}")
+                progress.save(force=True)
+                self.store.update(job_id, status="failed", error=str(e), finished_at=time.time())
+            else:
+                progress.save(force=True)
+                self.store.update(job_id, status="completed", result=result, finished_at=time.time())
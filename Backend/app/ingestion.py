@@ -0,0 +1,349 @@
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+import importlib
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from app.manifest import chunk_ids
+from app.metrics import ingest_files_total, loader_parse_seconds, span, split_seconds
+
+
+# Paralelismo do parse (processos) e tamanho dos lotes enviados ao Chroma
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", os.cpu_count() or 1))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+MAX_PENDING_FILES = INGEST_WORKERS * 2
+
+text_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=1000,
+    chunk_overlap=100,
+    length_function=len,
+    add_start_index=True
+)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class IngestCancelled(Exception):
+    """A ingestão foi cancelada entre dois lotes."""
+
+
+class IngestProgress:
+    """
+    Acompanhamento da ingestão (sem efeito por padrão). Os jobs de
+    vetorização sobrescrevem os métodos para registrar o andamento e
+    `check_cancelled` para interromper o trabalho.
+    """
+
+    def start(self, files_to_index, files_removed):
+        pass
+
+    def file_done(self, file_path, n_chunks):
+        pass
+
+    def file_failed(self, file_path, error):
+        pass
+
+    def chunks_written(self, n_chunks):
+        pass
+
+    def check_cancelled(self):
+        pass
+
+
+def get_pool():
+    """
+    Pool de processos compartilhado entre as chamadas de ingestão. Os
+    processos são criados com "spawn": um fork copiaria as threads e os
+    locks do servidor (Chroma, SQLite, clientes HTTP) no meio do uso.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=INGEST_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def reset_pool(broken):
+    """Descarta o pool quebrado (um processo morreu) e devolve um novo."""
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+    return get_pool()
+
+
+def shutdown_pool():
+    """Encerra o pool de processos (no desligamento da aplicação)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+# Extensão -> (módulo, classe, kwargs). Os loaders (e a pilha do Unstructured)
+# só são importados quando aparece um arquivo daquele tipo.
+LOADERS = {
+    "md": ("langchain_community.document_loaders.markdown", "UnstructuredMarkdownLoader", {"languages": ["por"]}),
+    "markdown": ("langchain_community.document_loaders.markdown", "UnstructuredMarkdownLoader", {"languages": ["por"]}),
+    "txt": ("langchain_community.document_loaders.text", "TextLoader", {}),
+    "csv": ("langchain_community.document_loaders.text", "TextLoader", {}),
+    "json": ("langchain_community.document_loaders.text", "TextLoader", {}),
+    "docx": ("langchain_community.document_loaders.word_document", "UnstructuredWordDocumentLoader", {"languages": ["por"]}),
+    "doc": ("langchain_community.document_loaders.word_document", "UnstructuredWordDocumentLoader", {"languages": ["por"]}),
+    "pdf": ("langchain_community.document_loaders.pdf", "UnstructuredPDFLoader", {"languages": ["por"]}),
+}
+DEFAULT_LOADER = ("langchain_community.document_loaders.unstructured", "UnstructuredFileLoader", {"languages": ["por"]})
+
+
+def file_type(file_path: str):
+    return file_path.lower().split(".")[-1] if "." in os.path.basename(file_path) else "other"
+
+
+def get_loader(file_path: str):
+    """Escolhe o loader adequado pela extensão do arquivo."""
+    ext = file_type(file_path)
+    module_name, class_name, kwargs = LOADERS.get(ext, DEFAULT_LOADER)
+    loader_class = getattr(importlib.import_module(module_name), class_name)
+    return loader_class(file_path, **kwargs)
+
+
+def load_and_split(file_path: str):
+    """
+    Executado nos processos do pool: carrega um arquivo e devolve seus
+    chunks e os tempos de parse e split (as métricas ficam no processo principal).
+    """
+    started = time.perf_counter()
+    loaded_docs = get_loader(file_path).load()
+    for d in loaded_docs:
+        d.metadata["source"] = file_path
+    loaded = time.perf_counter()
+    chunks = text_splitter.split_documents(loaded_docs)
+    return chunks, loaded - started, time.perf_counter() - loaded
+
+
+def iter_file_chunks(file_paths):
+    """
+    Faz o parse dos arquivos em paralelo e devolve (caminho, chunks, erro)
+    à medida que cada arquivo termina. No máximo MAX_PENDING_FILES arquivos
+    ficam em andamento, o que mantém a memória limitada. Se um processo do
+    pool morrer, o pool é recriado e cada arquivo afetado é tentado mais uma vez.
+    """
+    pool = get_pool()
+    paths = iter(file_paths)
+    pending = {}
+    retried = set()
+
+    def submit(path):
+        nonlocal pool
+        try:
+            pending[pool.submit(load_and_split, path)] = path
+        except BrokenProcessPool:
+            pool = reset_pool(pool)
+            pending[pool.submit(load_and_split, path)] = path
+
+    def submit_next():
+        path = next(paths, None)
+        if path is not None:
+            submit(path)
+
+    for _ in range(MAX_PENDING_FILES):
+        submit_next()
+
+    try:
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                submit_next()
+                try:
+                    chunks, parse_time, split_time = future.result()
+                except BrokenProcessPool as e:
+                    if path not in retried:
+                        retried.add(path)
+                        submit(path)
+                        continue
+                    ingest_files_total.inc(file_type=file_type(path), result="failed")
+                    yield path, [], e
+                except Exception as e:
+                    ingest_files_total.inc(file_type=file_type(path), result="failed")
+                    yield path, [], e
+                else:
+                    loader_parse_seconds.observe(parse_time, file_type=file_type(path))
+                    split_seconds.observe(split_time, file_type=file_type(path))
+                    ingest_files_total.inc(file_type=file_type(path), result="loaded")
+                    yield path, chunks, None
+    finally:
+        # Interrompido (ex.: cancelamento): descarta os arquivos ainda na fila
+        for future in pending:
+            future.cancel()
+
+
+def ingest_files(db, file_paths, make_ids=None, on_file_done=None, on_batch=None,
+                 on_file_failed=None, batch_size: int = EMBED_BATCH_SIZE):
+    """
+    Pipeline de ingestão: parse paralelo -> split -> embedding/upsert no
+    Chroma em lotes de `batch_size` chunks.
+
+    `make_ids(caminho, n)` gera os IDs dos chunks de um arquivo,
+    `on_batch(chunks, ids)` recebe cada lote gravado e
+    `on_file_done(caminho, ids)` é chamado quando todos os chunks daquele
+    arquivo já foram gravados no Chroma e `on_file_failed(caminho, erro)`
+    quando o parse do arquivo falha.
+    """
+    result = {"files_loaded": [], "files_failed": {}, "chunks_added": 0}
+    batch, batch_ids = [], []
+    waiting = []
+
+    def flush():
+        written = (list(batch), list(batch_ids))
+        if batch:
+            # Inclui o embedding do lote (os vetores do cache não chamam a API)
+            with span("chroma_add"):
+                db.add_documents(batch, ids=batch_ids if make_ids else None)
+            result["chunks_added"] += len(batch)
+            batch.clear()
+            batch_ids.clear()
+        # Arquivos cujos chunks entraram por completo nos lotes já gravados
+        if on_file_done:
+            for file_path, ids in waiting:
+                on_file_done(file_path, ids)
+        waiting.clear()
+        # Por último: on_batch pode interromper a ingestão (cancelamento)
+        if written[0] and on_batch:
+            on_batch(*written)
+
+    for file_path, chunks, error in iter_file_chunks(file_paths):
+        if error is not None:
+            print(f"⚠️ Erro ao carregar {os.path.basename(file_path)}: {error}")
+            result["files_failed"][file_path] = str(error)
+            if on_file_failed:
+                on_file_failed(file_path, str(error))
+            continue
+
+        result["files_loaded"].append(file_path)
+        ids = make_ids(file_path, len(chunks)) if make_ids else []
+        for i, chunk in enumerate(chunks):
+            batch.append(chunk)
+            if make_ids:
+                batch_ids.append(ids[i])
+            if len(batch) >= batch_size:
+                flush()
+        waiting.append((file_path, ids))
+
+    flush()
+    return result
+
+
+def list_documents(documents_path: str):
+    """Todos os arquivos dentro da pasta de documentos."""
+    paths = []
+    for root, _, files in os.walk(documents_path):
+        for filename in files:
+            paths.append(os.path.join(root, filename))
+    return paths
+
+
+def rebuild_bm25(db, bm25_index, batch_size: int = 1000):
+    """Reconstrói o índice BM25 a partir dos textos já gravados no Chroma."""
+    bm25_index.clear()
+    total = db._collection.count()
+    for offset in range(0, total, batch_size):
+        data = db._collection.get(include=["documents"], limit=batch_size, offset=offset)
+        bm25_index.add(data["ids"], data["documents"])
+    bm25_index.save()
+
+
+def update_index(db, documents_path: str, manifest, bm25_index=None, progress=None, file_paths=None):
+    """
+    Sincroniza a coleção com a pasta de documentos usando o manifesto:
+    vetoriza arquivos novos, revetoriza os alterados e remove os chunks
+    de arquivos apagados. O manifesto é salvo a cada arquivo concluído.
+    Se informado, o índice BM25 acompanha as mesmas inclusões e remoções.
+
+    `progress` (IngestProgress) recebe o andamento; um cancelamento
+    interrompe entre lotes e o que já foi concluído fica no manifesto.
+    Com `file_paths`, sincroniza só esses arquivos (ex.: recém-enviados)
+    e não procura arquivos removidos.
+    """
+    progress = progress or IngestProgress()
+    if not manifest.exists() and db._collection.count() > 0:
+        manifest.seed_from_collection(db)
+        manifest.save()
+
+    # Índice léxico ausente ou fora de sincronia (ex.: interrupção no meio da ingestão)
+    if bm25_index is not None:
+        indexed = sum(len(entry["ids"]) for entry in manifest.entries.values())
+        if bm25_index.count() != indexed:
+            rebuild_bm25(db, bm25_index)
+
+    if file_paths is None:
+        new, changed, unchanged, removed = manifest.diff(list_documents(documents_path))
+    else:
+        new, changed, unchanged, _ = manifest.diff([p for p in file_paths if os.path.isfile(p)])
+        removed = []
+    progress.start([p for p, *_ in new + changed], removed)
+
+    removed_ids, added_ids = [], []
+    for file_path in removed:
+        entry = manifest.remove(file_path)
+        if entry and entry["ids"]:
+            db.delete(ids=entry["ids"])
+            removed_ids.extend(entry["ids"])
+
+    # Chunks antigos de arquivos alterados saem antes da nova versão entrar
+    for file_path, *_ in changed:
+        entry = manifest.entries.get(file_path)
+        if entry and entry["ids"]:
+            db.delete(ids=entry["ids"])
+            removed_ids.extend(entry["ids"])
+            entry["ids"] = []
+
+    manifest.save()
+    if bm25_index is not None and removed_ids:
+        bm25_index.remove(removed_ids)
+
+    to_index = {file_path: (size, mtime, sha) for file_path, size, mtime, sha in new + changed}
+
+    def make_ids(file_path, n):
+        return chunk_ids(file_path, to_index[file_path][2], n)
+
+    def on_file_done(file_path, ids):
+        size, mtime, sha = to_index[file_path]
+        manifest.record(file_path, size, mtime, sha, ids)
+        manifest.save()
+        added_ids.extend(ids)
+        progress.file_done(file_path, len(ids))
+
+    def on_batch(chunks, ids):
+        if bm25_index is not None:
+            bm25_index.add(ids, [chunk.page_content for chunk in chunks])
+        progress.chunks_written(len(chunks))
+        progress.check_cancelled()
+
+    try:
+        result = ingest_files(
+            db, list(to_index), make_ids=make_ids, on_file_done=on_file_done,
+            on_batch=on_batch, on_file_failed=progress.file_failed
+        )
+    finally:
+        if bm25_index is not None and (added_ids or removed_ids):
+            bm25_index.save()
+
+    return {
+        "documents_new": [p for p, *_ in new],
+        "documents_changed": [p for p, *_ in changed],
+        "documents_removed": removed,
+        "documents_unchanged": unchanged,
+        "documents_failed": result["files_failed"],
+        "chunks_added": result["chunks_added"],
+        "chunks_removed": len(removed_ids),
+        "chunk_ids_added": added_ids,
+        "chunk_ids_removed": removed_ids
+    }
@@ -0,0 +1,405 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from app.metrics import GaugeFunction
+
+
+LLM_RATE_PER_SEC = float(os.getenv("LLM_RATE_PER_SEC", "10"))
+LLM_BURST = int(os.getenv("LLM_BURST", "20"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "90"))
+# Pedido "hedge": uma segunda chamada quando a primeira passa do p95
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "8"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+EMBEDDING_RATE_PER_SEC = float(os.getenv("EMBEDDING_RATE_PER_SEC", "20"))
+EMBEDDING_BURST = int(os.getenv("EMBEDDING_BURST", "20"))
+# Preenchimento do banco de questões: cliente próprio, com taxa menor
+BANK_RATE_PER_SEC = float(os.getenv("BANK_RATE_PER_SEC", "2"))
+BANK_BURST = int(os.getenv("BANK_BURST", "4"))
+
+# Códigos HTTP transitórios (google.api_core e google.genai expõem `code`; httpx, `status_code`)
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RATE_LIMITED_STATUS = {429}
+# Exceções de transporte pelo nome da classe, sem importar httpx/google-api-core aqui
+RETRYABLE_TYPES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "BadGateway", "GatewayTimeout", "DeadlineExceeded", "TimeoutException", "NetworkError",
+    "RemoteProtocolError"
+}
+RATE_LIMITED_TYPES = {"ResourceExhausted", "TooManyRequests"}
+
+
+class CircuitOpenError(Exception):
+    """O provedor está falhando seguidamente; as chamadas estão suspensas."""
+
+
+def error_chain(error: Exception):
+    """A exceção e as que ela encapsula (o LangChain relança os erros do SDK com `from e`)."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def status_code(error: Exception):
+    """Código HTTP da exceção, se ela trouxer um."""
+    for value in (getattr(error, "status_code", None), getattr(error, "code", None),
+                  getattr(getattr(error, "response", None), "status_code", None)):
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+    return None
+
+
+def type_names(error: Exception):
+    return {cls.__name__ for cls in type(error).__mro__}
+
+
+def is_retryable(error: Exception):
+    """Erros transitórios (429, timeouts, 5xx, conexão) valem nova tentativa."""
+    for e in error_chain(error):
+        if isinstance(e, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+            return True
+        if status_code(e) in RETRYABLE_STATUS or type_names(e) & RETRYABLE_TYPES:
+            return True
+    return False
+
+
+def is_rate_limited(error: Exception):
+    return any(
+        status_code(e) in RATE_LIMITED_STATUS or type_names(e) & RATE_LIMITED_TYPES
+        for e in error_chain(error)
+    )
+
+
+def backoff_delay(attempt: int):
+    """Full jitter: aleatório entre 0 e base * 2^tentativa (com teto)."""
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+
+class TokenBucket:
+    """Limita a taxa de chamadas: `rate` por segundo com rajadas de até `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _reserve(self):
+        """Consome um token e devolve quanto esperar até ele estar disponível."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self):
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+
+class CircuitBreaker:
+    """
+    Abre após `failure_threshold` falhas seguidas; depois de `reset_timeout`
+    deixa passar uma chamada de teste (meio-aberto) antes de fechar de novo.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """Libera a chamada; True se ela é a chamada de teste do estado meio-aberto."""
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return False
+            if state == "half_open" and not self.probing:
+                self.probing = True
+                return True
+        raise CircuitOpenError("Serviço de IA indisponível no momento. Tente novamente em instantes.")
+
+    def end_probe(self):
+        """Libera a vaga de teste; chamado sempre no `finally` da chamada de teste."""
+        with self.lock:
+            self.probing = False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+class LatencyTracker:
+    """Janela das últimas latências para percentis (p50/p95/p99)."""
+
+    def __init__(self, window: int = 500):
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def count(self):
+        return len(self.samples)
+
+    def percentile(self, p: float):
+        with self.lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+class ResilientClient:
+    """
+    Camada comum às chamadas de um provedor de IA: token bucket, backoff
+    exponencial com jitter para erros transitórios, circuit breaker,
+    hedge opcional (só nas chamadas async) e métricas.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int, max_retries: int = LLM_MAX_RETRIES,
+                 hedge: bool = False):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+        self.latency = LatencyTracker()
+        self.max_retries = max_retries
+        self.hedge = hedge
+        self.lock = threading.Lock()
+        self.counters = {
+            "calls": 0, "successes": 0, "failures": 0, "retries": 0, "rate_limited": 0,
+            "short_circuited": 0, "hedges": 0, "hedge_wins": 0, "throttled_seconds": 0.0
+        }
+
+    def _count(self, key, value=1):
+        with self.lock:
+            self.counters[key] += value
+
+    def _backoff(self, attempt: int):
+        return backoff_delay(attempt)
+
+    def _allow(self):
+        """Consulta o breaker; True se a chamada é a de teste (meio-aberto)."""
+        try:
+            return self.breaker.allow()
+        except CircuitOpenError:
+            self._count("short_circuited")
+            raise
+
+    def _failed(self, error, attempt, probe=False, max_retries=None):
+        """
+        Registra a falha; True se deve tentar de novo. A chamada de teste
+        nunca é repetida: o resultado dela decide o estado do breaker.
+        """
+        if is_rate_limited(error):
+            self._count("rate_limited")
+        max_retries = self.max_retries if max_retries is None else max_retries
+        retry = not probe and is_retryable(error) and attempt < max_retries
+        if retry:
+            self._count("retries")
+        else:
+            self._count("failures")
+            # Erro do próprio pedido (400, bloqueio de segurança) não indica
+            # serviço fora do ar: não abre o breaker para os demais usuários
+            if probe or is_retryable(error):
+                self.breaker.record_failure()
+        return retry
+
+    def _succeeded(self, started):
+        self.latency.add(time.monotonic() - started)
+        self._count("successes")
+        self.breaker.record_success()
+
+    def call(self, fn, *args, **kwargs):
+        """Chamada síncrona com limite de taxa, novas tentativas e breaker."""
+        self._count("calls")
+        for attempt in range(self.max_retries + 1):
+            probe = self._allow()
+            try:
+                self._count("throttled_seconds", self.bucket.acquire())
+                started = time.monotonic()
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not self._failed(e, attempt, probe):
+                    raise
+            else:
+                self._succeeded(started)
+                return result
+            finally:
+                if probe:
+                    self.breaker.end_probe()
+            time.sleep(self._backoff(attempt))
+
+    async def acall(self, make_coro, max_retries: int = None):
+        """
+        Versão async; `make_coro()` cria uma nova corrotina a cada tentativa.
+        Com hedge ativo, se a chamada passar do p95 observado, uma segunda
+        é disparada e vale a que terminar primeiro. `max_retries=0` deixa as
+        novas tentativas para quem chama (que já tem a sua própria camada).
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        self._count("calls")
+        for attempt in range(max_retries + 1):
+            probe = self._allow()
+            try:
+                self._count("throttled_seconds", await self.bucket.aacquire())
+                started = time.monotonic()
+                result = await self._hedged(make_coro)
+            except Exception as e:
+                if not self._failed(e, attempt, probe, max_retries):
+                    raise
+            else:
+                self._succeeded(started)
+                return result
+            finally:
+                if probe:
+                    self.breaker.end_probe()
+            await asyncio.sleep(self._backoff(attempt))
+
+    async def _hedged(self, make_coro):
+        p95 = self.latency.percentile(95)
+        if not self.hedge or p95 is None or self.latency.count() < LLM_HEDGE_MIN_SAMPLES:
+            return await make_coro()
+
+        primary = asyncio.ensure_future(make_coro())
+        pending = {primary}
+        error = None
+        try:
+            # Cancelamento de quem chama também cancela as chamadas em andamento
+            done, _ = await asyncio.wait(pending, timeout=p95)
+            if done:
+                return primary.result()
+
+            self._count("hedges")
+            await self.bucket.aacquire()
+            backup = asyncio.ensure_future(make_coro())
+            pending.add(backup)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def astream(self, make_stream):
+        """
+        Stream com as mesmas proteções; só há nova tentativa se a falha
+        acontecer antes do primeiro pedaço ter sido entregue.
+        """
+        self._count("calls")
+        for attempt in range(self.max_retries + 1):
+            probe = self._allow()
+            delivered = False
+            try:
+                self._count("throttled_seconds", await self.bucket.aacquire())
+                async for item in make_stream():
+                    delivered = True
+                    yield item
+            except Exception as e:
+                if delivered:
+                    self._count("failures")
+                    self.breaker.record_failure()
+                    raise
+                if not self._failed(e, attempt, probe):
+                    raise
+            else:
+                self._count("successes")
+                self.breaker.record_success()
+                return
+            finally:
+                if probe:
+                    self.breaker.end_probe()
+            await asyncio.sleep(self._backoff(attempt))
+
+    def stats(self):
+        def ms(value):
+            return round(value * 1000, 1) if value is not None else None
+
+        with self.lock:
+            counters = dict(self.counters)
+        counters["throttled_seconds"] = round(counters["throttled_seconds"], 3)
+        return {
+            **counters,
+            "circuit": self.breaker.state,
+            "latency_ms": {
+                "p50": ms(self.latency.percentile(50)),
+                "p95": ms(self.latency.percentile(95)),
+                "p99": ms(self.latency.percentile(99))
+            }
+        }
+
+
+chat_client = ResilientClient("chat", LLM_RATE_PER_SEC, LLM_BURST, hedge=LLM_HEDGE_ENABLED)
+embedding_client = ResilientClient("embeddings", EMBEDDING_RATE_PER_SEC, EMBEDDING_BURST)
+# Os 429 das chamadas em massa do banco não abrem o breaker das chamadas interativas
+bank_client = ResilientClient("bank", BANK_RATE_PER_SEC, BANK_BURST)
+CLIENTS = (chat_client, embedding_client, bank_client)
+
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+def _client_counters():
+    return {
+        (client.name, key): value
+        for client in CLIENTS
+        for key, value in client.stats().items()
+        if isinstance(value, (int, float))
+    }
+
+
+GaugeFunction(
+    "examforge_client_events", "Chamadas, falhas, novas tentativas e hedges dos clientes do Gemini.",
+    _client_counters, ("client", "event")
+)
+GaugeFunction(
+    "examforge_circuit_state", "Estado do circuit breaker (0 fechado, 1 meio aberto, 2 aberto).",
+    lambda: {(client.name,): CIRCUIT_STATES[client.breaker.state] for client in CLIENTS},
+    ("client",)
+)
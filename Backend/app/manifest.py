@@ -0,0 +1,110 @@
+import os
+import json
+import hashlib
+import threading
+
+
+def file_sha256(file_path: str, chunk_size: int = 1024 * 1024):
+    """Hash SHA-256 do conteúdo do arquivo, lido em blocos."""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_ids(file_path: str, content_hash: str, n: int):
+    """IDs determinísticos dos chunks de um arquivo (upsert idempotente)."""
+    path_key = hashlib.sha256(file_path.encode("utf-8")).hexdigest()[:16]
+    return [f"{path_key}:{content_hash[:12]}:{i}" for i in range(n)]
+
+
+class IndexManifest:
+    """
+    Manifesto persistente do que está vetorizado, indexado pelo caminho do
+    arquivo: {caminho: {"size", "mtime", "sha256", "ids"}}.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def save(self):
+        """Grava em arquivo temporário e renomeia (escrita atômica)."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with self.lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def record(self, file_path: str, size: int, mtime: int, sha256: str, ids: list):
+        with self.lock:
+            self.entries[file_path] = {
+                "size": size,
+                "mtime": mtime,
+                "sha256": sha256,
+                "ids": ids
+            }
+
+    def remove(self, file_path: str):
+        with self.lock:
+            return self.entries.pop(file_path, None)
+
+    def diff(self, file_paths):
+        """
+        Compara os arquivos em disco com o manifesto.
+
+        Só calcula o hash quando tamanho ou mtime mudaram. Retorna
+        (novos, alterados, inalterados, removidos); novos e alterados são
+        listas de (caminho, size, mtime, sha256).
+        """
+        new, changed, unchanged = [], [], []
+        seen = set()
+
+        for file_path in file_paths:
+            seen.add(file_path)
+            st = os.stat(file_path)
+            entry = self.entries.get(file_path)
+
+            if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime_ns:
+                unchanged.append(file_path)
+                continue
+
+            sha = file_sha256(file_path)
+            if entry is None:
+                new.append((file_path, st.st_size, st.st_mtime_ns, sha))
+            elif entry["sha256"] == sha:
+                # Apenas o mtime mudou (ex.: arquivo copiado de novo)
+                entry["size"], entry["mtime"] = st.st_size, st.st_mtime_ns
+                unchanged.append(file_path)
+            else:
+                changed.append((file_path, st.st_size, st.st_mtime_ns, sha))
+
+        removed = [p for p in self.entries if p not in seen]
+        return new, changed, unchanged, removed
+
+    def seed_from_collection(self, db):
+        """
+        Migração única: bases criadas antes do manifesto têm apenas o
+        metadado "source". Lê a coleção uma vez e registra os IDs por arquivo.
+        """
+        stored = db.get(include=["metadatas"])
+        ids_by_source = {}
+        for chunk_id, meta in zip(stored["ids"], stored["metadatas"]):
+            if meta and "source" in meta:
+                ids_by_source.setdefault(meta["source"], []).append(chunk_id)
+
+        for source, ids in ids_by_source.items():
+            if os.path.exists(source):
+                st = os.stat(source)
+                self.record(source, st.st_size, st.st_mtime_ns, file_sha256(source), ids)
+            else:
+                self.record(source, -1, -1, "", ids)
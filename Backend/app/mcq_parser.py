@@ -0,0 +1,236 @@
+import re
+import json
+from app.metrics import mcq_parse_total, mcq_rejected_questions_total
+
+
+QUESTION_KEY_RE = re.compile(r'"(question\s*\d+)"\s*:\s*\{')
+CODE_FENCE_RE = re.compile(r"```(?:json)?", re.IGNORECASE)
+# Aspas tipográficas usadas como delimitadores (fora de strings) viram aspas retas
+SMART_QUOTES = "“”„"
+TRUE_VALUES = {"true", "verdadeiro", "sim", "1"}
+FALSE_VALUES = {"false", "falso", "nao", "não", "0", ""}
+
+
+class QuestionStreamParser:
+    """
+    Parser incremental do JSON de questões gerado pelo modelo.
+
+    Recebe o texto em pedaços (tokens do stream) e devolve cada objeto
+    "question N" assim que a chave de fechamento correspondente chega,
+    sem esperar o JSON completo.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.key = None
+        self.obj_start = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+
+    def feed(self, text: str):
+        """Adiciona texto ao buffer e retorna as questões completadas [(chave, questão)]."""
+        self.buffer += text
+        found = []
+
+        while True:
+            if self.key is None:
+                match = QUESTION_KEY_RE.search(self.buffer, self.pos)
+                if not match:
+                    break
+                self.key = match.group(1)
+                self.obj_start = match.end() - 1
+                self.pos = match.end()
+                self.depth = 1
+                self.in_string = False
+                self.escape = False
+
+            if not self._scan_object():
+                break
+
+            try:
+                found.append((self.key, json.loads(self.buffer[self.obj_start:self.pos])))
+            except ValueError:
+                # Objeto malformado: descarta e segue para a próxima questão
+                pass
+            self.key = None
+
+        return found
+
+    def _scan_object(self):
+        """Avança até fechar o objeto atual; False se o buffer acabou antes."""
+        buffer = self.buffer
+        while self.pos < len(buffer):
+            c = buffer[self.pos]
+            self.pos += 1
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+            elif c == '"':
+                self.in_string = True
+            elif c == "{":
+                self.depth += 1
+            elif c == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
+
+
+def _closes_string(text: str, i: int):
+    """Depois de uma aspa tipográfica: True se o que vem a seguir é estrutura do JSON."""
+    while i < len(text) and text[i].isspace():
+        i += 1
+    return i == len(text) or text[i] in ":,}]"
+
+
+def _repair_json(text: str):
+    """
+    Corrige defeitos comuns da saída do modelo: cercas de código, aspas
+    tipográficas como delimitadores, vírgulas sobrando antes de } ou ] e
+    literais True/False/None do Python (fora de strings). Aspas tipográficas
+    dentro de strings normais (ex.: “TCP”) são conteúdo e ficam intactas.
+    """
+    text = CODE_FENCE_RE.sub("", text)
+
+    out = []
+    in_string = escape = smart = False
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape = True
+            elif c == '"':
+                in_string = False
+            elif smart and c in SMART_QUOTES and _closes_string(text, i + 1):
+                # Fecha uma string que foi aberta com aspa tipográfica
+                in_string = False
+                c = '"'
+            out.append(c)
+        elif c == '"' or c in SMART_QUOTES:
+            in_string = True
+            smart = c != '"'
+            out.append('"')
+        elif c == ",":
+            j = i + 1
+            while j < len(text) and text[j].isspace():
+                j += 1
+            if j < len(text) and text[j] in "}]":
+                i += 1
+                continue
+            out.append(c)
+        else:
+            for literal, value in (("True", "true"), ("False", "false"), ("None", "null")):
+                if text.startswith(literal, i) and not (i and text[i - 1].isalnum()):
+                    out.append(value)
+                    i += len(literal)
+                    break
+            else:
+                out.append(c)
+                i += 1
+            continue
+        i += 1
+    return "".join(out)
+
+
+def _load_questions(text: str):
+    """Objetos de questão encontrados no texto, mesmo com JSON truncado."""
+    start, end = text.find("{"), text.rfind("}") + 1
+    if start >= 0 and end > start:
+        # Caminho rápido: JSON válido; depois, com reparos
+        for result, candidate in (("strict", text[start:end]), ("repaired", _repair_json(text[start:end]))):
+            try:
+                data = json.loads(candidate, strict=False)
+            except ValueError:
+                continue
+            if isinstance(data, dict):
+                mcq_parse_total.inc(result=result)
+                if "text" in data and "options" in data:
+                    return [data]
+                return [v for k, v in data.items() if k not in ("sources", "exam_id")]
+
+    # Recuperação parcial: aproveita cada questão que fechou corretamente
+    parser = QuestionStreamParser()
+    questions = [question for _, question in parser.feed(_repair_json(text))]
+    mcq_parse_total.inc(result="partial" if questions else "failed")
+    return questions
+
+
+def _as_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return value == 1
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value in TRUE_VALUES:
+            return True
+        if value in FALSE_VALUES:
+            return False
+    return None
+
+
+def validate_question(question):
+    """
+    Valida e normaliza uma questão do esquema MCQ: enunciado, exatamente
+    4 alternativas e exatamente uma correta. Retorna (questão, erro).
+    """
+    if not isinstance(question, dict):
+        return None, "questão não é um objeto"
+    text = question.get("text")
+    if not isinstance(text, str) or not text.strip():
+        return None, "enunciado ausente"
+
+    options = question.get("options")
+    if not isinstance(options, list) or len(options) != 4:
+        return None, f"esperadas 4 alternativas, recebidas {len(options) if isinstance(options, list) else 0}"
+
+    normalized = []
+    for opt in options:
+        if not isinstance(opt, dict) or not str(opt.get("option", "")).strip():
+            return None, "alternativa sem texto"
+        is_correct = _as_bool(opt.get("is_correct", False))
+        if is_correct is None:
+            return None, f"is_correct inválido: {opt.get('is_correct')!r}"
+        normalized.append({
+            **opt,
+            "option": str(opt["option"]).strip(),
+            "is_correct": is_correct,
+            "explanation": str(opt.get("explanation") or "")
+        })
+
+    n_correct = sum(opt["is_correct"] for opt in normalized)
+    if n_correct != 1:
+        return None, f"esperada 1 alternativa correta, recebidas {n_correct}"
+
+    return {
+        **question,
+        "text": text.strip(),
+        "options": normalized,
+        "resolution": str(question.get("resolution") or "")
+    }, None
+
+
+def parse_mcq(text: str):
+    """
+    Extrai e valida as questões da resposta do modelo.
+    Retorna (questões válidas, motivos das rejeitadas).
+    """
+    valid, rejected = [], []
+    for question in _load_questions(text):
+        question, error = validate_question(question)
+        if error:
+            rejected.append(error)
+        else:
+            valid.append(question)
+    if rejected:
+        mcq_rejected_questions_total.inc(len(rejected))
+    return valid, rejected
@@ -0,0 +1,208 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+
+# Limites (segundos) dos histogramas: de consultas ao cache até gerações longas do LLM
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_metrics = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Contador monotônico com rótulos (formato texto do Prometheus)."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, (), value) for key, value in self.values.items()]
+
+
+class Histogram:
+    """Histograma cumulativo (_bucket, _sum, _count) com rótulos."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self.values = {}  # rótulos -> [contagens por bucket, soma, total]
+        self.lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self.lock:
+            counts, total, n = self.values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value, n + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        out = []
+        with self.lock:
+            for key, (counts, total, n) in self.values.items():
+                for bound, count in zip(self.buckets, counts):
+                    out.append((f"{self.name}_bucket", key, (("le", _format_value(bound)),), count))
+                out.append((f"{self.name}_sum", key, (), total))
+                out.append((f"{self.name}_count", key, (), n))
+        return out
+
+
+class GaugeFunction:
+    """
+    Gauge lido na hora da coleta: `fn()` devolve um número ou um dict
+    {tupla de rótulos: valor}. Usado para expor estatísticas que já existem
+    (caches, circuit breaker) sem duplicar contadores.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.fn = fn
+        _metrics.append(self)
+
+    def samples(self):
+        try:
+            values = self.fn()
+        except Exception:
+            # Uma fonte indisponível (ex.: banco ainda não aberto) não derruba o /metrics
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [(self.name, key, (), value) for key, value in values.items()]
+
+
+def render():
+    """Todas as métricas no formato texto de exposição do Prometheus (0.0.4)."""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, key, extra, value in metric.samples():
+            lines.append(f"{name}{_format_labels(metric.labels, key, extra)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# Métricas do pipeline
+http_request_seconds = Histogram(
+    "examforge_http_request_seconds", "Duração das requisições HTTP por rota.", ("method", "route", "status")
+)
+stage_seconds = Histogram(
+    "examforge_stage_seconds", "Duração de cada etapa do pipeline RAG.", ("stage",)
+)
+loader_parse_seconds = Histogram(
+    "examforge_loader_parse_seconds", "Tempo de parse de um arquivo, por tipo.", ("file_type",)
+)
+split_seconds = Histogram(
+    "examforge_split_seconds", "Tempo de divisão em chunks de um arquivo, por tipo.", ("file_type",)
+)
+ingest_files_total = Counter(
+    "examforge_ingest_files_total", "Arquivos processados na ingestão.", ("file_type", "result")
+)
+llm_tokens_total = Counter(
+    "examforge_llm_tokens_total", "Tokens do modelo de chat (prompt e completion).", ("kind",)
+)
+mcq_parse_total = Counter(
+    "examforge_mcq_parse_total", "Respostas do modelo interpretadas, por caminho do parser.", ("result",)
+)
+mcq_rejected_questions_total = Counter(
+    "examforge_mcq_rejected_questions_total", "Questões descartadas pela validação do parser."
+)
+pdf_cache_total = Counter(
+    "examforge_pdf_cache_total", "Pedidos de PDF atendidos pelo cache ou renderizados.", ("result",)
+)
+
+
+# Spans por requisição: a soma por etapa vai no cabeçalho Server-Timing
+_trace = contextvars.ContextVar("examforge_trace", default=None)
+
+
+def start_trace():
+    """Inicia a coleta dos spans da requisição atual (chamado pelo middleware)."""
+    return _trace.set({})
+
+
+def end_trace(token):
+    """Encerra a coleta e devolve o valor do cabeçalho Server-Timing."""
+    spans = _trace.get() or {}
+    _trace.reset(token)
+    return ", ".join(
+        f'{stage};dur={seconds * 1000:.1f};desc="{count}x"' for stage, (seconds, count) in spans.items()
+    )
+
+
+def _add_span(stage: str, seconds: float):
+    spans = _trace.get()
+    if spans is not None:
+        total, count = spans.get(stage, (0.0, 0))
+        spans[stage] = (total + seconds, count + 1)
+
+
+def record_span(stage: str, seconds: float):
+    """Registra uma etapa medida fora de um `span` (ex.: num processo do pool)."""
+    stage_seconds.observe(seconds, stage=stage)
+    _add_span(stage, seconds)
+
+
+@contextmanager
+def span(stage: str):
+    """Mede uma etapa: histograma examforge_stage_seconds e Server-Timing da requisição."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, time.perf_counter() - started)
+
+
+def record_llm_usage(message):
+    """Soma os tokens informados pelo modelo (usage_metadata do LangChain), se houver."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    if usage.get("input_tokens"):
+        llm_tokens_total.inc(usage["input_tokens"], kind="prompt")
+    if usage.get("output_tokens"):
+        llm_tokens_total.inc(usage["output_tokens"], kind="completion")
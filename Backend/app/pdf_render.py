@@ -0,0 +1,187 @@
+import os
+import json
+import asyncio
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fpdf import FPDF
+from app.metrics import pdf_cache_total, span
+
+
+PDF_CACHE_PATH = os.getenv("PDF_CACHE_PATH", "./cache/pdf")
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+
+_pool = None
+_pool_lock = threading.Lock()
+_in_flight = {}
+
+
+def substituir_caracteres_unicode(texto):
+    """Substitui caracteres Unicode por equivalentes ASCII"""
+    substituicoes = {
+        '≤': '<=', '≥': '>=', '≠': '!=', '≈': '≈',
+        'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u',
+        'à': 'a', 'è': 'e', 'ì': 'i', 'ò': 'o', 'ù': 'u',
+        'â': 'a', 'ê': 'e', 'î': 'i', 'ô': 'o', 'û': 'u',
+        'ã': 'a', 'õ': 'o', 'ç': 'c', 'ü': 'u',
+        'Á': 'A', 'É': 'E', 'Í': 'I', 'Ó': 'O', 'Ú': 'U',
+        'À': 'A', 'È': 'E', 'Ì': 'I', 'Ò': 'O', 'Ù': 'U',
+        'Â': 'A', 'Ê': 'E', 'Î': 'I', 'Ô': 'O', 'Û': 'U',
+        'Ã': 'A', 'Õ': 'O', 'Ç': 'C', 'Ü': 'U'
+    }
+    
+    for char, replacement in substituicoes.items():
+        texto = texto.replace(char, replacement)
+    
+    return texto
+
+def obter_letra_enumeração(indice):
+    vogais = ['a', 'b', 'c', 'd']
+    return vogais[indice % len(vogais)]
+
+# Criação do pdf
+def create_PDF(exame, pdf_path: str):
+    """Renderiza o exame em `pdf_path`. Executado nos processos do pool."""
+    pdf = FPDF()
+    pdf.add_page()
+
+    pdf.set_auto_page_break(auto=True, margin=15)
+
+    for i, question_key in enumerate(exame.keys(), 1):
+        question = exame[question_key]
+        
+        pdf.set_font("Arial", 'B', 14)
+        pdf.set_text_color(0, 0, 128)
+        pdf.cell(0, 15, f"Questão {i}:", 0, 1)
+
+        pdf.set_font("Arial", size=12)
+        pdf.set_text_color(0, 0, 0)
+        text = substituir_caracteres_unicode(question['text'])
+        pdf.multi_cell(0, 8, text, 0, 1)
+        pdf.ln(5)
+
+        pdf.set_font("Arial", size=11)
+        options = question['options']
+        
+        for j, option in enumerate(options):
+            letra = obter_letra_enumeração(j)
+            text = substituir_caracteres_unicode(option['option'])
+            pdf.cell(10, 10, f"({letra})", 0, 0)
+            pdf.multi_cell(0, 10, f" {text}", 0, 1)
+
+        pdf.ln(10)
+        pdf.set_draw_color(200, 200, 200)
+        pdf.line(10, pdf.get_y(), 200, pdf.get_y())
+        pdf.ln(10)
+
+    # Grava em arquivo temporário e renomeia: leitores nunca veem um PDF pela metade
+    tmp_path = f"{pdf_path}.{os.getpid()}.tmp"
+    pdf.output(tmp_path)
+    os.replace(tmp_path, pdf_path)
+    return pdf_path
+
+
+def exam_hash(exame: dict):
+    """Hash do conteúdo do exame: identifica o PDF em cache e serve de ETag."""
+    payload = json.dumps(exame, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_pool():
+    """Pool de processos da renderização, criados com "spawn" (sem fork do servidor)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def reset_pool(broken):
+    """Descarta o pool quebrado (um processo morreu); o próximo get_pool cria outro."""
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def shutdown_pool():
+    """Encerra o pool de processos (no desligamento da aplicação)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def evict_pdf_cache(max_bytes: int = PDF_CACHE_MAX_BYTES, exclude=()):
+    """
+    Remove os PDFs acessados há mais tempo até o cache caber em `max_bytes`,
+    sem tocar nos caminhos de `exclude` (os que estão sendo devolvidos).
+    """
+    exclude = {os.path.abspath(path) for path in exclude}
+    entries = []
+    for entry in os.scandir(PDF_CACHE_PATH):
+        if entry.is_file() and entry.name.endswith(".pdf") and os.path.abspath(entry.path) not in exclude:
+            st = entry.stat()
+            entries.append((st.st_mtime, st.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except FileNotFoundError:
+            pass
+
+
+async def render_in_pool(exame: dict, pdf_path: str):
+    """Renderiza no pool; se um processo do pool morrer, recria o pool e tenta mais uma vez."""
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        pool = get_pool()
+        try:
+            return await loop.run_in_executor(pool, create_PDF, exame, pdf_path)
+        except BrokenProcessPool:
+            reset_pool(pool)
+            if attempt:
+                raise
+
+
+async def render_pdf(exame: dict):
+    """
+    Devolve (caminho, etag) do PDF do exame. Reaproveita o arquivo em cache
+    quando o conteúdo não mudou; senão renderiza no pool de processos, sem
+    bloquear o event loop. Pedidos simultâneos do mesmo exame compartilham
+    a mesma renderização.
+    """
+    etag = exam_hash(exame)
+    os.makedirs(PDF_CACHE_PATH, exist_ok=True)
+    pdf_path = os.path.join(PDF_CACHE_PATH, f"{etag}.pdf")
+
+    if os.path.exists(pdf_path):
+        # Atualiza o mtime: a remoção do cache é por uso menos recente
+        os.utime(pdf_path)
+        pdf_cache_total.inc(result="hit")
+        return pdf_path, etag
+
+    pdf_cache_total.inc(result="miss")
+    future = _in_flight.get(etag)
+    if future is None:
+        future = asyncio.ensure_future(render_in_pool(exame, pdf_path))
+        _in_flight[etag] = future
+        future.add_done_callback(lambda _: _in_flight.pop(etag, None))
+
+    with span("pdf_render"):
+        await asyncio.shield(future)
+    # O PDF deste pedido e os ainda em renderização ficam fora da limpeza
+    rendering = [os.path.join(PDF_CACHE_PATH, f"{key}.pdf") for key in _in_flight]
+    evict_pdf_cache(exclude=[pdf_path, *rendering])
+    return pdf_path, etag
@@ -0,0 +1,329 @@
+import os
+import math
+import time
+import json
+import random
+import sqlite3
+import hashlib
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from app.courses import CourseScope
+from app.embeddings import get_embedding_function
+from app.llm_client import CircuitOpenError
+from app.resources import get_vector_store
+from app.similarity import QuestionSimilarityIndex
+
+
+QUESTION_BANK_PATH = os.getenv("QUESTION_BANK_PATH", "./data/question_bank.sqlite")
+# Desligado por padrão: o preenchimento faz uma chamada ao Gemini por chunk
+BANK_ENABLED = os.getenv("BANK_ENABLED", "false").lower() == "true"
+BANK_QUESTIONS_PER_CHUNK = int(os.getenv("BANK_QUESTIONS_PER_CHUNK", "2"))
+# Chamadas simultâneas ao modelo somando todos os preenchimentos do processo
+BANK_FILL_CONCURRENCY = int(os.getenv("BANK_FILL_CONCURRENCY", "2"))
+# Reserva de um chunk em preenchimento (liberada se o processo cair no meio)
+BANK_CLAIM_TTL = float(os.getenv("BANK_CLAIM_TTL", str(60 * 60)))
+
+
+def normalize_text(text: str):
+    return " ".join(text.lower().split())
+
+
+def text_hash(text: str):
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class QuestionBank:
+    """
+    Banco persistente de questões pré-geradas. Cada questão é indexada pelo
+    chunk de origem (ID no Chroma) e guarda o embedding do seu enunciado.
+    """
+
+    def __init__(self, path: str = QUESTION_BANK_PATH):
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        conn = self._conn()
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS bank_questions ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, chunk_id TEXT NOT NULL, "
+            "text_hash TEXT NOT NULL UNIQUE, data TEXT NOT NULL, embedding BLOB, "
+            "created_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_bank_chunk ON bank_questions(chunk_id);"
+            "CREATE TABLE IF NOT EXISTS bank_chunks ("
+            "chunk_id TEXT PRIMARY KEY, filled_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS bank_claims ("
+            "chunk_id TEXT PRIMARY KEY, claimed_at REAL NOT NULL);"
+        )
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+    def pending_chunks(self, chunk_ids):
+        """Chunks que ainda não passaram pela geração do banco."""
+        conn = self._conn()
+        filled = set()
+        for i in range(0, len(chunk_ids), 500):
+            part = chunk_ids[i:i + 500]
+            rows = conn.execute(
+                f"SELECT chunk_id FROM bank_chunks WHERE chunk_id IN ({','.join('?' * len(part))})",
+                part
+            ).fetchall()
+            filled.update(row[0] for row in rows)
+        return [chunk_id for chunk_id in chunk_ids if chunk_id not in filled]
+
+    def claim_chunks(self, chunk_ids, ttl: float = BANK_CLAIM_TTL):
+        """
+        Reserva os chunks ainda pendentes antes de chamar o modelo, para que
+        dois preenchimentos (inclusive de outro worker) não paguem pelo mesmo
+        chunk. Devolve só os que foram reservados por esta chamada.
+        """
+        conn = self._conn()
+        now = time.time()
+        claimed = []
+        with conn:
+            conn.execute("DELETE FROM bank_claims WHERE claimed_at < ?", (now - ttl,))
+            for chunk_id in self.pending_chunks(chunk_ids):
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO bank_claims (chunk_id, claimed_at) VALUES (?, ?)",
+                    (chunk_id, now)
+                )
+                if cursor.rowcount:
+                    claimed.append(chunk_id)
+        return claimed
+
+    def release_chunks(self, chunk_ids):
+        """Desfaz a reserva de chunks que falharam (voltam a ficar pendentes)."""
+        conn = self._conn()
+        with conn:
+            conn.executemany("DELETE FROM bank_claims WHERE chunk_id = ?", [(c,) for c in chunk_ids])
+
+    def add_questions(self, chunk_id: str, questions, embeddings):
+        """Guarda as questões de um chunk; enunciados repetidos são ignorados."""
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO bank_questions (chunk_id, text_hash, data, embedding, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        chunk_id,
+                        text_hash(question["text"]),
+                        json.dumps(question, ensure_ascii=False),
+                        array("f", embedding).tobytes() if embedding else None,
+                        now
+                    )
+                    for question, embedding in zip(questions, embeddings)
+                ]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO bank_chunks (chunk_id, filled_at) VALUES (?, ?)",
+                (chunk_id, now)
+            )
+            conn.execute("DELETE FROM bank_claims WHERE chunk_id = ?", (chunk_id,))
+
+    def delete_chunks(self, chunk_ids):
+        """Remove as questões de chunks que saíram da coleção."""
+        conn = self._conn()
+        with conn:
+            for i in range(0, len(chunk_ids), 500):
+                part = chunk_ids[i:i + 500]
+                marks = ",".join("?" * len(part))
+                conn.execute(f"DELETE FROM bank_questions WHERE chunk_id IN ({marks})", part)
+                conn.execute(f"DELETE FROM bank_chunks WHERE chunk_id IN ({marks})", part)
+                conn.execute(f"DELETE FROM bank_claims WHERE chunk_id IN ({marks})", part)
+
+    def questions_for_chunks(self, chunk_ids):
+        """Questões dos chunks informados: [(chunk_id, questão, embedding)]."""
+        if not chunk_ids:
+            return []
+        rows = self._conn().execute(
+            "SELECT chunk_id, data, embedding FROM bank_questions "
+            f"WHERE chunk_id IN ({','.join('?' * len(chunk_ids))})",
+            list(chunk_ids)
+        ).fetchall()
+        return [
+            (chunk_id, json.loads(data), array("f", blob).tolist() if blob else None)
+            for chunk_id, data, blob in rows
+        ]
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM bank_questions").fetchone()[0]
+
+
+def balance_answer_positions(questions):
+    """
+    Reordena as alternativas para que a correta fique distribuída de forma
+    equilibrada entre A, B, C e D ao longo do exame.
+    """
+    positions = [i % 4 for i in range(len(questions))]
+    random.shuffle(positions)
+
+    balanced = []
+    for question, target in zip(questions, positions):
+        options = question.get("options", [])
+        correct = [opt for opt in options if opt.get("is_correct", False)]
+        if len(options) != 4 or len(correct) != 1:
+            balanced.append(question)
+            continue
+
+        others = [opt for opt in options if not opt.get("is_correct", False)]
+        random.shuffle(others)
+        others.insert(target, correct[0])
+        balanced.append({**question, "options": others})
+    return balanced
+
+
+def assemble_from_bank(bank: QuestionBank, chunk_ids, qnt_questoes: int, topic_embedding=None):
+    """
+    Monta até `qnt_questoes` questões a partir do banco para os chunks
+    recuperados: ordena por similaridade com o tópico (ou, sem o embedding
+    do tópico, pela ordem da busca), remove enunciados
+    repetidos ou semanticamente quase idênticos, prioriza um chunk por
+    questão e equilibra as respostas.
+    """
+    rank = {chunk_id: i for i, chunk_id in enumerate(chunk_ids)}
+    candidates = bank.questions_for_chunks(chunk_ids)
+
+    def score(item):
+        chunk_id, _, embedding = item
+        if topic_embedding and embedding:
+            return -cosine(topic_embedding, embedding)
+        return rank.get(chunk_id, len(rank))
+
+    candidates.sort(key=score)
+
+    selected, seen_texts, used_chunks = [], set(), set()
+    index = QuestionSimilarityIndex()
+    # Primeira passada: no máximo uma questão por chunk (mais diversidade)
+    for single_per_chunk in (True, False):
+        for chunk_id, question, embedding in candidates:
+            if len(selected) >= qnt_questoes:
+                break
+            key = text_hash(question["text"])
+            if key in seen_texts or (single_per_chunk and chunk_id in used_chunks):
+                continue
+            if embedding and index.is_duplicate(embedding):
+                continue
+            seen_texts.add(key)
+            used_chunks.add(chunk_id)
+            if embedding:
+                index.add(key, embedding)
+            selected.append(question)
+
+    return balance_answer_positions(selected)
+
+
+_question_bank = None
+_bank_lock = threading.Lock()
+
+
+def get_question_bank():
+    """Instância única do banco de questões."""
+    global _question_bank
+    with _bank_lock:
+        if _question_bank is None:
+            _question_bank = QuestionBank()
+    return _question_bank
+
+
+# Gerador das questões de um chunk: fn(texto, metadados) -> [questões].
+# Registrado pelo /rag, que tem o prompt e o cliente do modelo.
+_chunk_generator = None
+# Coleções com preenchimento em andamento neste processo
+_active_fills = set()
+_fills_lock = threading.Lock()
+_fill_slots = threading.BoundedSemaphore(BANK_FILL_CONCURRENCY)
+
+
+def register_chunk_generator(generator):
+    global _chunk_generator
+    _chunk_generator = generator
+
+
+def fill_question_bank(chunk_ids, course: str = None):
+    """
+    Gera questões para os chunks do curso que ainda não estão no banco.
+    Cada lote é reservado antes das chamadas ao modelo; se o provedor
+    ficar indisponível, o restante fica para o próximo preenchimento.
+    """
+    db = get_vector_store(course)
+    if db is None or _chunk_generator is None:
+        return
+
+    bank = get_question_bank()
+    pending = bank.pending_chunks(chunk_ids)
+    print(f"Banco de questões: {len(pending)} chunks pendentes")
+    stop = threading.Event()
+
+    def fill_chunk(chunk_id, text, meta):
+        try:
+            if not stop.is_set():
+                with _fill_slots:
+                    questions = _chunk_generator(text, meta or {})
+                embeddings = get_embedding_function().embed_documents([q["text"] for q in questions])
+                bank.add_questions(chunk_id, questions, embeddings)
+                return
+        except CircuitOpenError:
+            stop.set()
+        except Exception as e:
+            print(f"⚠️ Erro ao gerar questões do chunk {chunk_id}: {getattr(e, 'detail', e)}")
+        # O chunk continua pendente e é tentado de novo no próximo /base/create/
+        bank.release_chunks([chunk_id])
+
+    with ThreadPoolExecutor(max_workers=BANK_FILL_CONCURRENCY) as pool:
+        for i in range(0, len(pending), 100):
+            if stop.is_set():
+                print("⚠️ Banco de questões: provedor indisponível, preenchimento interrompido")
+                break
+            claimed = bank.claim_chunks(pending[i:i + 100])
+            if not claimed:
+                continue
+            try:
+                stored = db.get(ids=claimed, include=["documents", "metadatas"])
+            except Exception:
+                bank.release_chunks(claimed)
+                raise
+            bank.release_chunks(set(claimed) - set(stored["ids"]))
+            list(pool.map(fill_chunk, stored["ids"], stored["documents"], stored["metadatas"]))
+
+
+def start_bank_fill(chunk_ids, course: str = None):
+    """
+    Dispara o preenchimento em segundo plano após uma vetorização. No
+    máximo um por coleção: se já houver um em andamento, não faz nada (os
+    chunks que ele não cobre ficam para a próxima vetorização).
+    """
+    if not BANK_ENABLED or _chunk_generator is None:
+        return False
+    collection = CourseScope(course).collection_name
+    with _fills_lock:
+        if collection in _active_fills:
+            return False
+        _active_fills.add(collection)
+
+    def run():
+        try:
+            fill_question_bank(chunk_ids, course)
+        except Exception as e:
+            print(f"⚠️ Erro no preenchimento do banco de questões: {e}")
+        finally:
+            with _fills_lock:
+                _active_fills.discard(collection)
+
+    threading.Thread(target=run, name=f"bank-fill-{collection}", daemon=True).start()
+    return True
@@ -0,0 +1,150 @@
+import os
+import time
+import threading
+from dotenv import load_dotenv
+from app.bm25 import get_bm25_index, drop_bm25_index
+from app.courses import CHROMA_PATH, CourseScope
+from app.embeddings import get_embedding_function, check_collection_model
+from app.llm_client import LLM_TIMEOUT
+
+load_dotenv()
+
+CHAT_MODEL = "gemini-2.5-flash"
+
+# Clientes compartilhados pelos dois routers, criados no primeiro uso
+_chat_model = None
+_vector_stores = {}  # curso -> coleção do Chroma
+_lock = threading.Lock()
+
+readiness = {"ready": False, "started_at": None, "warmup_seconds": None, "errors": {}}
+
+
+def get_gemini_key():
+    gemini_key = os.getenv("GOOGLE_GEMINI_KEY")
+    if not gemini_key:
+        raise ValueError("GOOGLE_GEMINI_KEY não encontrada no arquivo .env")
+    os.environ["GOOGLE_API_KEY"] = gemini_key
+    return gemini_key
+
+
+def get_chat_model():
+    """Modelo de chat do Gemini (instância única)."""
+    global _chat_model
+    with _lock:
+        if _chat_model is None:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+
+            _chat_model = ChatGoogleGenerativeAI(
+                model=CHAT_MODEL,
+                temperature=0.5,
+                api_key=get_gemini_key(),
+                timeout=LLM_TIMEOUT,
+                # Novas tentativas ficam a cargo do chat_client (backoff + circuit breaker)
+                max_retries=0
+            )
+    return _chat_model
+
+
+def _open_collection(scope: CourseScope):
+    from langchain_chroma import Chroma
+
+    return Chroma(
+        persist_directory=CHROMA_PATH,
+        embedding_function=get_embedding_function(),
+        collection_name=scope.collection_name
+    )
+
+
+class CourseNotFound(LookupError):
+    pass
+
+
+def get_vector_store(course: str = None, create: bool = False):
+    """
+    Coleção do Chroma do curso (padrão: exame_docs) com os embeddings
+    compartilhados, ou None se o banco não puder ser aberto. Na primeira
+    abertura confere o modelo de embeddings. Curso inválido: ValueError.
+    O Chroma cria a coleção ao abrir: sem `create`, um curso (não padrão)
+    ainda sem coleção levanta CourseNotFound em vez de virar uma coleção vazia.
+    """
+    scope = CourseScope(course)
+    if not create and not scope.is_default and scope.course not in _vector_stores:
+        try:
+            exists = scope.collection_name in collection_names()
+        except Exception as e:
+            print(f"⚠️ Erro ao carregar banco vetorial: {e}")
+            return None
+        if not exists:
+            raise CourseNotFound(f"Curso '{scope.course}' não encontrado.")
+    with _lock:
+        if scope.course not in _vector_stores:
+            try:
+                db = _open_collection(scope)
+            except Exception as e:
+                print(f"⚠️ Erro ao carregar banco vetorial: {e}")
+                if scope.is_default:
+                    readiness["errors"]["vector_store"] = str(e)
+                return None
+
+            # Vetores de outro modelo de embeddings tornariam as buscas sem sentido
+            check_collection_model(db._collection)
+            _vector_stores[scope.course] = db
+    return _vector_stores[scope.course]
+
+
+def get_bm25(course: str = None):
+    """Índice léxico BM25 da coleção do curso (mantido pelo /base/create/)."""
+    return get_bm25_index(CourseScope(course).bm25_path)
+
+
+def collection_names():
+    """Nomes das coleções existentes no Chroma (só lista: não cria nenhuma coleção)."""
+    with _lock:
+        db = next(iter(_vector_stores.values()), None)
+    if db is not None:
+        client = db._client
+    else:
+        import chromadb
+
+        client = chromadb.PersistentClient(path=CHROMA_PATH)
+    # chromadb >= 0.6 devolve só os nomes; versões anteriores, objetos Collection
+    return [getattr(c, "name", c) for c in client.list_collections()]
+
+
+def drop_course_index(course: str):
+    """
+    Apaga a coleção, o manifesto e o BM25 do curso (os documentos ficam).
+    Não confere o modelo de embeddings: apagar é a saída para uma coleção divergente.
+    """
+    scope = CourseScope(course)
+    with _lock:
+        db = _vector_stores.pop(scope.course, None) or _open_collection(scope)
+        db.delete_collection()
+    drop_bm25_index(scope.bm25_path)
+    if os.path.exists(scope.manifest_path):
+        os.remove(scope.manifest_path)
+
+
+def warm_up():
+    """
+    Executado em segundo plano pelo lifespan: cria os clientes e abre os
+    índices para que a primeira requisição não pague esse custo. Os erros
+    ficam registrados em `readiness` (e no /ready) em vez de derrubar o processo.
+    """
+    started = time.monotonic()
+    readiness["started_at"] = time.time()
+    steps = {
+        "chat_model": get_chat_model,
+        "embeddings": get_embedding_function,
+        "vector_store": get_vector_store,
+        "bm25": get_bm25
+    }
+    for name, step in steps.items():
+        try:
+            step()
+        except Exception as e:
+            print(f"⚠️ Erro ao inicializar {name}: {e}")
+            readiness["errors"][name] = str(e)
+
+    readiness["warmup_seconds"] = round(time.monotonic() - started, 3)
+    readiness["ready"] = not readiness["errors"]
@@ -0,0 +1,303 @@
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+import numpy as np
+from langchain_core.documents import Document
+from app.bm25 import tokenize
+from app.metrics import GaugeFunction, span
+
+
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "256"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000"))
+
+# Busca híbrida: peso do vetor na fusão com o BM25, candidatos por fonte e
+# equilíbrio relevância x diversidade do MMR
+HYBRID_ALPHA = float(os.getenv("HYBRID_ALPHA", "0.5"))
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "24"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+# Consultas curtas cobertas pelo BM25 dispensam o embedding da consulta
+KEYWORD_MAX_TERMS = int(os.getenv("KEYWORD_MAX_TERMS", "3"))
+
+
+class TTLCache:
+    """Cache LRU em memória com expiração por tempo (TTL)."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self.data[key]
+                self.misses += 1
+                return None
+            self.data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = (time.monotonic() + self.ttl, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def discard(self, predicate):
+        """Remove as entradas cuja chave satisfaz `predicate`."""
+        with self.lock:
+            for key in [key for key in self.data if predicate(key)]:
+                del self.data[key]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+retrieval_cache = TTLCache(RETRIEVAL_CACHE_MAX_ENTRIES, RETRIEVAL_CACHE_TTL)
+GaugeFunction(
+    "examforge_retrieval_cache", "Cache de recuperação: entradas, acertos, faltas e taxa de acerto.",
+    lambda: {(key,): value for key, value in retrieval_cache.stats().items()}, ("stat",)
+)
+
+# Totais do orçamento de contexto desde o início do processo
+context_stats = {"requests": 0, "tokens_in": 0, "tokens_out": 0, "tokens_saved": 0}
+_context_lock = threading.Lock()
+
+# Buscas feitas só com o BM25 x buscas híbridas
+search_stats = {"hybrid": 0, "keyword_only": 0}
+GaugeFunction(
+    "examforge_searches", "Buscas por modo (híbrida ou só BM25) desde o início do processo.",
+    lambda: {(mode,): n for mode, n in search_stats.items()}, ("mode",)
+)
+
+
+def normalize_topic(topic: str):
+    """Normaliza o tópico para a chave do cache (caixa e espaços)."""
+    return " ".join(topic.lower().split())
+
+
+def format_docs(docs):
+    """Formata documentos recuperados do banco vetorial."""
+    return "\n\n".join([
+        f"Fonte: {doc.metadata.get('source', 'Desconhecida')}\nConteúdo: {doc.page_content}"
+        for doc in docs
+    ])
+
+
+def estimate_tokens(text: str):
+    """Estimativa simples de tokens (~4 caracteres por token)."""
+    return (len(text) + 3) // 4
+
+
+def merge_source_chunks(docs):
+    """
+    Junta chunks vizinhos do mesmo arquivo pelo `start_index`, removendo o
+    trecho repetido pelo chunk_overlap. Só funde quando o texto sobreposto
+    confere de fato; caso contrário mantém os trechos separados.
+    """
+    ordered = sorted(docs, key=lambda d: d.metadata.get("start_index", 0))
+    passages = []
+    for doc in ordered:
+        start = doc.metadata.get("start_index")
+        text = doc.page_content
+        if passages and start is not None and passages[-1]["end"] is not None:
+            last = passages[-1]
+            overlap = last["end"] - start
+            if 0 <= overlap <= len(text) and last["text"].endswith(text[:overlap]):
+                last["text"] += text[overlap:]
+                last["end"] = max(last["end"], start + len(text))
+                continue
+        passages.append({
+            "text": text,
+            "end": start + len(text) if start is not None else None
+        })
+    return [p["text"] for p in passages]
+
+
+def assemble_context(docs, max_tokens: int = CONTEXT_TOKEN_BUDGET):
+    """
+    Monta o contexto do prompt: agrupa os chunks por arquivo (na ordem de
+    relevância), elimina a sobreposição entre chunks vizinhos e corta no
+    orçamento de tokens. Retorna (contexto, estatísticas).
+    """
+    groups = {}
+    for doc in docs:
+        groups.setdefault(doc.metadata.get("source", "Desconhecida"), []).append(doc)
+
+    parts, used = [], 0
+    for source, source_docs in groups.items():
+        for text in merge_source_chunks(source_docs):
+            part = f"Fonte: {source}\nConteúdo: {text}"
+            tokens = estimate_tokens(part)
+            if used + tokens > max_tokens:
+                remaining_chars = (max_tokens - used) * 4
+                if remaining_chars > 200:
+                    parts.append(part[:remaining_chars])
+                    used = max_tokens
+                break
+            parts.append(part)
+            used += tokens
+        if used >= max_tokens:
+            break
+
+    context = "\n\n".join(parts)
+    tokens_in = estimate_tokens(format_docs(docs))
+    tokens_out = estimate_tokens(context)
+    stats = {
+        "chunks_in": len(docs),
+        "passages_out": len(parts),
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+        "tokens_saved": max(0, tokens_in - tokens_out)
+    }
+
+    with _context_lock:
+        context_stats["requests"] += 1
+        context_stats["tokens_in"] += tokens_in
+        context_stats["tokens_out"] += tokens_out
+        context_stats["tokens_saved"] += stats["tokens_saved"]
+
+    return context, stats
+
+
+def _unit_rows(vectors):
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _min_max(values):
+    values = np.asarray(values, dtype=np.float32)
+    spread = values.max() - values.min() if len(values) else 0.0
+    if spread <= 0:
+        return np.ones_like(values)
+    return (values - values.min()) / spread
+
+
+def mmr_select(relevance, matrix, k: int, lambda_mult: float = MMR_LAMBDA):
+    """
+    Maximal Marginal Relevance: escolhe k índices equilibrando a relevância
+    com a distância (cosseno) para os já escolhidos.
+    """
+    similarity = matrix @ matrix.T
+    selected, remaining = [], list(range(len(relevance)))
+    while remaining and len(selected) < k:
+        if selected:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        scores = lambda_mult * relevance[remaining] - (1 - lambda_mult) * redundancy
+        selected.append(remaining.pop(int(np.argmax(scores))))
+    return selected
+
+
+def hybrid_search(db, bm25_index, topic: str, k: int = 8, fetch_k: int = HYBRID_FETCH_K):
+    """
+    Busca híbrida: funde o BM25 local com a similaridade vetorial do Chroma
+    (scores normalizados) e rerranqueia os candidatos com MMR usando os
+    embeddings já gravados dos chunks. Se o tópico for curto e todos os
+    termos estiverem no índice léxico, o embedding da consulta é dispensado.
+    """
+    fetch_k = max(fetch_k, k)
+    collection = db._collection
+    with span("bm25_search"):
+        lexical = dict(bm25_index.search(topic, fetch_k)) if bm25_index is not None else {}
+    keyword_only = (
+        len(lexical) >= k
+        and len(tokenize(topic)) <= KEYWORD_MAX_TERMS
+        and bm25_index.covers(topic)
+    )
+
+    records = {}
+    query_vector = None
+    if not keyword_only:
+        query_vector = db.embeddings.embed_query(topic)
+        with span("chroma_query"):
+            found = collection.query(
+                query_embeddings=[query_vector],
+                n_results=fetch_k,
+                include=["documents", "metadatas", "embeddings"]
+            )
+        for doc_id, text, metadata, vector in zip(
+            found["ids"][0], found["documents"][0], found["metadatas"][0], found["embeddings"][0]
+        ):
+            records[doc_id] = (text, metadata or {}, vector)
+
+    missing = [doc_id for doc_id in lexical if doc_id not in records]
+    if missing:
+        with span("chroma_get"):
+            found = collection.get(ids=missing, include=["documents", "metadatas", "embeddings"])
+        for doc_id, text, metadata, vector in zip(
+            found["ids"], found["documents"], found["metadatas"], found["embeddings"]
+        ):
+            records[doc_id] = (text, metadata or {}, vector)
+
+    if not records:
+        return []
+
+    ids = list(records)
+    matrix = _unit_rows([records[doc_id][2] for doc_id in ids])
+    lexical_scores = _min_max([lexical.get(doc_id, 0.0) for doc_id in ids])
+    if keyword_only:
+        relevance = lexical_scores
+    else:
+        vector_scores = _min_max(matrix @ _unit_rows([query_vector])[0])
+        relevance = vector_scores if not lexical else (
+            HYBRID_ALPHA * vector_scores + (1 - HYBRID_ALPHA) * lexical_scores
+        )
+
+    with _context_lock:
+        search_stats["keyword_only" if keyword_only else "hybrid"] += 1
+
+    return [
+        Document(page_content=records[ids[i]][0], metadata=records[ids[i]][1], id=ids[i])
+        for i in mmr_select(relevance, matrix, k)
+    ]
+
+
+async def aretrieve_context(db, topic: str, k: int = 8, bm25_index=None):
+    """
+    Busca os documentos relevantes para o tópico e monta o contexto.
+    Retorna (documentos, contexto), reaproveitando o cache para tópicos
+    repetidos. A busca roda em thread para não bloquear o event loop.
+    """
+    key = (db._collection.name, normalize_topic(topic), k)
+    cached = retrieval_cache.get(key)
+    if cached is not None:
+        return cached
+
+    with span("retrieval"):
+        docs = await asyncio.to_thread(hybrid_search, db, bm25_index, topic, k)
+    result = (docs, assemble_context(docs)[0])
+    # Resultados vazios não ficam em cache: a base pode ser criada em seguida
+    if docs:
+        retrieval_cache.set(key, result)
+    return result
+
+
+def invalidate_retrieval_cache(collection_name: str = None):
+    """Chamado quando /base/create/ altera uma coleção (None: todas)."""
+    if collection_name is None:
+        retrieval_cache.clear()
+    else:
+        retrieval_cache.discard(lambda key: key[0] == collection_name)
@@ -0,0 +1,48 @@
+import os
+import numpy as np
+
+
+# Similaridade de cosseno a partir da qual duas questões são consideradas repetidas
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.92"))
+DEDUP_RETRIES = int(os.getenv("DEDUP_RETRIES", "1"))
+
+
+def _normalize(vectors):
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class QuestionSimilarityIndex:
+    """Índice de embeddings dos enunciados para detectar questões quase idênticas."""
+
+    def __init__(self, threshold: float = DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        self.keys = []
+        self.matrix = None
+
+    def add(self, key, vector):
+        row = _normalize([vector])
+        self.matrix = row if self.matrix is None else np.vstack([self.matrix, row])
+        self.keys.append(key)
+
+    def most_similar(self, vector):
+        """(chave, similaridade) da questão mais parecida, ou (None, 0.0) se vazio."""
+        if self.matrix is None:
+            return None, 0.0
+        scores = self.matrix @ _normalize([vector])[0]
+        best = int(np.argmax(scores))
+        return self.keys[best], float(scores[best])
+
+    def is_duplicate(self, vector):
+        return self.most_similar(vector)[1] >= self.threshold
+
+
+def find_duplicates(vectors, threshold: float = DUPLICATE_THRESHOLD):
+    """Índices dos vetores quase idênticos a algum vetor anterior da lista."""
+    if len(vectors) < 2:
+        return []
+    matrix = _normalize(vectors)
+    scores = np.triu(matrix @ matrix.T, k=1)
+    return [j for j in range(len(vectors)) if scores[:j, j].max(initial=0.0) >= threshold]
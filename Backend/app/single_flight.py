@@ -0,0 +1,41 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Coalescência de requisições idênticas em andamento: a primeira executa
+    o trabalho e as demais com a mesma chave aguardam o mesmo resultado
+    (ou a mesma exceção). A chave sai do mapa assim que o trabalho termina.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key, make_coro):
+        result, _ = await self.do_shared(key, make_coro)
+        return result
+
+    async def do_shared(self, key, make_coro):
+        """Como `do`, devolvendo também se o resultado veio de um trabalho já em andamento."""
+        task = self.calls.get(key)
+        shared = task is not None
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(make_coro())
+            self.calls[key] = task
+            task.add_done_callback(lambda _: self.calls.pop(key, None))
+        else:
+            self.followers += 1
+        # shield: se um cliente desconectar, o trabalho segue para os demais
+        return await asyncio.shield(task), shared
+
+    def stats(self):
+        total = self.leaders + self.followers
+        return {
+            "in_flight": len(self.calls),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "coalesced_rate": round(self.followers / total, 4) if total else 0.0
+        }
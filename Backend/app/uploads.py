@@ -0,0 +1,244 @@
+import os
+import time
+import uuid
+import asyncio
+import sqlite3
+import hashlib
+import threading
+
+
+UPLOADS_DB_PATH = os.getenv("UPLOADS_DB_PATH", "./data/uploads.sqlite")
+# Arquivos parciais ficam fora de ./Documentos para não entrarem na ingestão
+UPLOAD_TMP_PATH = os.getenv("UPLOAD_TMP_PATH", "./data/uploads_tmp")
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(100 * 1024 * 1024)))
+# Sessões sem atividade há mais que isso (e seus arquivos parciais) são descartadas
+UPLOAD_SESSION_TTL = float(os.getenv("UPLOAD_SESSION_TTL", str(24 * 60 * 60)))
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadStore:
+    """
+    Índice dos arquivos enviados por sha256 (um conteúdo é guardado uma
+    única vez por pasta de curso) e das sessões de upload em partes, que
+    podem ser retomadas.
+    """
+
+    def __init__(self, path: str = UPLOADS_DB_PATH):
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        os.makedirs(UPLOAD_TMP_PATH, exist_ok=True)
+
+        conn = self._conn()
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS stored_files ("
+            "path TEXT PRIMARY KEY, sha256 TEXT NOT NULL, size INTEGER NOT NULL, created_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_stored_files_sha256 ON stored_files(sha256);"
+            "CREATE TABLE IF NOT EXISTS upload_sessions ("
+            "upload_id TEXT PRIMARY KEY, filename TEXT NOT NULL, size INTEGER NOT NULL, "
+            "received INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, course TEXT, updated_at REAL);"
+        )
+        # Bases anteriores aos cursos: um hash por conteúdo e sessões sem curso
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        if "uploaded_files" in tables:
+            conn.execute(
+                "INSERT OR IGNORE INTO stored_files (path, sha256, size, created_at) "
+                "SELECT path, sha256, size, created_at FROM uploaded_files"
+            )
+            conn.execute("DROP TABLE uploaded_files")
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(upload_sessions)")]
+        if "course" not in columns:
+            conn.execute("ALTER TABLE upload_sessions ADD COLUMN course TEXT")
+        if "updated_at" not in columns:
+            conn.execute("ALTER TABLE upload_sessions ADD COLUMN updated_at REAL")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+    def find_by_hash(self, sha256: str, directory: str):
+        """Arquivo de `directory` já guardado com o mesmo conteúdo, se ainda existir."""
+        conn = self._conn()
+        rows = conn.execute("SELECT path FROM stored_files WHERE sha256 = ?", (sha256,)).fetchall()
+        for (path,) in rows:
+            if not os.path.isfile(path):
+                with conn:
+                    conn.execute("DELETE FROM stored_files WHERE path = ?", (path,))
+            elif os.path.abspath(os.path.dirname(path)) == os.path.abspath(directory):
+                return path
+        return None
+
+    def record_file(self, sha256: str, path: str, size: int):
+        conn = self._conn()
+        with conn:
+            # O caminho pode ter recebido uma nova versão: o hash antigo deixa de valer
+            conn.execute(
+                "INSERT OR REPLACE INTO stored_files (path, sha256, size, created_at) VALUES (?, ?, ?, ?)",
+                (path, sha256, size, time.time())
+            )
+
+    def create_session(self, filename: str, size: int, course: str = None):
+        upload_id = uuid.uuid4().hex
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO upload_sessions (upload_id, filename, size, created_at, course, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (upload_id, filename, size, time.time(), course, time.time())
+            )
+        return upload_id
+
+    def get_session(self, upload_id: str):
+        row = self._conn().execute(
+            "SELECT filename, size, received, course FROM upload_sessions WHERE upload_id = ?", (upload_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"upload_id": upload_id, "filename": row[0], "size": row[1], "received": row[2],
+                "course": row[3]}
+
+    def set_received(self, upload_id: str, received: int):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE upload_sessions SET received = ?, updated_at = ? WHERE upload_id = ?",
+                (received, time.time(), upload_id)
+            )
+
+    def delete_session(self, upload_id: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM upload_sessions WHERE upload_id = ?", (upload_id,))
+
+    def purge_expired_sessions(self, ttl: float = UPLOAD_SESSION_TTL):
+        """Remove as sessões sem atividade há mais de `ttl` segundos e devolve seus upload_ids."""
+        cutoff = time.time() - ttl
+        conn = self._conn()
+        with conn:
+            rows = conn.execute(
+                "SELECT upload_id FROM upload_sessions WHERE COALESCE(updated_at, created_at) < ?", (cutoff,)
+            ).fetchall()
+            conn.executemany("DELETE FROM upload_sessions WHERE upload_id = ?", rows)
+        return [row[0] for row in rows]
+
+
+_upload_store = None
+_upload_store_lock = threading.Lock()
+
+
+def get_upload_store():
+    """Instância única do UploadStore, criada no primeiro uso."""
+    global _upload_store
+    with _upload_store_lock:
+        if _upload_store is None:
+            _upload_store = UploadStore()
+    return _upload_store
+
+
+def safe_filename(filename: str):
+    """Só o nome do arquivo, sem diretórios (evita escrever fora de ./Documentos)."""
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    if name in ("", ".", ".."):
+        raise ValueError("Nome de arquivo inválido.")
+    return name
+
+
+def temp_path(upload_id: str):
+    return os.path.join(UPLOAD_TMP_PATH, f"{upload_id}.part")
+
+
+async def write_stream(chunks, path: str, hasher, offset: int = 0, max_bytes: int = UPLOAD_MAX_BYTES):
+    """
+    Grava um stream assíncrono de bytes no arquivo temporário sem bloquear o
+    event loop (escrita em thread), atualizando o hash a cada pedaço.
+    Retorna o total de bytes do arquivo.
+    """
+    f = await asyncio.to_thread(open, path, "r+b" if offset else "wb")
+    try:
+        if offset:
+            await asyncio.to_thread(f.seek, offset)
+            await asyncio.to_thread(f.truncate)
+        size = offset
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(f"Arquivo maior que o limite de {max_bytes} bytes.")
+            hasher.update(chunk)
+            await asyncio.to_thread(f.write, chunk)
+        await asyncio.to_thread(f.flush)
+        return size
+    finally:
+        await asyncio.to_thread(f.close)
+
+
+async def read_upload(upload_file, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """Lê um UploadFile em pedaços."""
+    while True:
+        chunk = await upload_file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def hash_file(path: str, limit: int = None):
+    """sha256 dos primeiros `limit` bytes (para retomar uploads após reinício)."""
+    hasher = hashlib.sha256()
+    remaining = limit
+    with open(path, "rb") as f:
+        while remaining is None or remaining > 0:
+            block = f.read(UPLOAD_CHUNK_SIZE if remaining is None else min(UPLOAD_CHUNK_SIZE, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return hasher
+
+
+def purge_stale_uploads(store: UploadStore, ttl: float = UPLOAD_SESSION_TTL):
+    """
+    Descarta as sessões abandonadas e os arquivos parciais sem escrita há
+    mais de `ttl` segundos (inclusive os de envios interrompidos no meio).
+    Devolve os upload_ids das sessões removidas.
+    """
+    expired = store.purge_expired_sessions(ttl)
+    cutoff = time.time() - ttl
+    for entry in os.scandir(UPLOAD_TMP_PATH):
+        try:
+            if entry.name.endswith(".part") and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+    return expired
+
+
+def store_upload(store: UploadStore, tmp_path: str, filename: str, sha256: str, size: int,
+                 documents_path: str, known_hashes=None):
+    """
+    Move o arquivo temporário para a pasta de documentos do curso com
+    rename atômico (um arquivo com o mesmo nome é substituído, como antes).
+    Conteúdo já existente na pasta (pelo sha256, no índice de uploads ou no
+    manifesto do curso) não é guardado de novo: o temporário é descartado e
+    o arquivo existente é devolvido.
+    """
+    os.makedirs(documents_path, exist_ok=True)
+    for existing in (store.find_by_hash(sha256, documents_path), (known_hashes or {}).get(sha256)):
+        if existing and os.path.isfile(existing) and os.path.getsize(existing) == size:
+            os.remove(tmp_path)
+            return {"file": os.path.basename(existing), "path": existing, "sha256": sha256,
+                    "size": size, "duplicate": True}
+
+    path = os.path.join(documents_path, filename)
+    os.replace(tmp_path, path)
+    store.record_file(sha256, path, size)
+    return {"file": os.path.basename(path), "path": path, "sha256": sha256,
+            "size": size, "duplicate": False}
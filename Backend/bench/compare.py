@@ -0,0 +1,71 @@
+"""
+Compara dois resultados do bench.run e sai com código 1 se houver regressão.
+
+    python -m bench.compare base.json atual.json --tolerance 0.2
+
+Pelo nome da métrica: *_ms e *_seconds (menor é melhor), *_per_sec (maior
+é melhor) e *errors (qualquer aumento é regressão). As demais são informativas.
+"""
+import sys
+import json
+import argparse
+
+
+def direction(key: str):
+    if key.endswith("errors"):
+        return "errors"
+    if key.endswith("_ms") or key.endswith("_seconds"):
+        return "lower"
+    if key.endswith("_per_sec"):
+        return "higher"
+    return None
+
+
+def compare(baseline: dict, current: dict, tolerance: float):
+    """Linhas (cenário, métrica, base, atual, variação, regressão?) das métricas em comum."""
+    rows = []
+    for scenario, result in current.get("scenarios", {}).items():
+        base_metrics = baseline.get("scenarios", {}).get(scenario, {}).get("metrics", {})
+        for key, value in result.get("metrics", {}).items():
+            kind = direction(key)
+            if kind is None or key not in base_metrics:
+                continue
+            base = base_metrics[key]
+            change = (value - base) / base if base else 0.0
+            if kind == "errors":
+                regressed = value > base
+            elif kind == "lower":
+                regressed = base > 0 and value > base * (1 + tolerance)
+            else:
+                regressed = value < base * (1 - tolerance)
+            rows.append((scenario, key, base, value, change, regressed))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara resultados do benchmark com uma linha de base.")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="variação aceita (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+
+    if baseline.get("config") != current.get("config"):
+        print("⚠️ Configurações diferentes entre as execuções: a comparação pode não ser justa.")
+
+    rows = compare(baseline, current, args.tolerance)
+    regressions = [row for row in rows if row[5]]
+    for scenario, key, base, value, change, regressed in rows:
+        flag = "REGRESSÃO" if regressed else ""
+        print(f"{scenario:<14} {key:<28} {base:>12} {value:>12} {change:>+8.1%} {flag}")
+
+    print(f"\n{len(rows)} métricas comparadas, {len(regressions)} regressão(ões).")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
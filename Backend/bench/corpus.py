@@ -0,0 +1,84 @@
+"""Gerador de corpus sintético (determinístico pela semente) para os benchmarks."""
+import os
+import random
+
+
+# Temas e vocabulário: cada arquivo fica concentrado num tema, como as apostilas de um curso
+TOPICS = {
+    "redes de computadores": [
+        "roteamento", "protocolo", "pacote", "camada", "enlace", "endereçamento", "sub-rede",
+        "latência", "largura", "congestionamento", "handshake", "datagrama", "switch", "firewall"
+    ],
+    "bancos de dados": [
+        "transação", "índice", "normalização", "consulta", "junção", "atomicidade", "isolamento",
+        "durabilidade", "replicação", "particionamento", "chave", "tabela", "esquema", "bloqueio"
+    ],
+    "sistemas operacionais": [
+        "processo", "thread", "escalonador", "memória", "paginação", "semáforo", "impasse",
+        "interrupção", "kernel", "sistema", "arquivos", "virtualização", "contexto", "prioridade"
+    ],
+    "estruturas de dados": [
+        "árvore", "grafo", "pilha", "fila", "heap", "hashing", "lista", "ordenação", "busca",
+        "complexidade", "recursão", "balanceamento", "vértice", "aresta"
+    ],
+    "engenharia de software": [
+        "requisito", "arquitetura", "teste", "refatoração", "acoplamento", "coesão", "padrão",
+        "integração", "entrega", "versionamento", "revisão", "módulo", "interface", "dependência"
+    ],
+}
+CONNECTIVES = [
+    "é fundamental para", "depende de", "reduz o custo de", "garante", "influencia",
+    "é comparado com", "substitui", "complementa", "limita", "organiza"
+]
+
+
+def paragraph(rng: random.Random, vocabulary, sentences: int = 5):
+    out = []
+    for _ in range(sentences):
+        a, b, c = rng.sample(vocabulary, 3)
+        out.append(
+            f"O conceito de {a} {rng.choice(CONNECTIVES)} {b}, especialmente quando {c} "
+            f"{rng.choice(CONNECTIVES)} o desempenho do sistema."
+        )
+    return " ".join(out)
+
+
+def generate_corpus(path: str, n_files: int = 50, paragraphs: int = 20, seed: int = 42):
+    """
+    Grava `n_files` arquivos .txt em `path`, distribuídos entre os temas.
+    Devolve a lista de temas (usados como tópicos das consultas).
+    """
+    rng = random.Random(seed)
+    os.makedirs(path, exist_ok=True)
+    topics = list(TOPICS)
+    for i in range(n_files):
+        topic = topics[i % len(topics)]
+        body = "\n\n".join(
+            paragraph(rng, TOPICS[topic], rng.randint(3, 7)) for _ in range(paragraphs)
+        )
+        with open(os.path.join(path, f"apostila_{i:04d}.txt"), "w", encoding="utf-8") as f:
+            f.write(f"{topic.title()} — apostila {i}\n\n{body}\n")
+    return topics
+
+
+def touch_files(path: str, fraction: float = 0.1, seed: int = 42):
+    """Altera uma fração dos arquivos (acrescenta um parágrafo) para medir a ingestão incremental."""
+    rng = random.Random(seed + 1)
+    files = sorted(os.listdir(path))
+    changed = rng.sample(files, max(1, int(len(files) * fraction))) if files else []
+    for name in changed:
+        topic = rng.choice(list(TOPICS))
+        with open(os.path.join(path, name), "a", encoding="utf-8") as f:
+            f.write("\n\n" + paragraph(rng, TOPICS[topic]) + "\n")
+    return changed
+
+
+def query_topics(n: int, seed: int = 42):
+    """Tópicos de consulta variados (tema + dois termos), para não acertar sempre o cache."""
+    rng = random.Random(seed + 2)
+    out = []
+    for _ in range(n):
+        topic = rng.choice(list(TOPICS))
+        a, b = rng.sample(TOPICS[topic], 2)
+        out.append(f"{topic}: {a} e {b}")
+    return out
@@ -0,0 +1,162 @@
+"""
+Benchmark offline do backend: sem GOOGLE_GEMINI_KEY e sem rede.
+
+    cd Backend
+    python -m bench.run --output bench/results/atual.json
+    python -m bench.compare bench/results/base.json bench/results/atual.json
+
+Tudo roda num diretório de trabalho temporário (Chroma, SQLite, caches e
+corpus), com o Gemini e os embeddings trocados pelos stubs de bench.stubs.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# Variáveis que mudam o comportamento medido (gravadas junto com os resultados)
+RECORDED_ENV = (
+    "LLM_RATE_PER_SEC", "LLM_BURST", "LLM_MAX_RETRIES", "LLM_MAX_CONCURRENCY", "LLM_HEDGE_ENABLED",
+    "EMBEDDING_RATE_PER_SEC", "EMBEDDING_BURST", "EMBED_BATCH_SIZE", "INGEST_WORKERS",
+    "MCQ_BATCH_SIZE", "MCQ_COALESCE_SHUFFLE", "BANK_ENABLED", "RETRIEVAL_CACHE_TTL"
+)
+
+
+def int_list(value: str):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def parse_args(argv=None):
+    from bench.scenarios import SCENARIOS
+
+    parser = argparse.ArgumentParser(description="Benchmark offline do ExamForge (stubs do Gemini).")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"cenários separados por vírgula ({', '.join(SCENARIOS)})")
+    parser.add_argument("--output", default=os.path.join(BACKEND_DIR, "bench", "results", "latest.json"))
+    parser.add_argument("--workdir", help="diretório de trabalho (padrão: temporário, apagado no fim)")
+    parser.add_argument("--keep", action="store_true", help="não apaga o diretório de trabalho")
+    parser.add_argument("--seed", type=int, default=42)
+    # Corpus
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--paragraphs", type=int, default=20)
+    # generate_mcq
+    parser.add_argument("--concurrency", type=int_list, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=32, help="pedidos por nível de concorrência")
+    parser.add_argument("--questions", type=int, default=10, help="questões por exame")
+    parser.add_argument("--topic-pool", type=int, default=0,
+                        help="quantidade de tópicos distintos (0: todos os pedidos diferentes)")
+    # check_answer e render_pdf
+    parser.add_argument("--exam-questions", type=int, default=50)
+    parser.add_argument("--answer-rounds", type=int, default=5)
+    parser.add_argument("--pdf-sizes", type=int_list, default=[10, 50])
+    parser.add_argument("--pdf-repeats", type=int, default=5)
+    # Stubs
+    parser.add_argument("--chat-latency-ms", type=float, default=300.0)
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--chat-failure-rate", type=float, default=0.0)
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0)
+    parser.add_argument("--embed-per-text-ms", type=float, default=0.2)
+    parser.add_argument("--embed-failure-rate", type=float, default=0.0)
+    parser.add_argument("--embed-dim", type=int, default=384)
+    parser.add_argument("--bank", action="store_true",
+                        help="liga o banco de questões (preenchido em segundo plano após a ingestão)")
+    return parser.parse_args(argv)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+async def run_scenarios(args, names):
+    from bench import scenarios
+
+    results = {}
+    if "ingest" not in names:
+        # Os demais cenários precisam de uma base vetorizada
+        scenarios.prepare_corpus(args)
+
+    for name in names:
+        print(f"▶ {name}...", flush=True)
+        before = scenarios.stage_snapshot()
+        started = time.perf_counter()
+        outcome = scenarios.SCENARIOS[name](args)
+        if asyncio.iscoroutine(outcome):
+            outcome = await outcome
+        outcome["seconds"] = round(time.perf_counter() - started, 3)
+        outcome["stages"] = scenarios.stage_diff(before, scenarios.stage_snapshot())
+        results[name] = outcome
+        print(json.dumps(outcome["metrics"], ensure_ascii=False), flush=True)
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    from bench.scenarios import SCENARIOS
+
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Cenário desconhecido: {', '.join(unknown)}")
+
+    output = os.path.abspath(args.output)
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="examforge-bench-"))
+    os.makedirs(workdir, exist_ok=True)
+    # Caminhos relativos do app (./chroma, ./data, ./cache, ./Documentos) caem no diretório de trabalho
+    os.chdir(workdir)
+    os.environ["BANK_ENABLED"] = "true" if args.bank else "false"
+
+    from bench.stubs import CallProfile, install
+
+    chat = CallProfile(args.chat_latency_ms, args.jitter, args.chat_failure_rate, seed=args.seed)
+    embed = CallProfile(args.embed_latency_ms, args.jitter, args.embed_failure_rate,
+                        per_item_ms=args.embed_per_text_ms, seed=args.seed)
+    install(chat, embed, args.embed_dim)
+
+    from app import ingestion, pdf_render
+    # O /rag registra o gerador do banco de questões usado após a ingestão
+    import app.Rag_router  # noqa: F401
+
+    try:
+        scenario_results = asyncio.run(run_scenarios(args, names))
+    finally:
+        ingestion.shutdown_pool()
+        pdf_render.shutdown_pool()
+        os.chdir(BACKEND_DIR)
+        if not (args.keep or args.workdir):
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "benchmark": "examforge",
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "workdir", "keep")},
+        "env": {k: os.environ[k] for k in RECORDED_ENV if k in os.environ},
+        "stubs": {"chat": chat.stats(), "embeddings": embed.stats()},
+        "scenarios": scenario_results
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Resultados em {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Cenários do benchmark. Cada um devolve {"metrics": {...}, "details": {...}}:
+`metrics` é plano e numérico (é o que o bench.compare confronta com a linha
+de base), `details` guarda o restante para consulta.
+
+Os módulos do app só são importados dentro dos cenários, depois que o
+bench.run ajustou o diretório de trabalho, as variáveis e os stubs.
+"""
+import json
+import time
+import asyncio
+from bench.corpus import generate_corpus, query_topics, touch_files
+from bench.stubs import fake_questions
+
+
+def summarize(latencies, prefix: str = ""):
+    """Média e percentis (ms) de uma lista de latências em segundos."""
+    if not latencies:
+        return {f"{prefix}n": 0}
+    ordered = sorted(latencies)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000, 2)
+
+    return {
+        f"{prefix}n": len(ordered),
+        f"{prefix}mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+        f"{prefix}p50_ms": pct(50),
+        f"{prefix}p95_ms": pct(95),
+        f"{prefix}p99_ms": pct(99),
+        f"{prefix}max_ms": round(ordered[-1] * 1000, 2)
+    }
+
+
+def stage_snapshot():
+    """Soma e contagem de cada etapa do examforge_stage_seconds até agora."""
+    from app.metrics import stage_seconds
+
+    with stage_seconds.lock:
+        return {key[0]: (total, n) for key, (_, total, n) in stage_seconds.values.items()}
+
+
+def stage_diff(before, after):
+    """Tempo por etapa entre dois snapshots (mostra qual etapa domina o cenário)."""
+    out = {}
+    for stage, (total, n) in after.items():
+        total -= before.get(stage, (0.0, 0))[0]
+        n -= before.get(stage, (0.0, 0))[1]
+        if n:
+            out[stage] = {"count": n, "total_ms": round(total * 1000, 2), "mean_ms": round(total / n * 1000, 2)}
+    return out
+
+
+def prepare_corpus(config):
+    """Gera o corpus na pasta padrão e vetoriza (base para os demais cenários)."""
+    from app.courses import CourseScope
+    from app.create_base import run_vectorization
+
+    generate_corpus(CourseScope().documents_path, config.files, config.paragraphs, config.seed)
+    return run_vectorization()
+
+
+def ingest(config):
+    """Vetorização completa, sem alterações (só manifesto) e incremental (10% alterados)."""
+    from app.courses import CourseScope
+    from app.create_base import run_vectorization
+
+    documents_path = CourseScope().documents_path
+    generate_corpus(documents_path, config.files, config.paragraphs, config.seed)
+
+    started = time.perf_counter()
+    full = run_vectorization()
+    full_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    run_vectorization()
+    noop_seconds = time.perf_counter() - started
+
+    changed = touch_files(documents_path, 0.1, config.seed)
+    started = time.perf_counter()
+    incremental = run_vectorization()
+    incremental_seconds = time.perf_counter() - started
+
+    chunks = full["chunks_added"]
+    return {
+        "metrics": {
+            "files": config.files,
+            "chunks": chunks,
+            "full_seconds": round(full_seconds, 3),
+            "chunks_per_sec": round(chunks / full_seconds, 2) if full_seconds else 0.0,
+            "files_per_sec": round(config.files / full_seconds, 2) if full_seconds else 0.0,
+            "noop_seconds": round(noop_seconds, 3),
+            "incremental_seconds": round(incremental_seconds, 3),
+            "incremental_files": len(changed)
+        },
+        "details": {"full": full, "incremental": incremental}
+    }
+
+
+async def generate_mcq(config):
+    """
+    /rag/generate_mcq/ com `concurrency` pedidos simultâneos (laço fechado),
+    em cada nível de concorrência. Tópicos distintos por padrão; com
+    `topic_pool` os tópicos se repetem (caches e coalescência entram em jogo).
+    """
+    from app.Rag_router import MCQRequest, generate_mcq as generate_mcq_endpoint
+    from app.llm_client import chat_client
+
+    metrics, details = {}, {}
+    total = config.requests * len(config.concurrency)
+    topics = query_topics(config.topic_pool or total, config.seed)
+    next_topic = 0
+
+    for concurrency in config.concurrency:
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, errors = [], []
+        calls_before = chat_client.stats()["calls"]
+
+        async def one(topic):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await generate_mcq_endpoint(
+                        MCQRequest(topic=topic, qnt_questoes=config.questions)
+                    )
+                    if not isinstance(response, dict):
+                        errors.append(f"HTTP {response.status_code}")
+                        return
+                except Exception as e:
+                    errors.append(str(getattr(e, "detail", e))[:200])
+                    return
+                latencies.append(time.perf_counter() - started)
+
+        level_topics = [topics[(next_topic + i) % len(topics)] for i in range(config.requests)]
+        next_topic += config.requests
+        started = time.perf_counter()
+        await asyncio.gather(*(one(topic) for topic in level_topics))
+        wall = time.perf_counter() - started
+
+        prefix = f"c{concurrency}_"
+        metrics.update({k: v for k, v in summarize(latencies, prefix).items() if k != f"{prefix}n"})
+        metrics[f"{prefix}requests_per_sec"] = round(len(latencies) / wall, 2) if wall else 0.0
+        metrics[f"{prefix}errors"] = len(errors)
+        details[f"c{concurrency}"] = {
+            "wall_seconds": round(wall, 3),
+            "llm_calls": chat_client.stats()["calls"] - calls_before,
+            "errors": errors[:10]
+        }
+
+    return {"metrics": metrics, "details": details}
+
+
+async def create_exam(config):
+    """Um exame gerado pelo endpoint (usado pelos cenários de correção)."""
+    from app.Rag_router import MCQRequest, generate_mcq as generate_mcq_endpoint
+
+    mcq = await generate_mcq_endpoint(
+        MCQRequest(topic=query_topics(1, config.seed + 100)[0], qnt_questoes=config.exam_questions)
+    )
+    if not isinstance(mcq, dict):
+        raise RuntimeError(f"Falha ao gerar o exame do benchmark: HTTP {mcq.status_code}")
+    questions = {k: v for k, v in mcq.items() if k.startswith("question ")}
+    return mcq["exam_id"], questions
+
+
+async def check_answer(config):
+    """
+    Correção questão a questão pelo /rag/check_answer/: uma chamada por
+    questão, cada uma com a questão inteira no corpo.
+    """
+    from app.Rag_router import CheckAnswerRequest, check_answer as check_answer_endpoint
+
+    exam_id, questions = await create_exam(config)
+    latencies, payload_bytes = [], 0
+    started = time.perf_counter()
+    for round_ in range(config.answer_rounds):
+        for i, (question_id, question) in enumerate(questions.items()):
+            chosen = question["options"][(i + round_) % len(question["options"])]["option"]
+            body = {"question_data": question, "chosen_option": chosen,
+                    "exam_id": exam_id, "question_id": question_id}
+            payload_bytes += len(json.dumps(body, ensure_ascii=False).encode("utf-8"))
+            t = time.perf_counter()
+            check_answer_endpoint(CheckAnswerRequest(**body))
+            latencies.append(time.perf_counter() - t)
+    wall = time.perf_counter() - started
+
+    return {
+        "metrics": {
+            **{k: v for k, v in summarize(latencies).items() if k != "n"},
+            "requests": len(latencies),
+            "exam_seconds": round(wall / config.answer_rounds, 4),
+            "payload_bytes_per_exam": payload_bytes // config.answer_rounds
+        },
+        "details": {"questions": len(questions), "rounds": config.answer_rounds}
+    }
+
+
+async def submit_answers(config):
+    """Mesma correção do check_answer, mas em lote: uma chamada por exame, só (question_id, índice)."""
+    from app.Rag_router import SubmitAnswersRequest, submit_answers as submit_answers_endpoint
+
+    exam_id, questions = await create_exam(config)
+    latencies, payload_bytes = [], 0
+    for round_ in range(config.answer_rounds):
+        body = {
+            "exam_id": exam_id,
+            "answers": [
+                {"question_id": question_id, "option_index": (i + round_) % len(question["options"])}
+                for i, (question_id, question) in enumerate(questions.items())
+            ]
+        }
+        payload_bytes += len(json.dumps(body, ensure_ascii=False).encode("utf-8"))
+        t = time.perf_counter()
+        submit_answers_endpoint(SubmitAnswersRequest(**body))
+        latencies.append(time.perf_counter() - t)
+
+    return {
+        "metrics": {
+            **{k: v for k, v in summarize(latencies).items() if k != "n"},
+            "requests": len(latencies),
+            "exam_seconds": round(sum(latencies) / config.answer_rounds, 4),
+            "payload_bytes_per_exam": payload_bytes // config.answer_rounds
+        },
+        "details": {"questions": len(questions), "rounds": config.answer_rounds}
+    }
+
+
+async def render_pdf(config):
+    """PDF de exames de vários tamanhos: sem cache (exame novo a cada vez) e com cache."""
+    from app.pdf_render import render_pdf as render
+
+    metrics = {}
+    for size in config.pdf_sizes:
+        cold, warm = [], []
+        for i in range(config.pdf_repeats):
+            exame = fake_questions(f"Documentos de apoio: exame {size} variação {i} {config.seed}", size)
+            t = time.perf_counter()
+            await render(exame)
+            cold.append(time.perf_counter() - t)
+            t = time.perf_counter()
+            await render(exame)
+            warm.append(time.perf_counter() - t)
+        for kind, latencies in (("cold", cold), ("warm", warm)):
+            prefix = f"q{size}_{kind}_"
+            metrics.update({k: v for k, v in summarize(latencies, prefix).items() if k != f"{prefix}n"})
+    return {"metrics": metrics, "details": {"sizes": config.pdf_sizes, "repeats": config.pdf_repeats}}
+
+
+SCENARIOS = {
+    "ingest": ingest,
+    "generate_mcq": generate_mcq,
+    "check_answer": check_answer,
+    "submit_answers": submit_answers,
+    "render_pdf": render_pdf,
+}
@@ -0,0 +1,200 @@
+"""
+Substitutos locais e determinísticos do ChatGoogleGenerativeAI e do
+GoogleGenerativeAIEmbeddings, com latência e taxa de falhas configuráveis.
+
+O sorteio de latência/falha depende só do conteúdo da chamada e de quantas
+vezes ela já foi feita (não da ordem em que as corrotinas rodam), então duas
+execuções com a mesma semente fazem exatamente as mesmas chamadas.
+"""
+import re
+import json
+import time
+import math
+import random
+import asyncio
+import hashlib
+import threading
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+
+WORD_RE = re.compile(r"\w{4,}", re.UNICODE)
+COUNT_RE = re.compile(r"gerar (\d+) questões")
+TOPIC_RE = re.compile(r"no\(s\) tema\(s\): (.+?)\.\n")
+
+
+class StubFailure(Exception):
+    """Falha simulada; o código 503 é tratado como transitório pelo llm_client."""
+
+    code = 503
+
+
+class CallProfile:
+    """Latência (média, jitter) e taxa de falhas de um serviço simulado."""
+
+    def __init__(self, latency_ms: float, jitter: float = 0.2, failure_rate: float = 0.0,
+                 per_item_ms: float = 0.0, seed: int = 42):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.per_item_ms = per_item_ms
+        self.seed = seed
+        self.attempts = {}
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+
+    def draw(self, payload: str, n_items: int = 1):
+        """(segundos de latência, se falha) para esta chamada."""
+        digest = hashlib.sha256(f"{self.seed}:{payload}".encode("utf-8")).hexdigest()
+        with self.lock:
+            attempt = self.attempts.get(digest, 0)
+            self.attempts[digest] = attempt + 1
+            self.calls += 1
+        rng = random.Random(f"{digest}:{attempt}")
+        latency = self.latency_ms * max(0.0, 1 + rng.uniform(-self.jitter, self.jitter))
+        latency += self.per_item_ms * n_items
+        failed = rng.random() < self.failure_rate
+        if failed:
+            with self.lock:
+                self.failures += 1
+        return latency / 1000, failed
+
+    def stats(self):
+        return {"calls": self.calls, "failures": self.failures}
+
+
+def _prompt_text(messages):
+    if isinstance(messages, str):
+        return messages
+    return "\n".join(str(m[1] if isinstance(m, tuple) else getattr(m, "content", m)) for m in messages)
+
+
+def _usage(prompt: str, completion: str):
+    # Aproximação de ~4 caracteres por token, como a do orçamento de contexto
+    input_tokens, output_tokens = len(prompt) // 4, len(completion) // 4
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens}
+
+
+def fake_questions(prompt: str, n: int):
+    """
+    Questões válidas (4 alternativas, 1 correta) montadas com palavras do
+    próprio prompt, para que a deduplicação e o PDF trabalhem com textos
+    variados. Determinístico para o mesmo prompt.
+    """
+    words = WORD_RE.findall(prompt.split("Documentos de apoio", 1)[-1]) or ["conceito", "definição", "exemplo"]
+    topic = TOPIC_RE.search(prompt)
+    topic = topic.group(1) if topic else "o tema"
+    rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+
+    questions = {}
+    for i in range(1, n + 1):
+        correct = rng.randrange(4)
+        terms = rng.sample(words, min(6, len(words)))
+        questions[f"question {i}"] = {
+            "text": f"Sobre {topic}, qual afirmação relaciona corretamente {', '.join(terms[:3])}?",
+            "options": [
+                {
+                    "option": f"{' '.join(rng.sample(words, min(4, len(words))))} ({'ABCD'[j]})",
+                    "is_correct": j == correct,
+                    "explanation": f"{'Correta' if j == correct else 'Incorreta'}: {' '.join(terms[3:])}."
+                }
+                for j in range(4)
+            ],
+            "resolution": f"A alternativa {'ABCD'[correct]} descreve a relação entre {terms[0]} e {terms[-1]}."
+        }
+    return questions
+
+
+def fake_completion(prompt: str):
+    """Resposta do modelo: JSON de questões para prompts de MCQ, texto curto para o resto."""
+    count = COUNT_RE.search(prompt)
+    if count:
+        return json.dumps(fake_questions(prompt, int(count.group(1))), ensure_ascii=False, indent=2)
+    return "**Feedback:** desempenho simulado pelo benchmark.\n" + " ".join(WORD_RE.findall(prompt)[:50])
+
+
+class StubChatModel:
+    """Substituto do ChatGoogleGenerativeAI (invoke, ainvoke e astream)."""
+
+    def __init__(self, profile: CallProfile, stream_chunks: int = 8):
+        self.profile = profile
+        self.stream_chunks = stream_chunks
+
+    def _call(self, messages):
+        prompt = _prompt_text(messages)
+        latency, failed = self.profile.draw(prompt)
+        return prompt, latency, failed
+
+    def invoke(self, messages, **kwargs):
+        prompt, latency, failed = self._call(messages)
+        time.sleep(latency)
+        if failed:
+            raise StubFailure("503 Service Unavailable (falha simulada)")
+        completion = fake_completion(prompt)
+        return AIMessage(content=completion, usage_metadata=_usage(prompt, completion))
+
+    async def ainvoke(self, messages, **kwargs):
+        prompt, latency, failed = self._call(messages)
+        await asyncio.sleep(latency)
+        if failed:
+            raise StubFailure("503 Service Unavailable (falha simulada)")
+        completion = fake_completion(prompt)
+        return AIMessage(content=completion, usage_metadata=_usage(prompt, completion))
+
+    async def astream(self, messages, **kwargs):
+        prompt, latency, failed = self._call(messages)
+        completion = fake_completion(prompt)
+        size = math.ceil(len(completion) / self.stream_chunks)
+        for i in range(0, len(completion), size):
+            await asyncio.sleep(latency / self.stream_chunks)
+            if failed and i == 0:
+                raise StubFailure("503 Service Unavailable (falha simulada)")
+            part = completion[i:i + size]
+            yield AIMessageChunk(content=part, usage_metadata=_usage(prompt if i == 0 else "", part))
+
+
+class StubEmbeddings(Embeddings):
+    """
+    Substituto do GoogleGenerativeAIEmbeddings: feature hashing das palavras,
+    então textos parecidos têm vetores parecidos (a busca e a deduplicação
+    se comportam como com um modelo de verdade, só que sem rede).
+    """
+
+    def __init__(self, profile: CallProfile, dim: int = 384):
+        self.profile = profile
+        self.dim = dim
+
+    def _vector(self, text: str):
+        vector = [0.0] * self.dim
+        for word in WORD_RE.findall(text.lower()):
+            h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "big")
+            vector[h % self.dim] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _call(self, texts):
+        latency, failed = self.profile.draw("\n".join(texts), len(texts))
+        time.sleep(latency)
+        if failed:
+            raise StubFailure("503 Service Unavailable (falha simulada)")
+        return [self._vector(text) for text in texts]
+
+    def embed_documents(self, texts):
+        return self._call(list(texts))
+
+    def embed_query(self, text):
+        return self._call([text])[0]
+
+
+def install(chat_profile: CallProfile, embed_profile: CallProfile, dim: int = 384):
+    """
+    Troca os clientes do Gemini pelos substitutos. Deve ser chamado antes do
+    primeiro uso: os singletons de app.resources/app.embeddings são criados
+    sob demanda e passam a devolver os stubs.
+    """
+    from app import embeddings, resources
+
+    resources._chat_model = StubChatModel(chat_profile)
+    embeddings.create_base_embeddings = lambda: StubEmbeddings(embed_profile, dim)
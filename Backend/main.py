@@ -1,11 +1,44 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
 from typing import Union
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi import FastAPI, Request
 
-from app.create_base import router as base_router
+from app.create_base import router as base_router, ingest_jobs
 from app.Rag_router import router as Rag_router
+from app import ingestion, metrics, pdf_render
+from app.resources import readiness, warm_up
+from app.exam_repository import get_exam_repository
+from app.exam_sessions import get_session_store
+from app.uploads import get_upload_store
 
-app = FastAPI()
+
+def open_stores():
+    """Cria os bancos SQLite do app (sem efeito se já foram abertos no primeiro uso)."""
+    get_exam_repository()
+    get_session_store()
+    get_upload_store()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Os clientes (Gemini, embeddings, Chroma) são criados em segundo plano:
+    # o servidor já aceita conexões enquanto isso e o /ready indica quando terminou
+    warmup = asyncio.create_task(asyncio.to_thread(warm_up))
+    # Os bancos SQLite (exames, sessões, uploads, jobs) são abertos aqui, não na importação
+    await asyncio.to_thread(open_stores)
+    # Retoma jobs de vetorização interrompidos por um reinício
+    ingest_jobs.start()
+    yield
+    if not warmup.done():
+        warmup.cancel()
+    ingestion.shutdown_pool()
+    pdf_render.shutdown_pool()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,10 +48,47 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    """Duração por rota no /metrics e spans das etapas no cabeçalho Server-Timing."""
+    token = metrics.start_trace()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        # Respostas em stream: os spans após o início do corpo não entram no cabeçalho
+        server_timing = metrics.end_trace(token)
+        token = None
+        if server_timing:
+            response.headers["Server-Timing"] = server_timing
+        return response
+    finally:
+        if token is not None:
+            metrics.end_trace(token)
+        # Rota com parâmetros ({exam_id}) em vez do caminho, para não explodir os rótulos
+        route = request.scope.get("route")
+        metrics.http_request_seconds.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(status)
+        )
+
 @app.get("/")
 def read_root():
     return {"Projeto ExameForg"}
 
+@app.get("/ready")
+def ready():
+    """Prontidão: 200 quando os clientes compartilhados foram inicializados, 503 antes disso."""
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Métricas no formato texto do Prometheus: etapas do pipeline, tokens, caches e HTTP."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 app.include_router(base_router)
 app.include_router(Rag_router)
 
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+
+from app.bm25 import BM25Index, tokenize
+
+
+def make_index(docs):
+    tmp = tempfile.TemporaryDirectory()
+    index = BM25Index(os.path.join(tmp.name, "bm25.json"))
+    index.add(list(docs), list(docs.values()))
+    return index, tmp
+
+
+class TokenizeTest(unittest.TestCase):
+    def test_accents_case_and_stopwords(self):
+        self.assertEqual(tokenize("A Camada de Transporte e o protocolo TCP"),
+                         ["camada", "transporte", "protocolo", "tcp"])
+        self.assertEqual(tokenize("Sessão"), tokenize("sessao"))
+
+
+class BM25SearchTest(unittest.TestCase):
+    def setUp(self):
+        self.index, tmp = make_index({
+            "tcp": "O TCP garante entrega confiável com confirmação e retransmissão.",
+            "udp": "O UDP não garante entrega: datagramas sem confirmação.",
+            "ip": "O IP faz o roteamento dos pacotes entre redes.",
+            "tcp_longo": "TCP. " + "Texto longo sobre outras camadas da pilha de rede. " * 10
+        })
+        self.addCleanup(tmp.cleanup)
+
+    def test_rare_term_ranks_its_documents_first(self):
+        results = self.index.search("retransmissão no TCP")
+        self.assertEqual(results[0][0], "tcp")
+        self.assertNotIn("udp", [doc_id for doc_id, _ in results])
+
+    def test_length_normalization(self):
+        scores = dict(self.index.search("TCP"))
+        # Mesma frequência do termo: o chunk curto pontua mais que o longo
+        self.assertGreater(scores["tcp"], scores["tcp_longo"])
+
+    def test_scores_are_sorted_and_limited(self):
+        results = self.index.search("garante entrega confirmação", top_n=1)
+        self.assertEqual(len(results), 1)
+        results = self.index.search("garante entrega confirmação")
+        self.assertEqual([s for _, s in results], sorted((s for _, s in results), reverse=True))
+
+    def test_unknown_and_empty_queries(self):
+        self.assertEqual(self.index.search("kubernetes"), [])
+        self.assertEqual(self.index.search("de o a"), [])
+
+    def test_update_replaces_the_document(self):
+        self.index.add(["ip"], ["Agora o chunk fala de retransmissão."])
+        self.assertIn("ip", dict(self.index.search("retransmissão")))
+        self.assertNotIn("ip", dict(self.index.search("roteamento")))
+        self.index.remove(["ip"])
+        self.assertEqual(self.index.count(), 3)
+        self.assertNotIn("ip", dict(self.index.search("retransmissão")))
+
+    def test_covers(self):
+        self.assertTrue(self.index.covers("TCP UDP"))
+        self.assertFalse(self.index.covers("TCP kubernetes"))
+
+    def test_save_and_reload(self):
+        self.index.save()
+        reloaded = BM25Index(self.index.path)
+        self.assertEqual(reloaded.search("TCP"), self.index.search("TCP"))
+
+
+if __name__ == "__main__":
+    unittest.main()
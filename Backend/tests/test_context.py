@@ -0,0 +1,59 @@
+import unittest
+
+try:
+    from langchain_core.documents import Document
+    from app.retrieval import assemble_context, estimate_tokens, merge_source_chunks
+except ImportError as e:
+    # numpy e langchain vêm do requirements.txt
+    raise unittest.SkipTest(f"dependência ausente: {e}")
+
+
+def doc(text, source="a.txt", start=None):
+    metadata = {"source": source}
+    if start is not None:
+        metadata["start_index"] = start
+    return Document(page_content=text, metadata=metadata)
+
+
+class MergeSourceChunksTest(unittest.TestCase):
+    def test_overlapping_neighbours_are_merged(self):
+        text = "O TCP garante a entrega ordenada dos segmentos."
+        docs = [doc(text[20:], start=20), doc(text[:30], start=0)]
+        self.assertEqual(merge_source_chunks(docs), [text])
+
+    def test_mismatched_overlap_is_kept_apart(self):
+        docs = [doc("abcdefghij", start=0), doc("XYZklmnop", start=7)]
+        self.assertEqual(merge_source_chunks(docs), ["abcdefghij", "XYZklmnop"])
+
+    def test_gap_and_missing_start_are_kept_apart(self):
+        docs = [doc("primeiro", start=0), doc("distante", start=500), doc("sem posição")]
+        self.assertEqual(len(merge_source_chunks(docs)), 3)
+
+
+class AssembleContextTest(unittest.TestCase):
+    def test_groups_by_source_in_relevance_order(self):
+        docs = [doc("B1", "b.txt"), doc("A1", "a.txt"), doc("B2", "b.txt")]
+        context, stats = assemble_context(docs, max_tokens=1000)
+        self.assertEqual(
+            context.split("\n\n"),
+            ["Fonte: b.txt\nConteúdo: B1", "Fonte: b.txt\nConteúdo: B2", "Fonte: a.txt\nConteúdo: A1"]
+        )
+        self.assertEqual(stats["passages_out"], 3)
+
+    def test_budget_drops_what_does_not_fit(self):
+        first, second = doc("x" * 200, "a.txt"), doc("y" * 200, "b.txt")
+        context, stats = assemble_context([first, second], max_tokens=100)
+        self.assertEqual(context, f"Fonte: a.txt\nConteúdo: {'x' * 200}")
+        self.assertEqual(stats["passages_out"], 1)
+        self.assertLessEqual(stats["tokens_out"], 100)
+        self.assertGreater(stats["tokens_saved"], 0)
+
+    def test_large_passage_is_truncated_to_the_budget(self):
+        context, stats = assemble_context([doc("z" * 4000)], max_tokens=300)
+        self.assertEqual(len(context), 300 * 4)
+        self.assertTrue(context.startswith("Fonte: a.txt\nConteúdo: zzz"))
+        self.assertEqual(stats["tokens_out"], estimate_tokens(context))
+
+
+if __name__ == "__main__":
+    unittest.main()
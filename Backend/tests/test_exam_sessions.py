@@ -0,0 +1,111 @@
+import os
+import tempfile
+import unittest
+
+from app.exam_sessions import MemorySessionStore, SQLiteSessionStore, grade_answers, question_state
+
+
+def question(text, correct):
+    return {
+        "text": text,
+        "options": [
+            {"option": f"{text} {i}", "is_correct": i == correct, "explanation": f"Explicação {i}"}
+            for i in range(4)
+        ]
+    }
+
+
+EXAM = {"question 1": question("Q1", 0), "question 2": question("Q2", 2), "question 3": question("Q3", 3)}
+
+
+class GradeAnswersTest(unittest.TestCase):
+    def test_correct_and_wrong_answers(self):
+        results, summary = grade_answers(EXAM, [("question 1", 0), ("question 2", 1)])
+        self.assertTrue(results[0]["is_correct"])
+        self.assertFalse(results[1]["is_correct"])
+        self.assertEqual(results[1]["correct_index"], 2)
+        self.assertEqual(results[1]["explanation_correct"], "Explicação 2")
+        self.assertEqual((summary["answered"], summary["correct"], summary["total_questions"]), (2, 1, 3))
+        self.assertEqual(summary["score"], round(1 / 3, 4))
+
+    def test_invalid_answers_are_reported_per_question(self):
+        results, summary = grade_answers(
+            EXAM, [("question 9", 0), ("question 1", 0), ("question 1", 1), ("question 2", 4), ("question 3", -1)]
+        )
+        self.assertIn("error", results[0])
+        self.assertTrue(results[1]["is_correct"])
+        self.assertIn("mais de uma vez", results[2]["error"])
+        self.assertIn("inexistente", results[3]["error"])
+        self.assertIn("inexistente", results[4]["error"])
+        # A resposta repetida não sobrescreve a primeira
+        self.assertEqual((summary["answered"], summary["correct"]), (1, 1))
+
+    def test_score_includes_earlier_submissions(self):
+        states = {key: question_state(q) for key, q in EXAM.items()}
+        grade_answers(EXAM, [("question 1", 0)], states)
+        _, summary = grade_answers(EXAM, [("question 2", 2), ("question 3", 0)], states)
+        self.assertEqual((summary["answered"], summary["correct"]), (3, 2))
+        self.assertEqual(summary["percentage"], 66.7)
+
+
+class SessionStoreParityTest(unittest.TestCase):
+    """Os dois backends precisam se comportar da mesma forma."""
+
+    def stores(self, ttl=60):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        sqlite_store = SQLiteSessionStore(os.path.join(tmp.name, "sessions.sqlite"), ttl=ttl)
+        self.addCleanup(sqlite_store.conn.close)
+        return [MemorySessionStore(ttl=ttl), sqlite_store]
+
+    def test_round_trip(self):
+        for store in self.stores():
+            with self.subTest(store=type(store).__name__):
+                exam_id = store.create(EXAM)
+                states = store.get(exam_id)
+                self.assertEqual(states, {key: question_state(q) for key, q in EXAM.items()})
+
+                state = dict(states["question 1"], chosen_option="Q1 0", is_correct=True)
+                self.assertTrue(store.set_question(exam_id, "question 1", state))
+                self.assertEqual(store.get_question(exam_id, "question 1"), state)
+                self.assertIsNone(store.get_question(exam_id, "question 9"))
+
+                other = dict(states["question 2"], chosen_option="Q2 1")
+                self.assertTrue(store.update_questions(exam_id, {"question 2": other}))
+                states = store.get(exam_id)
+                self.assertEqual(states["question 1"], state)
+                self.assertEqual(states["question 2"], other)
+                self.assertEqual(states["question 3"], question_state(EXAM["question 3"]))
+
+    def test_returned_and_saved_states_are_copies(self):
+        for store in self.stores():
+            with self.subTest(store=type(store).__name__):
+                states = {"question 1": question_state(EXAM["question 1"])}
+                store.save("exame", states)
+                states["question 1"]["chosen_option"] = "alterado"
+                store.get("exame")["question 1"]["chosen_option"] = "alterado"
+                self.assertEqual(store.get_question("exame", "question 1")["chosen_option"], "")
+
+    def test_unknown_exam(self):
+        for store in self.stores():
+            with self.subTest(store=type(store).__name__):
+                self.assertIsNone(store.get("nada"))
+                self.assertIsNone(store.get_question("nada", "question 1"))
+                self.assertFalse(store.set_question("nada", "question 1", {}))
+                self.assertFalse(store.update_questions("nada", {"question 1": {}}))
+
+    def test_expired_sessions(self):
+        for store in self.stores(ttl=-1):
+            with self.subTest(store=type(store).__name__):
+                exam_id = store.create(EXAM)
+                self.assertIsNone(store.get(exam_id))
+                self.assertIsNone(store.get_question(exam_id, "question 1"))
+                self.assertFalse(store.set_question(exam_id, "question 1", {}))
+                self.assertFalse(store.update_questions(exam_id, {"question 1": {}}))
+                store.purge_expired()
+                store.ttl = 60
+                self.assertIsNone(store.get(exam_id))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,243 @@
+import time
+import asyncio
+import unittest
+
+from app.llm_client import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LLM_HEDGE_MIN_SAMPLES,
+    ResilientClient,
+    is_rate_limited,
+    is_retryable
+)
+
+
+class HTTPError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+class ResourceExhausted(Exception):
+    """Mesmo nome da exceção do google.api_core (429)."""
+
+
+def make_client(max_retries=3, threshold=2, reset_timeout=60):
+    client = ResilientClient("teste", rate=1000, burst=1000, max_retries=max_retries)
+    client.breaker = CircuitBreaker(threshold, reset_timeout)
+    client._backoff = lambda attempt: 0
+    return client
+
+
+def half_open(breaker):
+    """Abre o breaker com o prazo de espera já vencido."""
+    breaker.failures = breaker.failure_threshold
+    breaker.opened_at = time.monotonic() - breaker.reset_timeout - 1
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker(2, 60)
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        with self.assertRaises(CircuitOpenError):
+            breaker.allow()
+
+    def test_success_resets_failures(self):
+        breaker = CircuitBreaker(2, 60)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+
+    def test_half_open_allows_a_single_probe(self):
+        breaker = CircuitBreaker(2, 60)
+        half_open(breaker)
+        self.assertEqual(breaker.state, "half_open")
+        self.assertTrue(breaker.allow())
+        with self.assertRaises(CircuitOpenError):
+            breaker.allow()
+
+    def test_probe_success_closes(self):
+        breaker = CircuitBreaker(2, 60)
+        half_open(breaker)
+        breaker.allow()
+        breaker.record_success()
+        breaker.end_probe()
+        self.assertEqual(breaker.state, "closed")
+        self.assertFalse(breaker.probing)
+
+    def test_probe_failure_reopens(self):
+        breaker = CircuitBreaker(2, 60)
+        half_open(breaker)
+        breaker.allow()
+        breaker.record_failure()
+        breaker.end_probe()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.probing)
+
+
+class ResilientClientBreakerTest(unittest.TestCase):
+    def test_retryable_probe_failure_is_not_retried(self):
+        client = make_client()
+        half_open(client.breaker)
+        calls = []
+
+        def fail():
+            calls.append(1)
+            raise HTTPError(503)
+
+        with self.assertRaises(HTTPError):
+            client.call(fail)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(client.breaker.state, "open")
+        self.assertFalse(client.breaker.probing)
+
+    def test_probe_success_closes(self):
+        client = make_client()
+        half_open(client.breaker)
+        self.assertEqual(client.call(lambda: "ok"), "ok")
+        self.assertEqual(client.breaker.state, "closed")
+
+    def test_closed_call_retries_transient_errors(self):
+        client = make_client(threshold=10)
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise HTTPError(429)
+            return "ok"
+
+        self.assertEqual(client.call(flaky), "ok")
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(client.stats()["retries"], 2)
+        self.assertEqual(client.stats()["rate_limited"], 2)
+
+    def test_async_probe_failure_is_not_retried(self):
+        client = make_client()
+        half_open(client.breaker)
+        calls = []
+
+        async def fail():
+            calls.append(1)
+            raise HTTPError(500)
+
+        with self.assertRaises(HTTPError):
+            asyncio.run(client.acall(fail))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(client.breaker.state, "open")
+        self.assertFalse(client.breaker.probing)
+
+    def test_cancelled_probe_releases_the_slot(self):
+        client = make_client()
+        half_open(client.breaker)
+
+        async def cancelled():
+            raise asyncio.CancelledError()
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(client.acall(cancelled))
+        self.assertFalse(client.breaker.probing)
+        self.assertEqual(client.breaker.state, "half_open")
+        self.assertEqual(client.call(lambda: "ok"), "ok")
+        self.assertEqual(client.breaker.state, "closed")
+
+    def test_stream_probe_failure_is_not_retried(self):
+        client = make_client()
+        half_open(client.breaker)
+        calls = []
+
+        async def stream():
+            calls.append(1)
+            raise HTTPError(503)
+            yield
+
+        async def consume():
+            return [item async for item in client.astream(stream)]
+
+        with self.assertRaises(HTTPError):
+            asyncio.run(consume())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(client.breaker.state, "open")
+        self.assertFalse(client.breaker.probing)
+
+    def test_non_retryable_failures_do_not_open_the_breaker(self):
+        client = make_client(threshold=2)
+
+        def bad_request():
+            raise HTTPError(400)
+
+        for _ in range(5):
+            with self.assertRaises(HTTPError):
+                client.call(bad_request)
+        self.assertEqual(client.breaker.state, "closed")
+        self.assertEqual(client.stats()["failures"], 5)
+
+    def test_non_retryable_probe_failure_reopens(self):
+        client = make_client()
+        half_open(client.breaker)
+
+        def bad_request():
+            raise HTTPError(400)
+
+        with self.assertRaises(HTTPError):
+            client.call(bad_request)
+        self.assertEqual(client.breaker.state, "open")
+
+    def test_cancelled_hedged_call_cancels_the_primary(self):
+        client = make_client()
+        client.hedge = True
+        for _ in range(LLM_HEDGE_MIN_SAMPLES):
+            client.latency.add(60)
+        started = []
+
+        async def slow():
+            task = asyncio.current_task()
+            started.append(task)
+            await asyncio.sleep(60)
+
+        async def run():
+            caller = asyncio.ensure_future(client.acall(slow))
+            while not started:
+                await asyncio.sleep(0)
+            caller.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await caller
+            await asyncio.sleep(0)
+            return started[0].done()
+
+        self.assertTrue(asyncio.run(run()))
+
+
+class RetryableTest(unittest.TestCase):
+    def test_status_codes(self):
+        self.assertTrue(is_retryable(HTTPError(503)))
+        self.assertTrue(is_retryable(HTTPError(429)))
+        self.assertFalse(is_retryable(HTTPError(400)))
+        self.assertFalse(is_retryable(HTTPError(404)))
+
+    def test_message_is_not_enough(self):
+        self.assertFalse(is_retryable(ValueError("internal field 500 missing in connection config")))
+
+    def test_wrapped_error(self):
+        try:
+            try:
+                raise ResourceExhausted("quota")
+            except ResourceExhausted as e:
+                raise RuntimeError("Erro do Gemini") from e
+        except RuntimeError as wrapped:
+            self.assertTrue(is_retryable(wrapped))
+            self.assertTrue(is_rate_limited(wrapped))
+
+    def test_builtin_transport_errors(self):
+        self.assertTrue(is_retryable(TimeoutError()))
+        self.assertTrue(is_retryable(ConnectionResetError()))
+        self.assertFalse(is_rate_limited(HTTPError(503)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+from app.manifest import IndexManifest, chunk_ids, file_sha256
+
+
+class ManifestDiffTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.manifest = IndexManifest(os.path.join(self.tmp.name, "manifest.json"))
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return path
+
+    def record(self, path):
+        st = os.stat(path)
+        sha = file_sha256(path)
+        self.manifest.record(path, st.st_size, st.st_mtime_ns, sha, chunk_ids(path, sha, 2))
+
+    def test_added_changed_unchanged_and_removed(self):
+        kept = self.write("kept.txt", "igual")
+        edited = self.write("edited.txt", "versão 1")
+        gone = self.write("gone.txt", "apagado")
+        for path in (kept, edited, gone):
+            self.record(path)
+
+        self.write("edited.txt", "versão 2, mais longa")
+        os.remove(gone)
+        added = self.write("added.txt", "novo")
+
+        new, changed, unchanged, removed = self.manifest.diff([kept, edited, added])
+        self.assertEqual([item[0] for item in new], [added])
+        self.assertEqual([item[0] for item in changed], [edited])
+        self.assertEqual(changed[0][3], file_sha256(edited))
+        self.assertEqual(unchanged, [kept])
+        self.assertEqual(removed, [gone])
+
+    def test_touched_file_with_same_content_is_unchanged(self):
+        path = self.write("doc.txt", "conteúdo")
+        self.record(path)
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+        new, changed, unchanged, removed = self.manifest.diff([path])
+        self.assertEqual((new, changed, removed), ([], [], []))
+        self.assertEqual(unchanged, [path])
+        # O mtime novo fica registrado: a próxima comparação nem recalcula o hash
+        self.assertEqual(self.manifest.entries[path]["mtime"], st.st_mtime_ns + 10 ** 9)
+
+
+class ChunkIdsTest(unittest.TestCase):
+    def test_stable_for_same_path_and_content(self):
+        self.assertEqual(chunk_ids("Documentos/a.pdf", "ab" * 32, 3), chunk_ids("Documentos/a.pdf", "ab" * 32, 3))
+        self.assertEqual(len(set(chunk_ids("Documentos/a.pdf", "ab" * 32, 3))), 3)
+
+    def test_change_with_path_or_content(self):
+        ids = chunk_ids("Documentos/a.pdf", "ab" * 32, 2)
+        self.assertNotEqual(ids, chunk_ids("Documentos/b.pdf", "ab" * 32, 2))
+        self.assertNotEqual(ids, chunk_ids("Documentos/a.pdf", "cd" * 32, 2))
+        self.assertEqual(ids, chunk_ids("Documentos/a.pdf", "ab" * 32, 3)[:2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import json
+import unittest
+
+from app.mcq_parser import parse_mcq
+
+
+def question(text, correct=0):
+    return {
+        "text": text,
+        "options": [
+            {"option": f"Alternativa {i}", "is_correct": i == correct, "explanation": f"Explicação {i}"}
+            for i in range(4)
+        ],
+        "resolution": "Resumo"
+    }
+
+
+class SmartQuoteTest(unittest.TestCase):
+    def test_smart_quotes_inside_strings_are_kept(self):
+        first = question("O protocolo “TCP”, ao contrário do “UDP”: garante a entrega?")
+        text = json.dumps({"question 1": first, "question 2": question("Outra")}, ensure_ascii=False)
+        # Resposta truncada no meio da segunda questão
+        valid, rejected = parse_mcq(text[:-40])
+        self.assertEqual(rejected, [])
+        self.assertEqual([q["text"] for q in valid], [first["text"]])
+
+    def test_smart_quotes_as_delimiters_are_repaired(self):
+        text = json.dumps({"question 1": question("Enunciado")}, ensure_ascii=False)
+        text = text.replace('"text": "Enunciado"', '“text”: “Enunciado com “aspas” no meio”')
+        valid, rejected = parse_mcq(text)
+        self.assertEqual(rejected, [])
+        self.assertEqual(valid[0]["text"], "Enunciado com “aspas” no meio")
+
+    def test_trailing_commas_and_python_literals(self):
+        text = (
+            '{"question 1": {"text": "Enunciado", "options": ['
+            '{"option": "A", "is_correct": True, "explanation": "x"},'
+            '{"option": "B", "is_correct": False, "explanation": "y"},'
+            '{"option": "C", "is_correct": False, "explanation": "z"},'
+            '{"option": "D", "is_correct": False, "explanation": "w"},'
+            '], "resolution": None,}}'
+        )
+        valid, rejected = parse_mcq(text)
+        self.assertEqual(rejected, [])
+        self.assertTrue(valid[0]["options"][0]["is_correct"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+
+try:
+    import numpy as np
+    from app.retrieval import _unit_rows, mmr_select
+except ImportError as e:
+    # numpy e langchain vêm do requirements.txt
+    raise unittest.SkipTest(f"dependência ausente: {e}")
+
+
+class MMRSelectTest(unittest.TestCase):
+    def setUp(self):
+        # 0 e 1 são quase iguais; 2 é diferente e um pouco menos relevante
+        self.matrix = _unit_rows([[1.0, 0.0], [0.99, 0.01], [0.0, 1.0]])
+        self.relevance = np.array([1.0, 0.95, 0.8])
+
+    def test_pure_relevance_keeps_the_ranking(self):
+        self.assertEqual(mmr_select(self.relevance, self.matrix, 3, lambda_mult=1.0), [0, 1, 2])
+
+    def test_diversity_skips_near_duplicates(self):
+        self.assertEqual(mmr_select(self.relevance, self.matrix, 2, lambda_mult=0.5), [0, 2])
+
+    def test_k_larger_than_candidates(self):
+        self.assertEqual(sorted(mmr_select(self.relevance, self.matrix, 10)), [0, 1, 2])
+        self.assertEqual(mmr_select(self.relevance[:0], self.matrix[:0], 3), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
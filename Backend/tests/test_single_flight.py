@@ -0,0 +1,70 @@
+import asyncio
+import unittest
+
+from app.single_flight import SingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+    def test_one_leader_and_flagged_followers(self):
+        flight, calls = SingleFlight(), []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return ["q1", "q2"]
+
+        async def run():
+            return await asyncio.gather(*(flight.do_shared("k", work) for _ in range(3)))
+
+        results = asyncio.run(run())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([shared for _, shared in results], [False, True, True])
+        self.assertTrue(all(result is results[0][0] for result, _ in results))
+        self.assertEqual(flight.stats()["leaders"], 1)
+        self.assertEqual(flight.stats()["followers"], 2)
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+    def test_distinct_keys_do_not_share(self):
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0)
+            return 1
+
+        async def run():
+            return await asyncio.gather(flight.do_shared("a", work), flight.do_shared("b", work))
+
+        self.assertEqual(asyncio.run(run()), [(1, False), (1, False)])
+
+    def test_leader_exception_reaches_followers(self):
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("falhou")
+
+        async def run():
+            return await asyncio.gather(
+                *(flight.do_shared("k", fail) for _ in range(3)), return_exceptions=True
+            )
+
+        errors = asyncio.run(run())
+        self.assertTrue(all(isinstance(e, RuntimeError) for e in errors))
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+    def test_key_is_released_after_completion(self):
+        flight = SingleFlight()
+
+        async def work():
+            return 1
+
+        async def run():
+            first = await flight.do_shared("k", work)
+            second = await flight.do_shared("k", work)
+            return first, second
+
+        self.assertEqual(asyncio.run(run()), ((1, False), (1, False)))
+
+
+if __name__ == "__main__":
+    unittest.main()
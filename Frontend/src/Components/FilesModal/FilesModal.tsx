@@ -125,7 +125,19 @@ const FilesModal: React.FC<FilesModalProps> = ({ onClose, onNext }) => {
 
     setIsCreatingBase(true);
     try {
-      await axios.post("http://localhost:8000/base/create/");
+      const { data } = await axios.post("http://localhost:8000/base/create/");
+
+      // A vetorização roda em segundo plano: acompanha o job até terminar
+      let status = "queued";
+      while (status === "queued" || status === "running") {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const job = await axios.get(`http://localhost:8000/base/jobs/${data.job_id}`);
+        status = job.data.status;
+      }
+      if (status !== "completed") {
+        throw new Error(`Job de vetorização terminou com status ${status}`);
+      }
+
       console.log("Vetorização concluída para todos os arquivos");
       onNext(files.map(f => f.file));
     } catch (error) {
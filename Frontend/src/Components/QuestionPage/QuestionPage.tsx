@@ -28,6 +28,9 @@ const QuestionsPage: React.FC = () => {
   const timeMinutes = state?.timeMinutes || 120;
   const topic = state?.topic || "Geral";
   const generatedQuestions = state?.generatedQuestions || [];
+  const examId: string | undefined = Array.isArray(generatedQuestions)
+    ? undefined
+    : generatedQuestions.exam_id;
 
   // Parse das questões recebidas
   const parsedQuestions: Question[] = useMemo(() => {
@@ -101,6 +104,8 @@ const QuestionsPage: React.FC = () => {
       const response = await axios.post("http://localhost:8000/rag/check_answer/", {
         question_data: question.rawData,
         chosen_option: chosenOption,
+        exam_id: examId,
+        question_id: `question ${questions.indexOf(question) + 1}`,
       });
       return response.data;
     } catch (error) {
@@ -111,7 +116,9 @@ const QuestionsPage: React.FC = () => {
 
   const getFinalEvaluation = async () => {
     try {
-      const response = await axios.post("http://localhost:8000/rag/final_evaluation");
+      const response = await axios.post("http://localhost:8000/rag/final_evaluation", {
+        exam_id: examId,
+      });
       return response.data.feedback;
     } catch (error) {
       console.error("Erro ao obter avaliação final:", error);
@@ -166,6 +173,7 @@ const QuestionsPage: React.FC = () => {
         }, {}),
         question_number: `question ${currentQuestionIndex + 1}`,
         topic,
+        exam_id: examId,
       };
 
       const response = await axios.post(
@@ -233,6 +241,7 @@ const QuestionsPage: React.FC = () => {
           timeMinutes,
           topic,
           initialFiles: state?.initialFiles || [],
+          examId,
           results,
           feedbackText,
         },
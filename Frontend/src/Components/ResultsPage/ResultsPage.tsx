@@ -17,6 +17,7 @@ const ResultsPage = () => {
     timeMinutes,
     topic,
     initialFiles,
+    examId,
     feedbackText = "Não foi possível gerar o feedback personalizado.",
   } = location.state || {};
 
@@ -37,7 +38,7 @@ const ResultsPage = () => {
     try {
       const response = await axios.post(
         "http://127.0.0.1:8000/rag/generate_PDF/",
-        {},
+        { exam_id: examId },
         { responseType: "blob" }
       );
 